@@ -0,0 +1,151 @@
+"""
+Serveur ASGI du dashboard - Le Bon Mot
+Sert l'app Flask sur la boucle asyncio du bot (uvicorn), sans thread serveur
+dédié : les vues Flask, synchrones, tournent dans un pool de threads borné.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from pubsub import SSE_MAX_STREAMS
+
+logger = logging.getLogger(__name__)
+
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', 16))
+
+
+class WSGIAdapter:
+    """Adaptateur ASGI -> WSGI avec réponses streamées (générateurs Flask)"""
+
+    def __init__(self, wsgi_app, workers=ASGI_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dashboard')
+        # Les flux SSE restent ouverts : pool séparé pour ne pas affamer les pages
+        self.stream_executor = ThreadPoolExecutor(max_workers=SSE_MAX_STREAMS, thread_name_prefix='dashboard-sse')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.stream_executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        environ = self._environ(scope, bytes(body))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: None
+
+        loop = asyncio.get_running_loop()
+        # Un seul contexte pour la requête : stream_with_context pose le contexte
+        # Flask dans un thread du pool et doit le retrouver au close(), dans un autre
+        context = contextvars.copy_context()
+        result = await loop.run_in_executor(self.executor, context.run, self.wsgi_app, environ, start_response)
+        chunks = iter(result)
+        executor = self.executor
+        if (b'content-type', b'text/event-stream') in ((k, v.split(b';')[0]) for k, v in started['headers']):
+            executor = self.stream_executor
+        # uvicorn ignore les envois après déconnexion : il faut la guetter, sinon
+        # un flux SSE ou un export abandonné continue jusqu'au bout pour rien
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while not disconnected.done():
+                # Un chunk à la fois : les réponses streamées (SSE, exports) ne sont pas bufferisées
+                chunk = await loop.run_in_executor(executor, context.run, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            close = getattr(result, 'close', None)
+            if close:
+                await loop.run_in_executor(executor, context.run, close)
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                if key in environ:
+                    # En-têtes répétés : une seule valeur (RFC 9110) ; Cookie se joint par "; " (RFC 6265)
+                    value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+                environ[key] = value
+        return environ
+
+
+def create_server(wsgi_app, host='0.0.0.0', port=8081):
+    """Serveur uvicorn à lancer sur la boucle courante : await server.serve()"""
+    import uvicorn
+
+    class EmbeddedServer(uvicorn.Server):
+        # Les signaux (Ctrl+C) restent gérés par main.py, comme en mode thread
+        def capture_signals(self):
+            return contextlib.nullcontext()
+
+    config = uvicorn.Config(
+        WSGIAdapter(wsgi_app),
+        host=host,
+        port=port,
+        loop='none',
+        lifespan='on',
+        log_level='warning',
+        access_log=False,
+    )
+    return EmbeddedServer(config)
@@ -0,0 +1,63 @@
+"""
+Benchmark - coût CPU de handle_callback par clic
+Rejoue le parcours de menus complet pour des utilisateurs synthétiques.
+
+    python benchmarks/bench_callbacks.py --rounds 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+import bot_simple  # noqa: E402
+from fakes import make_update  # noqa: E402
+from journal import get_journal  # noqa: E402
+from state_store import ConversationStateStore  # noqa: E402
+
+# Parcours type : menu -> catégorie -> service, retours, support
+CLICKS = (
+    'new_quote', 'category:avis', 'service:google',
+    'new_quote', 'category:forum',
+    'new_quote', 'category:suppression',
+    'back_to_start', 'contact_support', 'back_to_start',
+)
+
+
+async def run(rounds):
+    timings = {}
+    for i in range(rounds):
+        for data in CLICKS:
+            update = make_update(i % 100, callback_data=data)
+            start = time.process_time_ns()
+            await bot_simple.handle_callback(update, None)
+            timings.setdefault(data, []).append(time.process_time_ns() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'callbacks.db'))
+        bot_simple.init_simple_db()
+        # Mesure du handler seul : l'état reste en mémoire
+        bot_simple.user_conversations = ConversationStateStore(persist=False)
+        timings = asyncio.run(run(args.rounds))
+        get_journal().stop()
+        storage.get_storage().close()
+
+    total = sum(sum(t) for t in timings.values()) / sum(len(t) for t in timings.values())
+    for data, values in timings.items():
+        print(f"{data:<22} {sum(values) / len(values) / 1000:8.1f} µs CPU/clic")
+    print(f"{'moyenne':<22} {total / 1000:8.1f} µs CPU/clic")
+
+
+if __name__ == '__main__':
+    main()
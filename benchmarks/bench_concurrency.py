@@ -0,0 +1,106 @@
+"""
+Test de charge - traitement concurrent des updates avec ordre par client
+Compare le traitement séquentiel (défaut de python-telegram-bot) au
+PerUserUpdateProcessor, et vérifie que l'ordre de chaque client est respecté
+et qu'une rafale d'un client ne fait pas attendre les autres.
+
+    python benchmarks/bench_concurrency.py --users 200 --updates 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+
+
+async def run(processor, updates, max_delay):
+    """Rejoue les updates comme Application : une tâche par update, dans l'ordre"""
+    seen = defaultdict(list)
+    in_flight = defaultdict(int)
+    overlaps = 0
+
+    async def handler(update):
+        nonlocal overlaps
+        user_id = update.effective_user.id
+        in_flight[user_id] += 1
+        overlaps += in_flight[user_id] > 1
+        # Handler lent (requête SQL, edit_message_text...)
+        await asyncio.sleep(update.delay)
+        seen[user_id].append(update.update_id)
+        in_flight[user_id] -= 1
+
+    async with processor:
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(processor.process_update(u, handler(u))) for u in updates]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    ordered = all(ids == sorted(ids) for ids in seen.values())
+    return len(updates) / elapsed, ordered, overlaps
+
+
+def user_update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+
+async def flood(processor, burst, delay):
+    """Attente d'un client seul pendant qu'un autre a burst updates lentes en file"""
+    async with processor:
+        tasks = [asyncio.create_task(processor.process_update(user_update(1), asyncio.sleep(delay)))
+                 for _ in range(burst)]
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await processor.process_update(user_update(2), asyncio.sleep(delay))
+        waited = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+    return waited
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--max-delay', type=float, default=0.01, help='durée max d\'un handler (s)')
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--flood-concurrency', type=int, default=8, help='places pour le test de rafale')
+    parser.add_argument('--flood-delay', type=float, default=0.05, help='durée d\'un handler de la rafale (s)')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    updates = [
+        SimpleNamespace(
+            update_id=i,
+            effective_user=SimpleNamespace(id=random.randrange(args.users)),
+            effective_chat=None,
+            delay=random.uniform(0, args.max_delay),
+        )
+        for i in range(args.updates)
+    ]
+
+    sequential, _, _ = asyncio.run(run(SimpleUpdateProcessor(1), updates, args.max_delay))
+    concurrent, ordered, overlaps = asyncio.run(run(PerUserUpdateProcessor(args.concurrency), updates, args.max_delay))
+
+    print(f"Séquentiel : {sequential:8.0f} updates/s")
+    print(f"Concurrent : {concurrent:8.0f} updates/s   x{concurrent / sequential:.1f}")
+    print(f"Ordre par client respecté : {ordered}   chevauchements : {overlaps}")
+
+    burst = 5 * args.flood_concurrency
+    waited = asyncio.run(flood(PerUserUpdateProcessor(args.flood_concurrency), burst, args.flood_delay))
+    isolated = waited < 3 * args.flood_delay
+    print(f"Rafale de {burst} updates d'un client ({args.flood_concurrency} places) : un autre client "
+          f"attend {waited * 1000:.0f} ms (handler {args.flood_delay * 1000:.0f} ms)   isolé : {isolated}")
+    sys.exit(0 if ordered and overlaps == 0 and isolated else 1)
+
+
+if __name__ == '__main__':
+    main()
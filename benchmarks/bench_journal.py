@@ -0,0 +1,63 @@
+"""
+Benchmark - latence côté handler de save_message
+Synchrone (commit dans le handler) vs journal d'écriture différée
+
+    python benchmarks/bench_journal.py --messages 5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+from journal import MessageJournal  # noqa: E402
+
+
+def measure(save, messages, users):
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        save(i % users, f"message {i}")
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--flush-interval', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'journal.db'))
+        init_simple_db()
+
+        sync_p50, sync_p99 = measure(storage.save_message, args.messages, args.users)
+
+        journal = MessageJournal(args.flush_interval, args.batch_size).start()
+        journal_p50, journal_p99 = measure(journal.save_message, args.messages, args.users)
+        peak_depth = journal.depth()
+        start = time.perf_counter()
+        journal.stop()
+        drain = time.perf_counter() - start
+
+        with storage.get_storage().read() as conn:
+            written = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        storage.get_storage().close()
+
+    print(f"Synchrone : p50 {sync_p50:8.1f} µs   p99 {sync_p99:8.1f} µs")
+    print(f"Journal   : p50 {journal_p50:8.1f} µs   p99 {journal_p99:8.1f} µs")
+    print(f"File en fin de rafale : {peak_depth}  (vidée en {drain * 1000:.0f} ms)")
+    print(f"Messages en base : {written} / {args.messages * 2}")
+
+
+if __name__ == '__main__':
+    main()
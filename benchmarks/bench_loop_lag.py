@@ -0,0 +1,112 @@
+"""
+Benchmark - retard de la boucle asyncio sous une rafale de clients simultanés
+Lectures SQLite exécutées sur la boucle (avant) vs sur le thread de
+l'exécuteur base de données (après), pour --users clients qui font tous
+le parcours complet en même temps : /start, mes commandes, devis en 3 étapes.
+
+    python benchmarks/bench_loop_lag.py --users 1000 --messages 200000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+import bot_simple  # noqa: E402
+import db_executor  # noqa: E402
+from fakes import make_update  # noqa: E402
+from journal import get_journal  # noqa: E402
+from state_store import ConversationStateStore  # noqa: E402
+from suite import seed  # noqa: E402
+
+SAMPLE_INTERVAL = 0.001
+
+# Parcours de chaque client : (texte, callback_data)
+FLOW = (
+    ('/start', None), (None, 'my_orders'), (None, 'new_quote'), (None, 'category:avis'),
+    (None, 'service:google'), ('12', None), ('non', None), ('non', None), (None, 'my_orders'),
+)
+
+
+class InlineExecutor(db_executor.DatabaseExecutor):
+    """Comportement d'avant : l'appel SQLite s'exécute directement sur la boucle"""
+
+    async def run(self, function, *args):
+        return function(*args)
+
+
+async def client(telegram_id):
+    for text, callback_data in FLOW:
+        update = make_update(telegram_id, text=text, callback_data=callback_data)
+        if text == '/start':
+            await bot_simple.start(update, None)
+        elif callback_data:
+            await bot_simple.handle_callback(update, None)
+        else:
+            await bot_simple.handle_message(update, None)
+
+
+async def burst(users):
+    """Lance tous les clients d'un coup en mesurant le retard de réveil de la boucle"""
+    lags = []
+    done = asyncio.Event()
+
+    async def sampler():
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            started = loop.time()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            lags.append(max(0.0, loop.time() - started - SAMPLE_INTERVAL))
+
+    sampling = asyncio.create_task(sampler())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(telegram_id) for telegram_id in users))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampling
+    return elapsed, sorted(lags)
+
+
+def run(label, executor, users):
+    db_executor._db_executor = executor
+    # États froids : chaque client est relu en base
+    bot_simple.user_conversations = ConversationStateStore()
+    elapsed, lags = asyncio.run(burst(users))
+    get_journal().flush()
+    executor.stop()
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(f"{label:<26} retard boucle : moyen {statistics.mean(lags) * 1000:7.2f} ms   "
+          f"p99 {p99 * 1000:7.2f} ms   max {lags[-1] * 1000:7.1f} ms ({len(lags)} mesures)   "
+          f"{len(users) * len(FLOW) / elapsed:7.0f} updates/s")
+    return lags[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=200_000, help='taille de la base générée')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"🌱 Génération d'une base de {args.messages:,} messages...")
+        storage.configure(os.path.join(tmp, 'lag.db'))
+        conversations = seed(args.messages)
+        # Clients existants (avec commandes), différents pour chaque mesure
+        first = 1_000_000 + 1
+        clients = min(args.users, max(1, conversations // 4))
+        inline = run("sur la boucle (avant)", InlineExecutor(), range(first, first + clients))
+        threaded = run("thread dédié (après)", db_executor.DatabaseExecutor(),
+                       range(first + clients, first + 2 * clients))
+        get_journal().stop()
+        storage.get_storage().close()
+    print(f"Retard maximal divisé par {inline / threaded:.1f}" if threaded else "Aucun retard mesuré")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark mémoire - état des conversations pour N utilisateurs synthétiques
+Ancien dict global user_conversations vs ConversationStateStore (LRU borné)
+
+    python benchmarks/bench_state_store.py --users 1000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+from journal import get_journal  # noqa: E402
+from state_store import ConversationStateStore  # noqa: E402
+
+
+def simulate(reset, users):
+    """Chaque utilisateur ouvre un devis (comme new_quote) puis donne une quantité"""
+    for telegram_id in range(users):
+        state = reset(telegram_id)
+        state['quantity'] = str(telegram_id % 50)
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {current / 2**20:9.1f} Mo retenus   pic {peak / 2**20:9.1f} Mo   {elapsed:6.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--capacity', type=int, default=10_000)
+    parser.add_argument('--no-persist', action='store_true', help='mesure le cache seul, sans écriture SQLite')
+    args = parser.parse_args()
+
+    legacy = {}
+
+    def legacy_reset(telegram_id):
+        legacy[telegram_id] = {'step': 'main_choice', 'username': f'user{telegram_id}', 'first_name': 'Client'}
+        return legacy[telegram_id]
+
+    measure("dict global (avant)", lambda: simulate(legacy_reset, args.users))
+    del legacy
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'states.db'))
+        init_simple_db()
+        store = ConversationStateStore(capacity=args.capacity, persist=not args.no_persist)
+
+        def store_reset(telegram_id):
+            return store.reset(telegram_id, 'main_choice', username=f'user{telegram_id}', first_name='Client')
+
+        def run():
+            simulate(store_reset, args.users)
+            get_journal().flush()
+
+        measure(f"store LRU {args.capacity} (après)", run)
+        print(f"Entrées en cache : {len(store)}")
+
+        if not args.no_persist:
+            # Reprise après redémarrage : nouveau cache vide, état relu en base
+            restarted = ConversationStateStore(capacity=args.capacity)
+            print(f"Reprise utilisateur 0 : étape {asyncio.run(restarted.get(0)).step!r}")
+        get_journal().stop()
+        storage.get_storage().close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark - débit de save_message (messages/s)
+Avant : une connexion sqlite3 ouverte/fermée par message
+Après : pool partagé de storage.py (WAL, connexions longues)
+
+    python benchmarks/bench_storage.py --messages 5000 --users 200
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+
+
+def legacy_save_message(path, telegram_id, message, sender='client'):
+    """Ancienne implémentation : connect/commit/close à chaque appel"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM conversations WHERE telegram_id = ? ORDER BY created_at DESC LIMIT 1', (telegram_id,))
+    result = cursor.fetchone()
+    if result:
+        conversation_id = result[0]
+    else:
+        cursor.execute('INSERT INTO conversations (telegram_id) VALUES (?)', (telegram_id,))
+        conversation_id = cursor.lastrowid
+    cursor.execute('''
+        INSERT INTO messages (conversation_id, telegram_id, message, sender)
+        VALUES (?, ?, ?, ?)
+    ''', (conversation_id, telegram_id, message, sender))
+    conn.commit()
+    conn.close()
+
+
+def legacy_read(path):
+    conn = sqlite3.connect(path)
+    conn.execute('SELECT COUNT(*) FROM messages').fetchone()
+    conn.close()
+
+
+def run(save, read, messages, users, readers):
+    """Écritures côté bot + lectures concurrentes côté dashboard"""
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                read()
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+
+    start = time.perf_counter()
+    for i in range(messages):
+        try:
+            save(i % users, f"message {i}")
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    for t in threads:
+        t.join()
+    return messages / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=2, help='threads de lecture concurrents (dashboard)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.db')
+        storage.configure(before_path)
+        init_simple_db()
+        storage.get_storage().close()
+        # La base "avant" reste en mode rollback journal, comme en production
+        conn = sqlite3.connect(before_path)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+        before, before_errors = run(
+            lambda tid, msg: legacy_save_message(before_path, tid, msg),
+            lambda: legacy_read(before_path),
+            args.messages, args.users, args.readers,
+        )
+
+        storage.configure(os.path.join(tmp, 'after.db'))
+        init_simple_db()
+
+        def pooled_read():
+            with storage.get_storage().read() as conn:
+                conn.execute('SELECT COUNT(*) FROM messages').fetchone()
+
+        after, after_errors = run(storage.save_message, pooled_read, args.messages, args.users, args.readers)
+        storage.get_storage().close()
+
+    print(f"Avant : {before:10.0f} msg/s  ({before_errors} erreurs 'database is locked')")
+    print(f"Après : {after:10.0f} msg/s  ({after_errors} erreurs 'database is locked')")
+    print(f"Gain  : x{after / before:.1f}")
+
+
+if __name__ == '__main__':
+    main()
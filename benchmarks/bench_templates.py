@@ -0,0 +1,71 @@
+"""
+Micro-benchmark - requêtes/s sur / et /conversation/<id>
+render_template_string (compilation à chaque requête) vs templates précompilés
+
+    python benchmarks/bench_templates.py --requests 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import render_template_string  # noqa: E402
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+import dashboard_simple  # noqa: E402
+
+
+def seed(conversations, messages_per_conversation):
+    with storage.get_storage().write() as conn:
+        for telegram_id in range(conversations):
+            storage.record_order(conn, telegram_id, f'user{telegram_id}', 'Client', 'google', '10',
+                                 'https://maps.google.com/x', 'Aucun', '180 EUR')
+            for i in range(messages_per_conversation):
+                storage.record_message(conn, telegram_id, f"Bonjour, message {i}", 'client')
+
+
+def rps(client, url, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        assert client.get(url).status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=50, help='messages par conversation')
+    args = parser.parse_args()
+
+    urls = ('/?view=conversations', '/conversation/1')
+    compiled_render = dashboard_simple.render
+
+    def string_render(template_name, **context):
+        return render_template_string(dashboard_simple.TEMPLATES[template_name], **context)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'templates.db'))
+        init_simple_db()
+        seed(args.conversations, args.messages)
+
+        client = dashboard_simple.app.test_client()
+        with client.session_transaction() as session:
+            session['logged_in'] = True
+
+        for url in urls:
+            dashboard_simple.render = string_render
+            before = rps(client, url, args.requests)
+            dashboard_simple.render = compiled_render
+            after = rps(client, url, args.requests)
+            print(f"{url:<22} avant {before:8.0f} req/s   après {after:8.0f} req/s   x{after / before:.1f}")
+
+        storage.get_storage().close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark - débit des updates réparties entre processus workers
+Le superviseur (supervisor.py) reçoit de vraies updates Telegram et les
+répartit par telegram_id entre 1..--workers processus, qui exécutent les
+handlers de bot_simple (faux objets Telegram, aucun appel réseau). --cpu-ms
+simule le travail CPU d'une update (rendu, markdown) qui occupe la boucle.
+
+    python benchmarks/bench_workers.py --users 2000 --cpu-ms 1 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+
+import storage  # noqa: E402
+import bot_simple  # noqa: E402
+from bench_loop_lag import FLOW  # noqa: E402
+from db_executor import get_db_executor  # noqa: E402
+from fakes import make_update  # noqa: E402
+from journal import get_journal  # noqa: E402
+from pubsub import broker  # noqa: E402
+from suite import seed  # noqa: E402
+from supervisor import Supervisor, WorkerLink  # noqa: E402
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+
+
+def telegram_update(update_id, telegram_id, text=None, callback_data=None):
+    """Update Telegram réelle (celle que reçoit le superviseur)"""
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'Client'}
+    if callback_data is not None:
+        data = {'callback_query': {'id': str(update_id), 'from': user, 'chat_instance': '1', 'data': callback_data}}
+    else:
+        data = {'message': {'message_id': update_id, 'date': 0, 'text': text, 'from': user,
+                            'chat': {'id': telegram_id, 'type': 'private'}}}
+    return Update.de_json(dict(data, update_id=update_id), None)
+
+
+def bench_worker(index, token, conn):
+    """Worker du benchmark : mêmes handlers, réception et signalement que run_worker"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_bench_serve(index, WorkerLink(conn)))
+
+
+async def _bench_serve(index, link):
+    cpu = float(os.environ.get('BENCH_CPU_MS', 0)) / 1000
+    get_journal().start()
+    processor = PerUserUpdateProcessor()
+    tasks = set()
+    processed = 0
+
+    async def handle(data):
+        nonlocal processed
+        message, query = data.get('message'), data.get('callback_query')
+        telegram_id = (message or query)['from']['id']
+        if message:
+            update = make_update(telegram_id, text=message['text'])
+            handler = bot_simple.start if message['text'] == '/start' else bot_simple.handle_message
+        else:
+            update = make_update(telegram_id, callback_data=query['data'])
+            handler = bot_simple.handle_callback
+        deadline = time.perf_counter() + cpu
+        while time.perf_counter() < deadline:
+            pass
+        await processor.process_update(update, handler(update, None))
+        processed += 1
+        link.ack(data['update_id'])
+
+    def feed(data):
+        task = asyncio.create_task(handle(data))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await link.serve(feed, lambda: len(tasks))
+    await asyncio.gather(*tasks)
+    # Relayé au superviseur par le même chemin que les événements SSE
+    broker.publish('bench', 'done', {'worker': index, 'processed': processed, 'at': time.time()})
+    get_db_executor().stop()
+    get_journal().stop()
+
+
+async def measure(workers, updates):
+    supervisor = Supervisor('bench', workers, target=bench_worker).start()
+    await supervisor.wait_ready()
+    subscription = broker.subscribe('bench')
+    started = time.time()
+    for update in updates:
+        await supervisor.dispatch(update, None)
+    await supervisor.stop()
+    done = [subscription.get(timeout=5) for _ in range(workers)]
+    broker.unsubscribe(subscription)
+    if None in done:
+        raise RuntimeError("Worker sans compte rendu")
+    processed = sum(data['processed'] for _, data in done)
+    if processed != len(updates):
+        raise RuntimeError(f"{processed} updates traitées sur {len(updates)}")
+    return len(updates) / (max(data['at'] for _, data in done) - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='nombre maximal de workers')
+    parser.add_argument('--cpu-ms', type=float, default=1.0, help='travail CPU simulé par update')
+    parser.add_argument('--messages', type=int, default=100_000, help='taille de la base générée')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'workers.db')
+        print(f"🌱 Génération d'une base de {args.messages:,} messages...")
+        storage.configure(path)
+        seed(args.messages)
+        storage.get_storage().close()
+        # Hérités par les workers (contexte spawn)
+        os.environ.update(DB_PATH=path, STORAGE_BACKEND='sqlite', BENCH_CPU_MS=str(args.cpu_ms))
+
+        print(f"{os.cpu_count()} cœur(s), {args.users} clients x {len(FLOW)} updates, {args.cpu_ms:g} ms CPU par update")
+        baseline = None
+        for workers in range(1, args.workers + 1):
+            # Nouveaux clients à chaque mesure : états relus en base
+            first = 2_000_000 + workers * args.users
+            updates = [telegram_update(i, telegram_id, text, callback_data)
+                       for i, (telegram_id, (text, callback_data)) in enumerate(
+                           (telegram_id, step) for step in FLOW
+                           for telegram_id in range(first, first + args.users))]
+            rate = asyncio.run(measure(workers, updates))
+            baseline = baseline or rate
+            print(f"{workers:>2} worker(s) : {rate:8.0f} updates/s   x{rate / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
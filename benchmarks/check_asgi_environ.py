@@ -0,0 +1,93 @@
+"""
+Vérifie la traduction scope ASGI -> environ WSGI de l'adaptateur (asgi.py)
+En-têtes répétés, cookies, chemin et query string UTF-8, Content-Type/Length,
+puis une requête complète à travers l'adaptateur vers une app Flask.
+
+    python benchmarks/check_asgi_environ.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify, request  # noqa: E402
+
+from asgi import WSGIAdapter  # noqa: E402
+
+
+def scope(path='/', query=b'', headers=()):
+    return {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'root_path': '',
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'server': ('127.0.0.1', 8081), 'client': ('127.0.0.1', 5000), 'http_version': '1.1', 'scheme': 'http',
+    }
+
+
+# Cas : (scope, clé environ, valeur attendue)
+CASES = {
+    'cookies répétés joints par "; "': (
+        scope(headers=[('cookie', 'a=1'), ('cookie', 'b=2')]), 'HTTP_COOKIE', 'a=1; b=2'),
+    'en-têtes répétés joints par ","': (
+        scope(headers=[('accept', 'text/html'), ('accept', 'application/json')]),
+        'HTTP_ACCEPT', 'text/html,application/json'),
+    'tirets -> soulignés': (
+        scope(headers=[('x-forwarded-for', '10.0.0.1')]), 'HTTP_X_FORWARDED_FOR', '10.0.0.1'),
+    'Content-Type sans préfixe HTTP_': (
+        scope(headers=[('content-type', 'application/json')]), 'CONTENT_TYPE', 'application/json'),
+    'Content-Length du corps reçu': (
+        scope(headers=[('content-length', '999')]), 'CONTENT_LENGTH', '0'),
+    'chemin UTF-8 en latin-1 (PEP 3333)': (
+        scope(path='/recherche/élan'), 'PATH_INFO', '/recherche/élan'.encode('utf-8').decode('latin-1')),
+    'query string brute': (
+        scope(query=b'q=%C3%A9&page=2'), 'QUERY_STRING', 'q=%C3%A9&page=2'),
+}
+
+
+async def through_adapter():
+    """Cookies et query string relus par Flask après passage dans l'adaptateur"""
+    app = Flask(__name__)
+
+    @app.route('/echo')
+    def echo():
+        return jsonify(cookies=request.cookies, q=request.args.get('q'))
+
+    messages = []
+    bodies = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if bodies:
+            return bodies.pop()
+        # Client toujours connecté
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    request_scope = scope('/echo', b'q=%C3%A9', [('cookie', 'session=abc'), ('cookie', 'theme=dark')])
+    await WSGIAdapter(app, workers=1)(request_scope, receive, send)
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return body.decode()
+
+
+def main():
+    failures = 0
+    for name, (request_scope, key, expected) in CASES.items():
+        value = WSGIAdapter._environ(request_scope, b'').get(key)
+        ok = value == expected
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {name}" + ('' if ok else f" : {value!r} au lieu de {expected!r}"))
+
+    body = asyncio.run(through_adapter())
+    ok = json.loads(body) == {'cookies': {'session': 'abc', 'theme': 'dark'}, 'q': 'é'}
+    failures += not ok
+    print(f"{'✅' if ok else '❌'} requête Flask complète : {body.strip()}")
+
+    if failures:
+        print(f"\n{failures} traduction(s) incorrecte(s)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
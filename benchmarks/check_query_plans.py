@@ -0,0 +1,72 @@
+"""
+Vérifie les plans d'exécution (EXPLAIN QUERY PLAN) des requêtes chaudes
+Échoue si une requête parcourt une table entière ou trie via un B-tree temporaire.
+
+    python benchmarks/check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+
+# Requête nommée -> paramètres d'exemple
+CHECKED = {
+    'latest_conversation': (1,),
+    'recent_orders': (1, 5),
+    'get_conversation': (1,),
+    'conversation_telegram_id': (1,),
+    'conversation_messages': (1, 100),
+    'conversation_messages_before': (1, 500, 100),
+    'messages_after': (1, 100, 500),
+    'get_archived_conversation': (1,),
+    'archived_messages': (1, 100),
+    'archived_messages_before': (1, 500, 100),
+    'latest_archived_conversation': (1,),
+    'conversations_page': (50,),
+    'conversations_page_after': ('2024-01-01 00:00:00', 1, 50),
+    'orders_page': (50,),
+    'orders_page_after': ('2024-01-01 00:00:00', 1, 50),
+}
+EXPORT_PARAMS = {'since': '2024-01-01', 'until': '2024-02-01', 'service_type': None, 'status': None,
+                 'orders_only': 0, 'after_at': '2024-01-01', 'after_id': 0, 'limit': 1000}
+for _name in ('export_conversations', 'export_archived_conversations', 'export_messages', 'export_archived_messages'):
+    CHECKED[_name] = EXPORT_PARAMS
+
+
+def plan(conn, sql, params):
+    return [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def is_full_scan(detail):
+    """'SCAN t' sans index (ou 'USE TEMP B-TREE') = coût proportionnel à la table"""
+    if detail.startswith('USE TEMP B-TREE'):
+        return True
+    return detail.startswith('SCAN') and 'USING' not in detail
+
+
+def main():
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'plans.db'))
+        init_simple_db()
+        with storage.get_storage().read() as conn:
+            for name, params in CHECKED.items():
+                details = plan(conn, storage.STATEMENTS[name], params)
+                bad = [d for d in details if is_full_scan(d)]
+                failures += bool(bad)
+                print(f"{'❌' if bad else '✅'} {name}")
+                for detail in details:
+                    print(f"     {detail}")
+        storage.get_storage().close()
+
+    if failures:
+        print(f"\n{failures} requête(s) sans index adapté")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
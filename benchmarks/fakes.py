@@ -0,0 +1,62 @@
+"""
+Faux objets Telegram pour les benchmarks (aucun appel réseau)
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+
+class FakeBot:
+    """Bot qui enregistre les envois ; latency simule l'aller-retour HTTP"""
+
+    def __init__(self, latency=0.0, failures=None):
+        self.latency = latency
+        # failures : fonction (chat_id, tentative) -> exception à lever ou None
+        self.failures = failures
+        self.sent = []
+        self._attempts = {}
+
+    async def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        attempt = self._attempts.get(chat_id, 0) + 1
+        self._attempts[chat_id] = attempt
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        error = self.failures(chat_id, attempt) if self.failures else None
+        if error:
+            raise error
+        self.sent.append((time.monotonic(), chat_id, text))
+        return SimpleNamespace(chat_id=chat_id, text=text)
+
+
+class FakeMessage:
+    def __init__(self, text=None, bot=None):
+        self.text = text
+        self.bot = bot
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None):
+        self.replies.append(text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.edits.append(text)
+
+
+def make_update(telegram_id, text=None, callback_data=None, first_name='Client', username=None):
+    """Update minimal accepté par start, handle_callback et handle_message"""
+    user = SimpleNamespace(id=telegram_id, first_name=first_name, username=username)
+    return SimpleNamespace(
+        update_id=0,
+        effective_user=user,
+        effective_chat=SimpleNamespace(id=telegram_id),
+        message=FakeMessage(text) if callback_data is None else None,
+        callback_query=FakeCallbackQuery(callback_data) if callback_data is not None else None,
+    )
@@ -0,0 +1,122 @@
+"""
+Test de charge du dashboard : serveur Flask threadé vs ASGI (uvicorn)
+
+    python benchmarks/load_dashboard.py --clients 32 --requests 200
+"""
+import argparse
+import asyncio
+import http.client
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+import dashboard_simple  # noqa: E402
+from asgi import create_server  # noqa: E402
+
+
+def seed(conversations):
+    with storage.get_storage().write() as conn:
+        for telegram_id in range(conversations):
+            storage.record_order(conn, telegram_id, f'user{telegram_id}', 'Client', 'google', '10',
+                                 'Aucun', 'Aucun', '180 EUR')
+            for i in range(10):
+                storage.record_message(conn, telegram_id, f"message {i}", 'client')
+
+
+def start_thread_server(port):
+    server = make_server('127.0.0.1', port, dashboard_simple.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_asgi_server(port):
+    server = create_server(dashboard_simple.app, host='127.0.0.1', port=port)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        time.sleep(0.2)
+    return stop
+
+
+def login_cookie(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    body = urllib.parse.urlencode({'password': os.getenv('ADMIN_PASSWORD', 'admin123')})
+    conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+
+def load(port, paths, clients, requests):
+    cookie = login_cookie(port)
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        mine = []
+        for i in range(requests):
+            path = paths[(index + i) % len(paths)]
+            start = time.perf_counter()
+            conn.request('GET', path, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            mine.append(time.perf_counter() - start)
+            assert response.status == 200, (path, response.status)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200, help='requêtes par client')
+    parser.add_argument('--port', type=int, default=18081)
+    args = parser.parse_args()
+
+    paths = ['/', '/?view=orders', '/?view=conversations'] + [f'/conversation/{i}' for i in range(1, 20)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'load.db'))
+        init_simple_db()
+        seed(200)
+
+        for mode, start in (('thread', start_thread_server), ('asgi', start_asgi_server)):
+            port = args.port + (mode == 'asgi')
+            stop = start(port)
+            # Le cache de réponses fausserait la comparaison des serveurs
+            dashboard_simple.response_cache.clear()
+            rps, p50, p99 = load(port, paths, args.clients, args.requests)
+            stop()
+            print(f"{mode:<7} {rps:8.0f} req/s   p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms")
+
+        storage.get_storage().close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Banc d'essai de la file d'envoi contre un faux Bot
+Vérifie les limites de débit (global / par chat), les relances, les statuts
+et qu'un chat très sollicité ne retarde pas les réponses aux autres chats.
+
+    python benchmarks/outbound_harness.py --chats 50 --messages 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import NetworkError, RetryAfter, TimedOut  # noqa: E402
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+from fakes import FakeBot  # noqa: E402
+from journal import get_journal  # noqa: E402
+from outbound import OutboundQueue  # noqa: E402
+
+
+def max_in_window(times, window):
+    """Nombre maximal d'envois dans une fenêtre glissante de window secondes"""
+    best, start = 0, 0
+    for end in range(len(times)):
+        while times[end] - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args):
+    random.seed(args.seed)
+
+    def failures(chat_id, attempt):
+        roll = random.random()
+        if roll < args.flood_rate:
+            return RetryAfter(1)
+        if roll < args.flood_rate + args.error_rate:
+            return NetworkError("connexion perdue")
+        if roll < args.flood_rate + args.error_rate + args.timeout_rate:
+            return TimedOut()
+        return None
+
+    bot = FakeBot(latency=0.02, failures=failures)
+    queue = OutboundQueue(bot, global_rate=args.global_rate, chat_rate=args.chat_rate, backoff=0.1).start()
+
+    conversations = {}
+    for i in range(args.messages):
+        chat_id = i % args.chats
+        if chat_id not in conversations:
+            conversations[chat_id] = storage.save_message(chat_id, "bonjour")
+        _, message_id = storage.add_admin_message(conversations[chat_id], f"réponse {i}")
+        queue.submit(chat_id, f"réponse {i}", message_id)
+
+    await asyncio.sleep(0)
+    print(f"File initiale : {queue.depth()} messages")
+    await queue.stop()
+    get_journal().flush()
+
+    times = sorted(t for t, _, _ in bot.sent)
+    per_chat = defaultdict(list)
+    order_ok = True
+    for t, chat_id, text in bot.sent:
+        per_chat[chat_id].append(t)
+    for chat_id in per_chat:
+        numbers = [int(text.split()[-1]) for _, c, text in bot.sent if c == chat_id]
+        order_ok &= numbers == sorted(numbers)
+    # TimedOut n'est pas relancé : chaque réponse part au plus une fois
+    texts = [text for _, _, text in bot.sent]
+    unique = len(texts) == len(set(texts))
+
+    global_peak = max_in_window(times, 1.0)
+    chat_peak = max(max_in_window(sorted(ts), 1.0) for ts in per_chat.values())
+    with storage.get_storage().read() as conn:
+        statuses = dict(conn.execute(
+            "SELECT delivery_status, COUNT(*) FROM messages WHERE sender = 'admin' GROUP BY delivery_status"
+        ).fetchall())
+
+    print(f"Métriques : {queue.stats()}")
+    print(f"Pic global : {global_peak} envois/s (limite {args.global_rate:.0f})")
+    print(f"Pic par chat : {chat_peak} envois/s (limite {args.chat_rate:.0f} + rafale initiale)")
+    print(f"Ordre par chat conservé : {order_ok}")
+    print(f"Aucun doublon : {unique}")
+    print(f"Statuts en base : {statuses}")
+
+    ok = (order_ok and unique and statuses.get('pending', 0) == 0
+          and global_peak <= args.global_rate + 1 and chat_peak <= 2 * args.chat_rate)
+    return ok
+
+
+async def hot_chat(args):
+    """Réponse à un chat pendant qu'un autre a plus de messages en file que de workers"""
+    bot = FakeBot(latency=0.02)
+    queue = OutboundQueue(bot, global_rate=args.global_rate, chat_rate=args.chat_rate).start()
+    for i in range(2 * queue.workers):
+        queue.submit(1, f"rafale {i}")
+    await asyncio.sleep(0)
+    started = asyncio.get_running_loop().time()
+    queue.submit(2, "autre chat")
+    while not any(chat_id == 2 for _, chat_id, _ in bot.sent):
+        await asyncio.sleep(0.01)
+    waited = asyncio.get_running_loop().time() - started
+    await queue.stop()
+    print(f"Chat seul derrière une rafale de {2 * queue.workers} messages : servi en {waited * 1000:.0f} ms")
+    return waited < 1 / args.chat_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--global-rate', type=float, default=30)
+    parser.add_argument('--chat-rate', type=float, default=1)
+    parser.add_argument('--flood-rate', type=float, default=0.05, help='proportion de RetryAfter simulés')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='proportion d\'erreurs réseau simulées')
+    parser.add_argument('--timeout-rate', type=float, default=0.02, help='proportion de TimedOut simulés')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'outbound.db'))
+        init_simple_db()
+        ok = asyncio.run(run(args))
+        ok &= asyncio.run(hot_chat(args))
+        get_journal().stop()
+        storage.get_storage().close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
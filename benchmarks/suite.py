@@ -0,0 +1,342 @@
+"""
+Suite de charge synthétique - handlers du bot et routes du dashboard
+Sur des bases générées de 10k, 1M et 10M messages : p50/p99 et débit par
+handler et par route, résultats en JSON, échec si régression > seuil.
+
+    python benchmarks/suite.py --sizes 10k,1m --output results.json
+    python benchmarks/suite.py --sizes 10k --baseline results.json --threshold 0.25
+
+Les bases générées sont gardées dans --data-dir pour les exécutions suivantes.
+Avec STORAGE_BACKEND=postgres (serveur de DATABASE_URL), la base de référence
+lebonmot_suite_<taille>_seed est clonée à chaque exécution :
+
+    STORAGE_BACKEND=postgres DATABASE_URL=postgresql://localhost/lebonmot python benchmarks/suite.py
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+import bot_simple  # noqa: E402
+import dashboard_simple  # noqa: E402
+from fakes import make_update  # noqa: E402
+from journal import get_journal  # noqa: E402
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+MESSAGES_PER_CONVERSATION = 20
+WARMUP = 20
+SERVICES = [service for service, info in bot_simple.PRICING.items() if info['price'] != 'Sur devis']
+
+
+# --- Génération des bases -----------------------------------------------------
+
+def seed(messages, seed_value=42):
+    """Remplit la base configurée (neuve) : conversations de 20 messages, 1 sur 3 est une commande"""
+    random.seed(seed_value)
+    bot_simple.init_simple_db()
+    db = storage.get_storage()
+    marker = '?' if db.paramstyle == 'qmark' else '%s'
+
+    def insert(table, columns):
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([marker] * len(columns))})"
+    conversations = max(1, messages // MESSAGES_PER_CONVERSATION)
+    base = datetime(2024, 1, 1)
+    chunk = 50_000
+
+    with db.write() as conn:
+        cursor = conn.cursor()
+        for first in range(1, conversations + 1, chunk):
+            conv_rows, message_rows = [], []
+            for conv_id in range(first, min(first + chunk, conversations + 1)):
+                telegram_id = 1_000_000 + conv_id // 2
+                created = base + timedelta(seconds=conv_id * 30)
+                last = created + timedelta(seconds=MESSAGES_PER_CONVERSATION)
+                is_order = conv_id % 3 == 0
+                service = random.choice(SERVICES) if is_order else None
+                conv_rows.append((
+                    conv_id, telegram_id, f'user{telegram_id}', 'Client', service,
+                    '10' if is_order else None, 'Aucun' if is_order else None,
+                    'Aucun détail supplémentaire' if is_order else None, '180 EUR' if is_order else None,
+                    f'{created:%Y-%m-%d %H:%M:%S}', MESSAGES_PER_CONVERSATION,
+                    f'message {MESSAGES_PER_CONVERSATION - 1}', f'{last:%Y-%m-%d %H:%M:%S}', 'client',
+                ))
+                for i in range(MESSAGES_PER_CONVERSATION):
+                    message_rows.append((
+                        conv_id, telegram_id, f'message {i}', 'admin' if i % 4 == 3 else 'client',
+                        f'{created + timedelta(seconds=i + 1):%Y-%m-%d %H:%M:%S}',
+                    ))
+            cursor.executemany(insert('conversations', (
+                'id', 'telegram_id', 'username', 'first_name', 'service_type', 'quantity', 'link', 'details',
+                'estimated_price', 'created_at', 'message_count', 'last_message_preview', 'last_message_at',
+                'last_sender')), conv_rows)
+            cursor.executemany(insert('messages', (
+                'conversation_id', 'telegram_id', 'message', 'sender', 'created_at')), message_rows)
+        if db.dialect == 'postgres':
+            # id explicites : les séquences repartent après le plus grand id
+            for table in ('conversations', 'messages'):
+                conn.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+                conn.execute(f'ANALYZE {table}')
+        storage.rebuild_stats(conn)
+    return conversations
+
+
+def open_database(data_dir, label):
+    """Base de référence générée une fois, copiée à chaque exécution : les écritures
+    des handlers mesurés ne s'accumulent pas d'un run à l'autre"""
+    seeded = os.path.join(data_dir, f'suite_{label}.seed.db')
+    ready = seeded + '.ready'
+    if not os.path.exists(ready):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(seeded + suffix):
+                os.remove(seeded + suffix)
+        print(f"🌱 Génération de la base {label} ({SIZES[label]:,} messages)...")
+        start = time.perf_counter()
+        storage.configure(seeded)
+        conversations = seed(SIZES[label])
+        storage.get_storage().close()
+        with open(ready, 'w') as f:
+            f.write(str(conversations))
+        print(f"   faite en {time.perf_counter() - start:.0f} s")
+
+    # Migrations ajoutées depuis la génération : appliquées une fois sur la référence
+    storage.configure(seeded)
+    bot_simple.init_simple_db()
+    storage.get_storage().close()
+
+    path = os.path.join(data_dir, f'suite_{label}.run.db')
+    for leftover in (path + '-wal', path + '-shm', *glob.glob(os.path.join(data_dir, f'suite_{label}.run.archive.db*'))):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    shutil.copyfile(seeded, path)
+    storage.configure(path)
+    with open(ready) as f:
+        return int(f.read())
+
+
+def postgres_url(dbname):
+    """DATABASE_URL pointant sur une autre base du même serveur"""
+    from psycopg.conninfo import conninfo_to_dict, make_conninfo
+    params = conninfo_to_dict(storage.DATABASE_URL)
+    params['dbname'] = dbname
+    return make_conninfo(**params)
+
+
+def open_postgres_database(data_dir, label):
+    """Même principe sur PostgreSQL : base de référence clonée (CREATE DATABASE ... TEMPLATE)"""
+    import psycopg
+    seeded, run = f'lebonmot_suite_{label}_seed', f'lebonmot_suite_{label}_run'
+    ready = os.path.join(data_dir, f'suite_{label}.postgres.ready')
+    with psycopg.connect(postgres_url('postgres'), autocommit=True) as admin:
+        exists = admin.execute('SELECT 1 FROM pg_database WHERE datname = %s', (seeded,)).fetchone()
+        if not exists or not os.path.exists(ready):
+            admin.execute(f'DROP DATABASE IF EXISTS {seeded}')
+            admin.execute(f'CREATE DATABASE {seeded}')
+            print(f"🌱 Génération de la base PostgreSQL {label} ({SIZES[label]:,} messages)...")
+            start = time.perf_counter()
+            storage.configure_postgres(postgres_url(seeded))
+            conversations = seed(SIZES[label])
+            storage.get_storage().close()
+            with open(ready, 'w') as f:
+                f.write(str(conversations))
+            print(f"   faite en {time.perf_counter() - start:.0f} s")
+
+    storage.configure_postgres(postgres_url(seeded))
+    bot_simple.init_simple_db()
+    storage.get_storage().close()
+
+    with psycopg.connect(postgres_url('postgres'), autocommit=True) as admin:
+        admin.execute(f'DROP DATABASE IF EXISTS {run}')
+        admin.execute(f'CREATE DATABASE {run} TEMPLATE {seeded}')
+    storage.configure_postgres(postgres_url(run))
+    with open(ready) as f:
+        return int(f.read())
+
+
+# --- Mesures ------------------------------------------------------------------
+
+def summarize(durations, elapsed):
+    durations = sorted(durations)
+    return {
+        'count': len(durations),
+        'p50_ms': statistics.median(durations) * 1000,
+        'p99_ms': durations[max(0, int(len(durations) * 0.99) - 1)] * 1000,
+        'throughput': len(durations) / elapsed if elapsed else None,
+    }
+
+
+async def measure_async(iterations, prepare, call):
+    durations = []
+    total = 0.0
+    for i in range(-WARMUP, iterations):
+        args = prepare(i % iterations)
+        start = time.perf_counter()
+        await call(*args)
+        duration = time.perf_counter() - start
+        if i >= 0:
+            durations.append(duration)
+            total += duration
+    return summarize(durations, total)
+
+
+def measure_route(client, iterations, method, url_for, use_cache, data=None):
+    durations = []
+    total = 0.0
+    for i in range(-WARMUP, iterations):
+        if not use_cache:
+            dashboard_simple.response_cache.clear()
+        url = url_for(i % iterations)
+        start = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        duration = time.perf_counter() - start
+        assert response.status_code < 400, (url, response.status_code)
+        if i >= 0:
+            durations.append(duration)
+            total += duration
+    return summarize(durations, total)
+
+
+async def bench_handlers(iterations, conversations):
+    states = bot_simple.user_conversations
+    results = {}
+    users = [1_000_000 + (i * 7919) % max(1, conversations // 2) for i in range(iterations)]
+
+    results['start'] = await measure_async(
+        iterations, lambda i: (make_update(users[i], text='/start'), None), bot_simple.start)
+
+    for route in ('new_quote', 'category:avis', 'category:forum', 'service:google',
+                  'my_orders', 'contact_support', 'back_to_start'):
+        results[f'callback:{route}'] = await measure_async(
+            iterations, lambda i, r=route: (make_update(users[i], callback_data=r), None), bot_simple.handle_callback)
+
+    steps = {
+        'quantity': ('12', {'service_type': 'google'}),
+        'link': ('https://maps.google.com/example', {'service_type': 'google', 'quantity': '12'}),
+        'details': ('non', {'service_type': 'google', 'quantity': '12', 'link': 'Aucun'}),
+        'support_mode': ('Bonjour, une question', {}),
+    }
+    for step, (text, fields) in steps.items():
+        def prepare(i, step=step, text=text, fields=fields):
+            states.reset(users[i], step, **fields)
+            return make_update(users[i], text=text), None
+        results[f'message:{step}'] = await measure_async(iterations, prepare, bot_simple.handle_message)
+
+    get_journal().flush()
+    return results
+
+
+def bench_routes(iterations, conversations, use_cache):
+    client = dashboard_simple.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+
+    def conv_url(i):
+        return f'/conversation/{1 + (i * 7919) % conversations}'
+
+    return {
+        'GET /': measure_route(client, iterations, 'GET', lambda i: '/', use_cache),
+        'GET /?view=orders': measure_route(client, iterations, 'GET', lambda i: '/?view=orders', use_cache),
+        'GET /?view=conversations': measure_route(client, iterations, 'GET', lambda i: '/?view=conversations', use_cache),
+        'GET /conversation/<id>': measure_route(client, iterations, 'GET', conv_url, use_cache),
+        'GET /search (rare)': measure_route(client, iterations, 'GET', lambda i: '/search?q=user1000500', use_cache),
+        'GET /search (fréquent)': measure_route(client, iterations, 'GET', lambda i: '/search?q=message', use_cache),
+        'POST /conversation/<id>/reply': measure_route(
+            client, iterations, 'POST', lambda i: conv_url(i) + '/reply', use_cache, data={'message': 'Réponse'}),
+    }
+
+
+# --- Comparaison --------------------------------------------------------------
+
+def regressions(current, baseline, threshold, min_delta_ms):
+    found = []
+    for label, names in current['sizes'].items():
+        for name, result in names.items():
+            reference = baseline.get('sizes', {}).get(label, {}).get(name)
+            if not reference:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                # Les écarts sous min_delta_ms relèvent du bruit de mesure
+                if result[metric] > reference[metric] * (1 + threshold) + min_delta_ms:
+                    found.append(f"{label} {name} {metric}: {reference[metric]:.2f} -> {result[metric]:.2f} ms")
+    return found
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k', help='tailles parmi 10k,1m,10m (séparées par des virgules)')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, '.bench_data'))
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    parser.add_argument('--baseline', help='résultats JSON de référence')
+    parser.add_argument('--threshold', type=float, default=0.25, help='régression tolérée (0.25 = +25 %%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='écart absolu ignoré (bruit), en ms')
+    parser.add_argument('--with-cache', action='store_true', help='garde le cache de réponses du dashboard')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'backend': storage.STORAGE_BACKEND,
+        'iterations': args.iterations,
+        'sizes': {},
+    }
+
+    for label in args.sizes.split(','):
+        label = label.strip().lower()
+        if label not in SIZES:
+            parser.error(f"taille inconnue : {label}")
+        if storage.STORAGE_BACKEND == 'postgres':
+            conversations = open_postgres_database(args.data_dir, label)
+        else:
+            conversations = open_database(args.data_dir, label)
+        measured = asyncio.run(bench_handlers(args.iterations, conversations))
+        measured.update(bench_routes(args.iterations, conversations, args.with_cache))
+        results['sizes'][label] = measured
+
+        print(f"\n📊 {label} ({SIZES[label]:,} messages)")
+        print(f"{'':<32}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>10}")
+        for name, result in measured.items():
+            print(f"{name:<32}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['throughput']:>10.0f}")
+
+    get_journal().stop()
+    storage.get_storage().close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Résultats écrits dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.threshold, args.min_delta_ms)
+        if found:
+            print(f"\n❌ {len(found)} régression(s) au-delà de {args.threshold:.0%} :")
+            for line in found:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ Aucune régression au-delà de {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
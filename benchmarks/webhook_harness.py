@@ -0,0 +1,129 @@
+"""
+Banc d'essai du mode webhook : POST d'updates synthétiques sur /telegram/webhook
+Mesure le débit d'ingestion et la latence POST -> Application.update_queue.
+
+En polling, chaque update attend en plus l'aller-retour getUpdates vers
+Telegram (--polling-rtt pour l'estimer à côté des mesures).
+
+    python benchmarks/webhook_harness.py --clients 16 --updates 5000
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('WEBHOOK_SECRET', 'harness-secret')
+
+import storage  # noqa: E402
+from bot_simple import init_simple_db  # noqa: E402
+import dashboard_simple  # noqa: E402
+from asgi import create_server  # noqa: E402
+from fakes import FakeBot  # noqa: E402
+
+
+def synthetic_update(update_id, telegram_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': {'id': telegram_id, 'is_bot': False, 'first_name': 'Client'},
+            'text': f"message {update_id}",
+        },
+    }
+
+
+def post_updates(port, first_id, count, sent_at, statuses):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': os.environ['WEBHOOK_SECRET']}
+    for update_id in range(first_id, first_id + count):
+        body = json.dumps(synthetic_update(update_id, update_id % 500))
+        while True:
+            sent_at[update_id] = time.perf_counter()
+            conn.request('POST', '/telegram/webhook', body, headers)
+            response = conn.getresponse()
+            response.read()
+            statuses.append(response.status)
+            if response.status != 503:
+                break
+            # Contre-pression : on réessaie comme Telegram
+            time.sleep(float(response.getheader('Retry-After', 1)) / 10)
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    update_queue = asyncio.Queue()
+    fake_app = SimpleNamespace(bot=FakeBot(), update_queue=update_queue)
+    dashboard_simple.set_bot(fake_app, loop)
+    dashboard_simple.WEBHOOK_MAX_PENDING = args.max_pending
+
+    server = create_server(dashboard_simple.app, host='127.0.0.1', port=args.port)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    sent_at, latencies, statuses = {}, [], []
+
+    async def consume():
+        while len(latencies) < args.updates:
+            update = await update_queue.get()
+            latencies.append(time.perf_counter() - sent_at[update.update_id])
+            if args.handler_delay:
+                await asyncio.sleep(args.handler_delay)
+
+    consumer = asyncio.create_task(consume())
+    per_client = args.updates // args.clients
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=post_updates, args=(args.port, i * per_client, per_client, sent_at, statuses))
+        for i in range(args.clients)
+    ]
+    args.updates = per_client * args.clients
+    for t in threads:
+        t.start()
+    await loop.run_in_executor(None, lambda: [t.join() for t in threads])
+    await consumer
+    elapsed = time.perf_counter() - start
+
+    server.should_exit = True
+    await server_task
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"Webhook : {args.updates / elapsed:8.0f} updates/s   p50 {p50:6.1f} ms   p99 {p99:6.1f} ms   "
+          f"({statuses.count(503)} réponses 503 de contre-pression)")
+    if args.polling_rtt:
+        print(f"Polling (estimation) : latence >= p50 {p50 + args.polling_rtt / 2:6.1f} ms "
+              f"(+ aller-retour getUpdates de {args.polling_rtt:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--port', type=int, default=18090)
+    parser.add_argument('--max-pending', type=int, default=1000)
+    parser.add_argument('--handler-delay', type=float, default=0.0, help='durée simulée du traitement (s)')
+    parser.add_argument('--polling-rtt', type=float, default=0.0, help='aller-retour getUpdates mesuré (ms)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'webhook.db'))
+        init_simple_db()
+        asyncio.run(run(args))
+        storage.get_storage().close()
+
+
+if __name__ == '__main__':
+    main()
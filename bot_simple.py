@@ -6,97 +6,60 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
 import logging
 from datetime import datetime
-import sqlite3
+import atexit
+import time
+import metrics
+import migrations
+import storage
+from db_executor import get_db_executor
+from journal import get_journal
+from state_store import ConversationStateStore
+from update_processor import PerUserUpdateProcessor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Grille tarifaire
+# Grille tarifaire (category/button/question : menus générés automatiquement)
 PRICING = {
-    'google': {'price': 18, 'currency': 'EUR', 'name': 'Avis Google', 'guarantee': '6 mois non-drop + replacement gratuit'},
-    'trustpilot': {'price': 16, 'currency': 'EUR', 'name': 'Trustpilot', 'guarantee': '1 an non-drop'},
-    'forum': {'price': 5, 'currency': 'EUR', 'name': 'Message Forum', 'guarantee': 'Qualité garantie'},
-    'pagesjaunes': {'price': 15, 'currency': 'EUR', 'name': 'Pages Jaunes', 'guarantee': 'Non-drop garanti'},
-    'autre_plateforme': {'price': 15, 'currency': 'EUR', 'name': 'Autre plateforme', 'guarantee': 'Selon plateforme'},
-    'suppression': {'price': 'Sur devis', 'currency': '', 'name': 'Suppression de liens', 'guarantee': 'Travail sur mesure'}
+    'google': {'price': 18, 'currency': 'EUR', 'name': 'Avis Google', 'guarantee': '6 mois non-drop + replacement gratuit',
+               'category': 'avis', 'button': '⭐ Avis Google', 'question': "Combien d'avis souhaitez-vous ?"},
+    'trustpilot': {'price': 16, 'currency': 'EUR', 'name': 'Trustpilot', 'guarantee': '1 an non-drop',
+                   'category': 'avis', 'button': '🌟 Trustpilot', 'question': "Combien d'avis souhaitez-vous ?"},
+    'forum': {'price': 5, 'currency': 'EUR', 'name': 'Message Forum', 'guarantee': 'Qualité garantie',
+              'category': 'forum', 'button': '💬 Messages sur forum', 'question': 'Combien de messages souhaitez-vous ?'},
+    'pagesjaunes': {'price': 15, 'currency': 'EUR', 'name': 'Pages Jaunes', 'guarantee': 'Non-drop garanti',
+                    'category': 'avis', 'button': '📒 Pages Jaunes', 'question': "Combien d'avis souhaitez-vous ?"},
+    'autre_plateforme': {'price': 15, 'currency': 'EUR', 'name': 'Autre plateforme', 'guarantee': 'Selon plateforme',
+                         'category': 'avis', 'button': '🌐 Autre plateforme', 'question': "Combien d'avis souhaitez-vous ?"},
+    'suppression': {'price': 'Sur devis', 'currency': '', 'name': 'Suppression de liens', 'guarantee': 'Travail sur mesure',
+                    'category': 'suppression', 'button': '🗑️ Suppression de liens', 'question': 'Combien de liens à supprimer ?'}
 }
 
-# État des conversations
-user_conversations = {}
+# Catégories du menu "Passer une commande" : une catégorie à un seul service
+# mène directement à la quantité, sinon au choix de la plateforme
+CATEGORIES = {
+    'avis': {'button': '⭐ Avis (Google, Trustpilot, etc.)', 'title': '⭐ **Avis sur quelle plateforme ?**\n\nChoisissez la plateforme :'},
+    'forum': {'button': '💬 Messages sur forum', 'title': 'Messages sur forum'},
+    'suppression': {'button': '🗑️ Suppression de lien (1ère page)', 'title': 'Suppression de liens'},
+}
+
+# État des conversations (cache LRU borné + table conversation_state)
+user_conversations = ConversationStateStore()
 
 def init_simple_db():
-    """Initialise une base de données ultra-simple"""
-    conn = sqlite3.connect('lebonmot_simple.db')
-    cursor = conn.cursor()
-    
-    # Table des conversations
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER NOT NULL,
-            username TEXT,
-            first_name TEXT,
-            service_type TEXT,
-            quantity TEXT,
-            link TEXT,
-            details TEXT,
-            estimated_price TEXT,
-            status TEXT DEFAULT 'active',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Table des messages
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id INTEGER,
-            telegram_id INTEGER NOT NULL,
-            message TEXT NOT NULL,
-            sender TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
-        )
-    ''')
+    """Initialise la base de données et applique les migrations"""
+    with storage.get_storage().write() as conn:
+        version = migrations.migrate(conn)
     
-    conn.commit()
-    conn.close()
-    logger.info("✅ Base de données simple initialisée")
+    logger.info(f"✅ Base de données simple initialisée (schéma v{version})")
 
 def save_message(telegram_id, message, sender='client'):
-    """Sauvegarde un message"""
-    conn = sqlite3.connect('lebonmot_simple.db')
-    cursor = conn.cursor()
-    
-    # Trouver ou créer la conversation
-    cursor.execute('SELECT id FROM conversations WHERE telegram_id = ? ORDER BY created_at DESC LIMIT 1', (telegram_id,))
-    result = cursor.fetchone()
-    
-    if result:
-        conversation_id = result[0]
-    else:
-        # Créer une nouvelle conversation
-        cursor.execute('INSERT INTO conversations (telegram_id) VALUES (?)', (telegram_id,))
-        conversation_id = cursor.lastrowid
-    
-    # Sauvegarder le message
-    cursor.execute('''
-        INSERT INTO messages (conversation_id, telegram_id, message, sender)
-        VALUES (?, ?, ?, ?)
-    ''', (conversation_id, telegram_id, message, sender))
-    
-    conn.commit()
-    conn.close()
+    """Sauvegarde un message (écriture différée, ne bloque pas la boucle asyncio)"""
+    get_journal().save_message(telegram_id, message, sender)
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Commande /start - Affiche le message d'accueil"""
-    user = update.effective_user
-    telegram_id = user.id
-    
-    # Réinitialiser l'état de conversation
-    user_conversations[telegram_id] = {'step': 'menu'}
-    
-    welcome_text = f"""🔐 **Le Bon Mot**
+# --- Textes et claviers construits une seule fois à l'import -----------------
+
+WELCOME_HEADER = """🔐 **Le Bon Mot**
 _Service Anonyme de E-réputation_
 
 ━━━━━━━━━━━━━━━━━━
@@ -108,204 +71,193 @@ _Service Anonyme de E-réputation_
 ━━━━━━━━━━━━━━━━━━
 ✅ Plus de 15 000 avis livrés avec succès
 ✅ Délai moyen : 48-72h
-━━━━━━━━━━━━━━━━━━
+━━━━━━━━━━━━━━━━━━"""
+
+WELCOME_BACK_TEXT = WELCOME_HEADER + "\n\nQue souhaitez-vous faire ?"
+
+START_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📝 Passer une commande", callback_data="new_quote")],
+    [InlineKeyboardButton("📋 Mes Commandes", callback_data="my_orders")],
+    [InlineKeyboardButton("💬 Contacter le support", callback_data="contact_support")]
+])
+
+BACK_TO_START_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📝 Obtenir un devis", callback_data="new_quote")],
+    [InlineKeyboardButton("💬 Contacter le support", callback_data="contact_support")],
+    [InlineKeyboardButton("ℹ️ Nos garanties", callback_data="guarantees")]
+])
 
-Bonjour {user.first_name} ! 👋
+MAIN_CHOICE_TEXT = "📋 **Que souhaitez-vous commander ?**\n\nChoisissez le type de service :"
+MAIN_CHOICE_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(category['button'], callback_data=f"category:{key}")] for key, category in CATEGORIES.items()]
+    + [[InlineKeyboardButton("« Retour", callback_data="back_to_start")]]
+)
 
-Que souhaitez-vous faire aujourd'hui ?"""
+ORDERS_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("« Retour au menu", callback_data="back_to_start")]])
 
-    keyboard = [
-        [InlineKeyboardButton("📝 Passer une commande", callback_data="new_quote")],
-        [InlineKeyboardButton("📋 Mes Commandes", callback_data="my_orders")],
-        [InlineKeyboardButton("💬 Contacter le support", callback_data="contact_support")]
-    ]
+SUPPORT_TEXT = (
+    "💬 **Mode Support activé**\n\n"
+    "Vous pouvez maintenant discuter directement avec notre équipe.\n"
+    "Écrivez votre message ci-dessous ! 👇"
+)
+
+
+def quantity_text(title, question):
+    return f"✅ **{title}**\n\n📊 **Étape 1/3 : Quantité**\n\n{question}"
+
+
+# Écran de quantité de chaque service
+SERVICE_SCREENS = {key: quantity_text(info['name'], info['question']) for key, info in PRICING.items()}
+
+def build_category_screens():
+    """Écran de chaque catégorie : (service choisi d'office ou None, texte, clavier)"""
+    screens = {}
+    for key, category in CATEGORIES.items():
+        services = [service for service, info in PRICING.items() if info['category'] == key]
+        if len(services) == 1:
+            service = services[0]
+            screens[key] = (service, quantity_text(category['title'], PRICING[service]['question']), None)
+        else:
+            screens[key] = (None, category['title'], InlineKeyboardMarkup(
+                [[InlineKeyboardButton(PRICING[service]['button'], callback_data=f"service:{service}")] for service in services]
+                + [[InlineKeyboardButton("« Retour", callback_data="new_quote")]]
+            ))
+    return screens
+
+CATEGORY_SCREENS = build_category_screens()
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /start - Affiche le message d'accueil"""
+    started = time.perf_counter()
+    user = update.effective_user
+    telegram_id = user.id
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Réinitialiser l'état de conversation
+    user_conversations.reset(telegram_id, 'menu')
+    
+    welcome_text = f"{WELCOME_HEADER}\n\nBonjour {user.first_name} ! 👋\n\nQue souhaitez-vous faire aujourd'hui ?"
     
-    await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await update.message.reply_text(welcome_text, reply_markup=START_KEYBOARD, parse_mode='Markdown')
+    metrics.HANDLER_LATENCY.observe(time.perf_counter() - started, handler='start')
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Gère les boutons"""
-    query = update.callback_query
-    await query.answer()
+# --- Routes des boutons : callback_data "route" ou "route:argument" ---------
+
+async def on_new_quote(query, user, state, arg):
+    # Démarrer le processus de qualification - Choix principal
+    user_conversations.reset(
+        user.id, 'main_choice',
+        username=user.username,
+        first_name=user.first_name
+    )
+    await query.edit_message_text(MAIN_CHOICE_TEXT, reply_markup=MAIN_CHOICE_KEYBOARD, parse_mode='Markdown')
+
+async def on_category(query, user, state, category):
+    screen = CATEGORY_SCREENS.get(category)
+    if screen is None:
+        return
+    service, text, keyboard = screen
     
-    user = update.effective_user
-    telegram_id = user.id
-    data = query.data
+    if service:
+        # Catégorie à service unique : directement à la quantité
+        state['service_type'] = service
+        state['step'] = 'quantity'
+    else:
+        # Choix de la plateforme
+        state['step'] = 'service_type'
+    user_conversations.save(state)
     
-    if data == "new_quote":
-        # Démarrer le processus de qualification - Choix principal
-        user_conversations[telegram_id] = {
-            'step': 'main_choice',
-            'username': user.username,
-            'first_name': user.first_name
-        }
-        
-        keyboard = [
-            [InlineKeyboardButton("⭐ Avis (Google, Trustpilot, etc.)", callback_data="category:avis")],
-            [InlineKeyboardButton("💬 Messages sur forum", callback_data="category:forum")],
-            [InlineKeyboardButton("🗑️ Suppression de lien (1ère page)", callback_data="category:suppression")],
-            [InlineKeyboardButton("« Retour", callback_data="back_to_start")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            "📋 **Que souhaitez-vous commander ?**\n\nChoisissez le type de service :",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+    await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
+
+async def on_service(query, user, state, service):
+    text = SERVICE_SCREENS.get(service)
+    if text is None:
+        return
+    state['service_type'] = service
+    state['step'] = 'quantity'
+    user_conversations.save(state)
     
-    elif data.startswith("category:"):
-        category = data.split(":")[1]
-        
-        if category == "avis":
-            # Choix de la plateforme d'avis
-            user_conversations[telegram_id]['step'] = 'service_type'
-            
-            keyboard = [
-                [InlineKeyboardButton("⭐ Avis Google", callback_data="service:google")],
-                [InlineKeyboardButton("🌟 Trustpilot", callback_data="service:trustpilot")],
-                [InlineKeyboardButton("📒 Pages Jaunes", callback_data="service:pagesjaunes")],
-                [InlineKeyboardButton("🌐 Autre plateforme", callback_data="service:autre_plateforme")],
-                [InlineKeyboardButton("« Retour", callback_data="new_quote")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "⭐ **Avis sur quelle plateforme ?**\n\nChoisissez la plateforme :",
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
-        
-        elif category == "forum":
-            # Direct au service forum
-            user_conversations[telegram_id]['service_type'] = 'forum'
-            user_conversations[telegram_id]['step'] = 'quantity'
-            
-            await query.edit_message_text(
-                f"✅ **Messages sur forum**\n\n"
-                f"📊 **Étape 1/3 : Quantité**\n\n"
-                f"Combien de messages souhaitez-vous ?",
-                parse_mode='Markdown'
-            )
-        
-        elif category == "suppression":
-            # Direct au service suppression
-            user_conversations[telegram_id]['service_type'] = 'suppression'
-            user_conversations[telegram_id]['step'] = 'quantity'
-            
-            await query.edit_message_text(
-                f"✅ **Suppression de liens**\n\n"
-                f"📊 **Étape 1/3 : Quantité**\n\n"
-                f"Combien de liens à supprimer ?",
-                parse_mode='Markdown'
-            )
+    await query.edit_message_text(text, parse_mode='Markdown')
+
+async def on_my_orders(query, user, state, arg):
+    # Afficher les commandes du client
+    state['step'] = 'viewing_orders'
+    user_conversations.save(state)
     
-    elif data.startswith("service:"):
-        service = data.split(":")[1]
-        user_conversations[telegram_id]['service_type'] = service
-        user_conversations[telegram_id]['step'] = 'quantity'
-        
-        service_info = PRICING[service]
-        
-        await query.edit_message_text(
-            f"✅ **{service_info['name']}**\n\n"
-            f"📊 **Étape 1/3 : Quantité**\n\n"
-            f"Combien d'avis souhaitez-vous ?",
-            parse_mode='Markdown'
-        )
+    # Les devis encore dans le journal d'abord (lus avant la base : aucun ne manque)
+    pending = get_journal().pending_orders(user.id)
+    orders = (pending + list(await get_db_executor().recent_orders(user.id, limit=5)))[:5]
     
-    elif data == "my_orders":
-        # Afficher les commandes du client
-        user_conversations[telegram_id]['step'] = 'viewing_orders'
+    if orders:
+        orders_text = "📋 **Vos commandes récentes**\n\n"
+        for order in orders:
+            service_name = PRICING.get(order['service_type'], {}).get('name', order['service_type'])
+            orders_text += f"• **{service_name}** - {order['quantity']}\n"
+            orders_text += f"  💰 {order['estimated_price']}\n"
+            orders_text += f"  📅 {order['created_at'][:10]}\n\n"
         
-        conn = sqlite3.connect('lebonmot_simple.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM conversations 
-            WHERE telegram_id = ? AND service_type IS NOT NULL
-            ORDER BY created_at DESC
-            LIMIT 5
-        ''', (telegram_id,))
-        
-        orders = cursor.fetchall()
-        conn.close()
-        
-        if orders:
-            orders_text = "📋 **Vos commandes récentes**\n\n"
-            for order in orders:
-                service_name = PRICING.get(order['service_type'], {}).get('name', order['service_type'])
-                orders_text += f"• **{service_name}** - {order['quantity']}\n"
-                orders_text += f"  💰 {order['estimated_price']}\n"
-                orders_text += f"  📅 {order['created_at'][:10]}\n\n"
-            
-            orders_text += "\n💬 Pour toute question, contactez le support !"
-        else:
-            orders_text = "📋 **Aucune commande pour le moment**\n\nCommencez par passer votre première commande ! 🚀"
-        
-        keyboard = [[InlineKeyboardButton("« Retour au menu", callback_data="back_to_start")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(orders_text, reply_markup=reply_markup, parse_mode='Markdown')
+        orders_text += "\n💬 Pour toute question, contactez le support !"
+    else:
+        orders_text = "📋 **Aucune commande pour le moment**\n\nCommencez par passer votre première commande ! 🚀"
     
-    elif data == "contact_support":
-        user_conversations[telegram_id] = {'step': 'support_mode'}
-        
-        await query.edit_message_text(
-            "💬 **Mode Support activé**\n\n"
-            "Vous pouvez maintenant discuter directement avec notre équipe.\n"
-            "Écrivez votre message ci-dessous ! 👇"
-        )
-        
-        save_message(telegram_id, "👤 Client a contacté le support", 'system')
+    await query.edit_message_text(orders_text, reply_markup=ORDERS_KEYBOARD, parse_mode='Markdown')
+
+async def on_contact_support(query, user, state, arg):
+    user_conversations.reset(user.id, 'support_mode')
     
-    elif data == "back_to_start":
-        user_conversations[telegram_id] = {'step': 'menu'}
-        
-        welcome_text = f"""🔐 **Le Bon Mot**
-_Service Anonyme de E-réputation_
+    await query.edit_message_text(SUPPORT_TEXT)
+    
+    save_message(user.id, "👤 Client a contacté le support", 'system')
 
-━━━━━━━━━━━━━━━━━━
-🌍 Avis 100% authentiques et géolocalisés
-💬 Messages de forum professionnels
-🔒 Anonymat total garanti
-🎯 IP réelles, comptes vérifiés
-💳 Paiement crypto uniquement
-━━━━━━━━━━━━━━━━━━
-✅ Plus de 15 000 avis livrés avec succès
-✅ Délai moyen : 48-72h
-━━━━━━━━━━━━━━━━━━
+async def on_back_to_start(query, user, state, arg):
+    user_conversations.reset(user.id, 'menu')
+    
+    await query.edit_message_text(WELCOME_BACK_TEXT, reply_markup=BACK_TO_START_KEYBOARD, parse_mode='Markdown')
 
-Que souhaitez-vous faire ?"""
+CALLBACK_ROUTES = {
+    'new_quote': on_new_quote,
+    'category': on_category,
+    'service': on_service,
+    'my_orders': on_my_orders,
+    'contact_support': on_contact_support,
+    'back_to_start': on_back_to_start,
+}
 
-        keyboard = [
-            [InlineKeyboardButton("📝 Obtenir un devis", callback_data="new_quote")],
-            [InlineKeyboardButton("💬 Contacter le support", callback_data="contact_support")],
-            [InlineKeyboardButton("ℹ️ Nos garanties", callback_data="guarantees")]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Gère les boutons : recherche O(1) de la route dans CALLBACK_ROUTES"""
+    started = time.perf_counter()
+    query = update.callback_query
+    await query.answer()
+    
+    route, _, arg = query.data.partition(':')
+    handler = CALLBACK_ROUTES.get(route)
+    if handler is None:
+        return
+    
+    user = update.effective_user
+    state = await user_conversations.get(user.id)
+    await handler(query, user, state, arg)
+    metrics.HANDLER_LATENCY.observe(time.perf_counter() - started, handler=f'callback:{route}')
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gère les messages texte"""
+    started = time.perf_counter()
     user = update.effective_user
     telegram_id = user.id
     message_text = update.message.text
     
     # Sauvegarder le message
     save_message(telegram_id, message_text, 'client')
+    metrics.MESSAGES.inc(sender='client')
     
     # Récupérer l'état de la conversation
-    state = user_conversations.get(telegram_id, {})
+    state = await user_conversations.get(telegram_id)
     step = state.get('step', 'support_mode')
     
     if step == 'quantity':
         # L'utilisateur a répondu avec une quantité
         state['quantity'] = message_text
         state['step'] = 'link'
+        user_conversations.save(state)
         
         await update.message.reply_text(
             f"✅ Quantité notée : **{message_text}**\n\n"
@@ -324,6 +276,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             state['link'] = message_text
         
         state['step'] = 'details'
+        user_conversations.save(state)
         
         await update.message.reply_text(
             f"📝 **Étape 4/4 : Détails supplémentaires (optionnel)**\n\n"
@@ -359,15 +312,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             state['estimated_price'] = "À calculer"
         
         # Sauvegarder la conversation complète en DB
-        conn = sqlite3.connect('lebonmot_simple.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO conversations (telegram_id, username, first_name, service_type, quantity, link, details, estimated_price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (telegram_id, state.get('username'), state.get('first_name'), 
-              service_type, quantity, state.get('link'), state.get('details'), state.get('estimated_price', 'À calculer')))
-        conn.commit()
-        conn.close()
+        get_journal().insert_order(telegram_id, state.get('username'), state.get('first_name'),
+                                   service_type, quantity, state.get('link'), state.get('details'),
+                                   state.get('estimated_price', 'À calculer'))
+        metrics.ORDERS.inc(service=service_type)
         
         # Afficher le récapitulatif
         recap = f"""✅ **Devis généré !**
@@ -390,6 +338,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Vous pouvez continuer à nous écrire ici pour toute question. Notre support vous répondra rapidement. 💬"""
 
         state['step'] = 'support_mode'
+        user_conversations.save(state)
         
         await update.message.reply_text(recap, parse_mode='Markdown')
     
@@ -400,12 +349,22 @@ Vous pouvez continuer à nous écrire ici pour toute question. Notre support vou
             "Notre équipe vous répondra très bientôt. ⏱️",
             parse_mode='Markdown'
         )
+    
+    # Durée par étape du parcours (les handlers en erreur ne sont pas comptés)
+    metrics.HANDLER_LATENCY.observe(time.perf_counter() - started, handler=f'message:{step}')
 
 def setup_simple_bot(token):
     """Configure le bot simple"""
     init_simple_db()
     
-    app = Application.builder().token(token).build()
+    # Écritures différées : vidées à l'arrêt du processus
+    get_journal().start()
+    atexit.register(get_journal().stop)
+    # Lectures des handlers sur un thread dédié (enregistré après : arrêté avant le journal)
+    atexit.register(get_db_executor().stop)
+    
+    # Updates traitées en parallèle entre clients, en série pour un même client
+    app = Application.builder().token(token).concurrent_updates(PerUserUpdateProcessor()).build()
     
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CallbackQueryHandler(handle_callback))
@@ -2,25 +2,74 @@
 Dashboard Admin Ultra-Simple - Le Bon Mot
 Gestion des conversations et réponses aux clients
 """
-from flask import Flask, render_template_string, request, redirect, session, jsonify
+from flask import Flask, Response, render_template, request, redirect, session, jsonify, make_response, g, stream_with_context
+from jinja2 import DictLoader
+from markupsafe import Markup, escape
 from functools import wraps
-import sqlite3
+from collections import OrderedDict
 from datetime import datetime
-import asyncio
+from telegram import Update
+import hmac
+import json
 import os
+import threading
+import time
+import metrics
+import export
+import storage
+from db_executor import get_db_executor
+from journal import get_journal
+from pubsub import broker, SSE_MAX_STREAMS
+from slow_queries import slow_queries
+from outbound import OutboundQueue
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'lebonmot-secret-key-2024')
 
+# Pagination des vues commandes / conversations
+PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', 50))
+OVERVIEW_SIZE = 5
+
+# Conversations : seuls les CONVERSATION_WINDOW derniers messages sont rendus,
+# les plus anciens se chargent à la demande (au plus MESSAGES_MAX_LIMIT par appel)
+CONVERSATION_WINDOW = int(os.getenv('CONVERSATION_WINDOW', 100))
+MESSAGES_MAX_LIMIT = 500
+
+# Résultats de recherche par page
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+
+# Cache des pages rendues, invalidé par la version des données
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 256))
+# Distingue les ETags d'un démarrage à l'autre (la version repart de 0)
+BOOT_ID = f"{time.time_ns():x}"
+
+# Mode webhook : secret attendu dans X-Telegram-Bot-Api-Secret-Token et
+# nombre maximal d'updates en attente avant de refuser (Telegram réessaie)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', 1000))
+
+# Flux SSE des conversations : commentaire envoyé toutes les SSE_HEARTBEAT secondes
+# pour garder la connexion ouverte (et détecter les navigateurs partis)
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+
+# /metrics : jeton Bearer exigé s'il est défini (sinon accès libre, comme /health)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # Référence au bot pour envoyer des messages
 bot_app = None
 bot_loop = None
+outbound_queue = None
 
 def set_bot(application, loop):
-    """Configure le bot pour pouvoir envoyer des messages"""
-    global bot_app, bot_loop
+    """Configure le bot pour pouvoir envoyer des messages (appelé depuis la boucle du bot)"""
+    global bot_app, bot_loop, outbound_queue
     bot_app = application
     bot_loop = loop
+    outbound_queue = OutboundQueue(application.bot).start(loop)
+
+def render(template_name, **context):
+    """Rend un template précompilé (voir TEMPLATES en fin de module)"""
+    return render_template(template_name, **context)
 
 def login_required(f):
     @wraps(f)
@@ -30,10 +79,123 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+class ResponseCache:
+    """Pages rendues par URL, valides tant que storage.data_version ne change pas"""
+
+    def __init__(self, capacity=RESPONSE_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+response_cache = ResponseCache()
+
+# Files internes suivies par /metrics (None tant que le bot n'est pas démarré)
+metrics.QUEUE_DEPTH.set_function(lambda: get_journal().depth(), queue='journal')
+metrics.QUEUE_DEPTH.set_function(lambda: outbound_queue.depth() if outbound_queue else None, queue='outbound')
+metrics.QUEUE_DEPTH.set_function(lambda: bot_app.update_queue.qsize() if bot_app else None, queue='updates')
+metrics.QUEUE_DEPTH.set_function(broker.count, queue='sse_streams')
+metrics.QUEUE_DEPTH.set_function(lambda: get_db_executor().depth(), queue='db')
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop('started', None)
+    if started is not None:
+        rule = request.url_rule.rule if request.url_rule else 'inconnue'
+        metrics.ROUTE_LATENCY.observe(time.perf_counter() - started, method=request.method,
+                                      route=rule, status=response.status_code)
+    return response
+
+def cached_page(f):
+    """GET conditionnel (ETag / Last-Modified) + cache serveur des pages HTML
+
+    Une page inchangée depuis la dernière visite répond 304 sans requête SQL.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        db = storage.get_storage()
+        version = db.data_version
+        key = request.full_path
+        
+        body = response_cache.get(key, version)
+        if body is None:
+            result = f(*args, **kwargs)
+            response = make_response(result)
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            response_cache.put(key, version, body)
+        
+        response = make_response(body)
+        response.set_etag(f"{BOOT_ID}-{version}", weak=True)
+        response.last_modified = db.changed_at
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return decorated_function
+
 @app.route('/health')
 def health():
     """Endpoint de santé pour Railway"""
-    return jsonify({'status': 'healthy', 'service': 'Le Bon Mot'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'Le Bon Mot',
+        'journal_depth': get_journal().depth(),
+        'outbound': outbound_queue.stats() if outbound_queue else None,
+        'update_queue': bot_app.update_queue.qsize() if bot_app else None
+    }), 200
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métriques au format texte Prometheus"""
+    if METRICS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(token, METRICS_TOKEN):
+            return 'Jeton invalide\n', 401
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Reçoit les updates Telegram et les transmet directement à Application.update_queue"""
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return jsonify({'error': 'Secret invalide'}), 403
+    
+    if not bot_app:
+        return jsonify({'error': 'Bot non démarré'}), 503, {'Retry-After': '5'}
+    
+    # Contre-pression : Telegram renverra l'update plus tard
+    if bot_app.update_queue.qsize() >= WEBHOOK_MAX_PENDING:
+        return jsonify({'error': 'File pleine'}), 503, {'Retry-After': '1'}
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'Update invalide'}), 400
+    
+    update = Update.de_json(data, bot_app.bot)
+    bot_loop.call_soon_threadsafe(bot_app.update_queue.put_nowait, update)
+    return '', 200
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -42,8 +204,8 @@ def login():
         if request.form.get('password') == admin_password:
             session['logged_in'] = True
             return redirect('/')
-        return render_template_string(LOGIN_TEMPLATE, error="Mot de passe incorrect")
-    return render_template_string(LOGIN_TEMPLATE)
+        return render('login.html', error="Mot de passe incorrect")
+    return render('login.html')
 
 @app.route('/logout')
 def logout():
@@ -52,85 +214,95 @@ def logout():
 
 @app.route('/')
 @login_required
+@cached_page
 def dashboard():
     """Dashboard principal - Vue d'ensemble avec onglets"""
     view = request.args.get('view', 'overview')  # overview, conversations, orders
     
-    conn = sqlite3.connect('lebonmot_simple.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    after = request.args.get('after')
     
     # Stats globales
-    cursor.execute('SELECT COUNT(*) FROM conversations WHERE service_type IS NOT NULL')
-    total_orders = cursor.fetchone()[0]
+    stats = storage.dashboard_stats()
     
-    cursor.execute('SELECT COUNT(DISTINCT telegram_id) FROM conversations')
-    total_clients = cursor.fetchone()[0]
+    # Ne lire que les lignes affichées : 5 de chaque en vue d'ensemble, une page sinon
+    conversations, orders, next_cursor = [], [], None
+    if view == 'overview':
+        orders, _ = storage.orders_page(OVERVIEW_SIZE)
+        conversations, _ = storage.conversations_page(OVERVIEW_SIZE)
+    elif view == 'orders':
+        orders, next_cursor = storage.orders_page(PAGE_SIZE, after)
+    elif view == 'conversations':
+        conversations, next_cursor = storage.conversations_page(PAGE_SIZE, after)
     
-    cursor.execute('SELECT COUNT(*) FROM messages WHERE sender = "client"')
-    total_messages = cursor.fetchone()[0]
-    
-    # Récupérer toutes les conversations
-    cursor.execute('''
-        SELECT c.*, 
-               (SELECT COUNT(*) FROM messages WHERE conversation_id = c.id) as message_count,
-               (SELECT message FROM messages WHERE conversation_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message
-        FROM conversations c
-        ORDER BY c.created_at DESC
-    ''')
-    conversations = cursor.fetchall()
-    
-    # Récupérer toutes les commandes (conversations avec service_type)
-    cursor.execute('''
-        SELECT c.*
-        FROM conversations c
-        WHERE c.service_type IS NOT NULL
-        ORDER BY c.created_at DESC
-    ''')
-    orders = cursor.fetchall()
-    
-    conn.close()
-    
-    stats = {
-        'total_orders': total_orders,
-        'total_clients': total_clients,
-        'total_messages': total_messages
-    }
-    
-    return render_template_string(
-        DASHBOARD_TEMPLATE, 
+    return render(
+        'dashboard.html',
         conversations=conversations,
         orders=orders,
         stats=stats,
-        view=view
+        view=view,
+        after=after,
+        next_cursor=next_cursor,
+        trace_enabled=slow_queries.enabled
+    )
+
+def highlight(excerpt):
+    """Extrait FTS5 (termes entre \\x02 et \\x03) -> HTML échappé avec <mark>"""
+    return Markup(str(escape(excerpt)).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+@app.route('/search')
+@login_required
+@cached_page
+def search():
+    """Recherche plein texte : messages, pseudos, prénoms, liens et détails des commandes"""
+    q = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    
+    results, has_more = storage.search(q, SEARCH_PAGE_SIZE, page)
+    
+    return render(
+        'dashboard.html',
+        view='search',
+        stats=storage.dashboard_stats(),
+        q=q,
+        page=page,
+        has_more=has_more,
+        results=[dict(row, excerpt=highlight(row['excerpt'])) for row in results],
+        trace_enabled=slow_queries.enabled
     )
 
 @app.route('/conversation/<int:conv_id>')
 @login_required
+@cached_page
 def conversation(conv_id):
     """Affiche une conversation spécifique"""
-    conn = sqlite3.connect('lebonmot_simple.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     # Infos de la conversation
-    cursor.execute('SELECT * FROM conversations WHERE id = ?', (conv_id,))
-    conv = cursor.fetchone()
+    conv = storage.get_conversation(conv_id)
     
     if not conv:
         return "Conversation introuvable", 404
     
-    # Messages de la conversation
-    cursor.execute('''
-        SELECT * FROM messages 
-        WHERE conversation_id = ? 
-        ORDER BY created_at ASC
-    ''', (conv_id,))
+    # Derniers messages seulement : taille de page bornée quelle que soit la conversation
+    messages, has_more = storage.conversation_messages(conv_id, CONVERSATION_WINDOW)
     
-    messages = cursor.fetchall()
-    conn.close()
+    return render('conversation.html', conv=conv, messages=messages, has_more=has_more)
+
+@app.route('/conversation/<int:conv_id>/messages')
+@login_required
+def older_messages(conv_id):
+    """Messages plus anciens que ?before=<id>, en JSON (du plus ancien au plus récent)"""
+    before = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', CONVERSATION_WINDOW, type=int), MESSAGES_MAX_LIMIT)
+    if before is None or limit < 1:
+        return jsonify({'error': 'Paramètres before et limit requis'}), 400
     
-    return render_template_string(CONVERSATION_TEMPLATE, conv=conv, messages=messages)
+    messages, has_more = storage.conversation_messages(conv_id, limit, before)
+    return jsonify({
+        'messages': [message_json(row) for row in messages],
+        'has_more': has_more
+    })
+
+def message_json(row):
+    return {key: row[key] for key in ('id', 'message', 'sender', 'created_at', 'delivery_status')}
 
 @app.route('/conversation/<int:conv_id>/reply', methods=['POST'])
 @login_required
@@ -141,44 +313,124 @@ def reply(conv_id):
     if not message:
         return jsonify({'error': 'Message vide'}), 400
     
-    # Récupérer le telegram_id
-    conn = sqlite3.connect('lebonmot_simple.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT telegram_id FROM conversations WHERE id = ?', (conv_id,))
-    result = cursor.fetchone()
+    # Sauvegarder le message en DB (statut d'envoi 'pending')
+    saved = storage.add_admin_message(conv_id, message)
     
-    if not result:
-        conn.close()
+    if saved is None:
         return jsonify({'error': 'Conversation introuvable'}), 404
     
-    telegram_id = result[0]
+    telegram_id, message_id = saved
+    metrics.MESSAGES.inc(sender='admin')
     
-    # Sauvegarder le message en DB
-    cursor.execute('''
-        INSERT INTO messages (conversation_id, telegram_id, message, sender)
-        VALUES (?, ?, ?, ?)
-    ''', (conv_id, telegram_id, message, 'admin'))
-    conn.commit()
-    conn.close()
-    
-    # Envoyer via Telegram
-    if bot_app and bot_loop:
-        formatted_message = f"Support 👨‍💼 : {message}"
-        
-        async def send_message():
-            try:
-                await bot_app.bot.send_message(
-                    chat_id=telegram_id,
-                    text=formatted_message,
-                    parse_mode='Markdown'
-                )
-            except Exception as e:
-                print(f"Erreur envoi message: {e}")
-        
-        asyncio.run_coroutine_threadsafe(send_message(), bot_loop)
+    # Envoyer via Telegram : file limitée en débit, statut mis à jour après envoi
+    if outbound_queue:
+        outbound_queue.submit(telegram_id, f"Support 👨‍💼 : {message}", message_id)
     
+    # Envoi en fetch() depuis la page : le message arrive aussi par le flux SSE
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'id': message_id, 'delivery_status': 'pending'}), 201
     return redirect(f'/conversation/{conv_id}')
 
+def sse_event(kind, data, event_id=None):
+    lines = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{lines}event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def message_event(row):
+    return sse_event('message', message_json(row), row['id'])
+
+def stream_messages(conv_id, last_id, subscription):
+    """Rattrapage en base (id > last_id) puis messages publiés par le pub/sub"""
+    def catch_up():
+        nonlocal last_id
+        while True:
+            rows = storage.messages_after(conv_id, last_id)
+            for row in rows:
+                last_id = row['id']
+                yield message_event(row)
+            if len(rows) < 500:
+                return
+
+    yield 'retry: 3000\n\n'
+    yield from catch_up()
+    while True:
+        event = subscription.get(SSE_HEARTBEAT)
+        if subscription.overflowed:
+            # Abonné trop lent : événements perdus, on relit la base
+            subscription.overflowed = False
+            yield from catch_up()
+        if event is None:
+            yield ': ping\n\n'
+            continue
+        kind, data = event
+        if kind == 'message':
+            if data['id'] <= last_id:
+                continue
+            last_id = data['id']
+            yield sse_event(kind, data, data['id'])
+        else:
+            yield sse_event(kind, data)
+
+@app.route('/conversation/<int:conv_id>/stream')
+@login_required
+def conversation_stream(conv_id):
+    """Flux SSE : nouveaux messages et statuts d'envoi, sans recharger l'historique"""
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'Identifiant invalide'}), 400
+    
+    if broker.count() >= SSE_MAX_STREAMS:
+        return jsonify({'error': 'Trop de flux ouverts'}), 503, {'Retry-After': '10'}
+    
+    # Abonnement avant le rattrapage : aucun message ne peut passer entre les deux
+    subscription = broker.subscribe(conv_id)
+    response = Response(stream_messages(conv_id, last_id, subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
+@app.route('/export/<kind>.<fmt>')
+@login_required
+def export_data(kind, fmt):
+    """Export streamé : ?since=&until= (AAAA-MM-JJ), service_type, status, gzip=1"""
+    if kind not in export.KINDS or fmt not in export.FORMATS:
+        return jsonify({'error': 'Export inconnu'}), 404
+    try:
+        filters = export.parse_filters(
+            request.args.get('since'), request.args.get('until'),
+            request.args.get('service_type'), request.args.get('status')
+        )
+    except ValueError:
+        return jsonify({'error': 'Dates attendues au format AAAA-MM-JJ'}), 400
+    
+    compress = request.args.get('gzip') == '1'
+    response = Response(
+        stream_with_context(export.stream(kind, fmt, filters, compress)),
+        mimetype='application/gzip' if compress else export.FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{export.filename(kind, fmt, compress)}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/slow-queries')
+@login_required
+def slow_queries_page():
+    """Requêtes SQL au-dessus de SQL_TRACE_MS, les plus lentes d'abord"""
+    return render(
+        'slow_queries.html',
+        enabled=slow_queries.enabled,
+        threshold_ms=slow_queries.threshold_ms,
+        summary=slow_queries.summary(),
+        entries=slow_queries.worst(50)
+    )
+
+@app.route('/slow-queries/clear', methods=['POST'])
+@login_required
+def clear_slow_queries():
+    slow_queries.clear()
+    return redirect('/slow-queries')
+
 # Templates HTML
 LOGIN_TEMPLATE = '''
 <!DOCTYPE html>
@@ -241,6 +493,12 @@ LOGIN_TEMPLATE = '''
 '''
 
 DASHBOARD_TEMPLATE = '''
+{% macro pagination(view) %}
+<div class="pagination">
+    {% if after %}<a href="/?view={{ view }}">« Plus récents</a>{% endif %}
+    {% if next_cursor %}<a href="/?view={{ view }}&after={{ next_cursor | urlencode }}">Plus anciens »</a>{% endif %}
+</div>
+{% endmacro %}
 <!DOCTYPE html>
 <html>
 <head>
@@ -375,6 +633,16 @@ DASHBOARD_TEMPLATE = '''
             transition: background 0.3s;
         }
         .btn-logout:hover { background: rgba(255,255,255,0.3); }
+        .pagination {
+            display: flex;
+            justify-content: space-between;
+            margin: 20px 0;
+        }
+        .pagination a {
+            color: #667eea;
+            text-decoration: none;
+            font-weight: 600;
+        }
         .empty {
             text-align: center;
             padding: 60px 20px;
@@ -382,6 +650,29 @@ DASHBOARD_TEMPLATE = '''
             background: white;
             border-radius: 8px;
         }
+        .search-form {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 20px;
+        }
+        .search-form input {
+            flex: 1;
+            padding: 12px;
+            border: 2px solid #ddd;
+            border-radius: 8px;
+            font-size: 15px;
+        }
+        .search-form button {
+            padding: 12px 24px;
+            background: #667eea;
+            color: white;
+            border: none;
+            border-radius: 8px;
+            cursor: pointer;
+        }
+        .exports { float: right; font-size: 14px; font-weight: normal; }
+        .exports a { color: #667eea; text-decoration: none; margin-left: 12px; }
+        mark { background: #fff3a3; padding: 0 2px; border-radius: 2px; }
         .section-title {
             font-size: 20px;
             font-weight: 600;
@@ -394,7 +685,10 @@ DASHBOARD_TEMPLATE = '''
     <div class="header">
         <div class="header-content">
             <h1>📊 Le Bon Mot - Admin Dashboard</h1>
-            <a href="/logout" class="btn-logout">Déconnexion</a>
+            <div>
+                {% if trace_enabled %}<a href="/slow-queries" class="btn-logout">🐢 Requêtes lentes</a>{% endif %}
+                <a href="/logout" class="btn-logout">Déconnexion</a>
+            </div>
         </div>
     </div>
     
@@ -415,6 +709,12 @@ DASHBOARD_TEMPLATE = '''
             </div>
         </div>
         
+        <!-- Recherche -->
+        <form class="search-form" action="/search" method="GET">
+            <input type="search" name="q" value="{{ q }}" placeholder="🔍 Rechercher un message, un pseudo, un lien..." required>
+            <button type="submit">Rechercher</button>
+        </form>
+        
         <!-- Tabs -->
         <div class="tabs">
             <a href="/?view=overview" class="tab {% if view == 'overview' %}active{% endif %}">
@@ -432,7 +732,7 @@ DASHBOARD_TEMPLATE = '''
         {% if view == 'overview' %}
             <h2 class="section-title">📋 Dernières Commandes</h2>
             {% if orders %}
-                {% for order in orders[:5] %}
+                {% for order in orders %}
                 <div class="card" onclick="window.location.href='/conversation/{{ order.id }}'">
                     <div class="card-header">
                         <div class="card-title">
@@ -456,7 +756,7 @@ DASHBOARD_TEMPLATE = '''
             
             <h2 class="section-title" style="margin-top: 40px;">💬 Dernières Conversations</h2>
             {% if conversations %}
-                {% for conv in conversations[:5] %}
+                {% for conv in conversations %}
                 <div class="card" onclick="window.location.href='/conversation/{{ conv.id }}'">
                     <div class="card-header">
                         <div class="card-title">
@@ -466,8 +766,8 @@ DASHBOARD_TEMPLATE = '''
                         <span class="badge">{{ conv.message_count }} messages</span>
                     </div>
                     <div class="card-body">
-                        {% if conv.last_message %}
-                        💬 "{{ conv.last_message[:80] }}..."
+                        {% if conv.last_message_preview %}
+                        💬 "{{ conv.last_message_preview[:80] }}..."
                         {% endif %}
                     </div>
                     <div class="card-meta">
@@ -479,7 +779,9 @@ DASHBOARD_TEMPLATE = '''
             {% endif %}
         
         {% elif view == 'orders' %}
-            <h2 class="section-title">🛒 Toutes les Commandes</h2>
+            <h2 class="section-title">🛒 Toutes les Commandes
+                <small class="exports"><a href="/export/orders.csv">⬇️ CSV</a> <a href="/export/orders.jsonl">⬇️ JSONL</a></small>
+            </h2>
             {% if orders %}
                 {% for order in orders %}
                 <div class="card" onclick="window.location.href='/conversation/{{ order.id }}'">
@@ -501,12 +803,41 @@ DASHBOARD_TEMPLATE = '''
                     </div>
                 </div>
                 {% endfor %}
+                {{ pagination('orders') }}
             {% else %}
                 <div class="empty">📭 Aucune commande pour le moment</div>
             {% endif %}
         
+        {% elif view == 'search' %}
+            <h2 class="section-title">🔍 Résultats pour « {{ q }} »</h2>
+            {% if results %}
+                {% for r in results %}
+                <div class="card" onclick="window.location.href='/conversation/{{ r.conversation_id }}'">
+                    <div class="card-header">
+                        <div class="card-title">
+                            👤 {{ r.first_name or 'Client' }}
+                            {% if r.username %}<small>@{{ r.username }}</small>{% endif %}
+                        </div>
+                        {% if r.message_id %}<span class="badge">message</span>{% else %}<span class="badge badge-success">{{ r.service_type or 'fiche' }}</span>{% endif %}
+                    </div>
+                    <div class="card-body">{{ r.excerpt }}</div>
+                    <div class="card-meta">
+                        <span>🕐 {{ r.created_at }}</span>
+                    </div>
+                </div>
+                {% endfor %}
+                <div class="pagination">
+                    {% if page > 1 %}<a href="/search?q={{ q | urlencode }}&page={{ page - 1 }}">« Plus pertinents</a>{% endif %}
+                    {% if has_more %}<a href="/search?q={{ q | urlencode }}&page={{ page + 1 }}">Suivants »</a>{% endif %}
+                </div>
+            {% else %}
+                <div class="empty">🔍 Aucun résultat</div>
+            {% endif %}
+        
         {% elif view == 'conversations' %}
-            <h2 class="section-title">💬 Toutes les Conversations</h2>
+            <h2 class="section-title">💬 Toutes les Conversations
+                <small class="exports"><a href="/export/conversations.csv">⬇️ CSV</a> <a href="/export/messages.csv?gzip=1" title="Tous les messages">⬇️ Messages</a></small>
+            </h2>
             {% if conversations %}
                 {% for conv in conversations %}
                 <div class="card" onclick="window.location.href='/conversation/{{ conv.id }}'">
@@ -521,8 +852,8 @@ DASHBOARD_TEMPLATE = '''
                         {% if conv.service_type %}
                         📋 Service : <strong>{{ conv.service_type }}</strong> • Quantité : {{ conv.quantity }}<br>
                         {% endif %}
-                        {% if conv.last_message %}
-                        💬 "{{ conv.last_message[:80] }}..."
+                        {% if conv.last_message_preview %}
+                        💬 "{{ conv.last_message_preview[:80] }}..."
                         {% endif %}
                     </div>
                     <div class="card-meta">
@@ -531,6 +862,7 @@ DASHBOARD_TEMPLATE = '''
                     </div>
                 </div>
                 {% endfor %}
+                {{ pagination('conversations') }}
             {% else %}
                 <div class="empty">📭 Aucune conversation pour le moment</div>
             {% endif %}
@@ -606,6 +938,15 @@ CONVERSATION_TEMPLATE = '''
             font-size: 13px;
             color: #666;
         }
+        .load-older {
+            align-self: center;
+            background: white;
+            border: 1px solid #ddd;
+            border-radius: 16px;
+            padding: 6px 14px;
+            color: #667eea;
+            cursor: pointer;
+        }
         .reply-form {
             background: white;
             padding: 20px;
@@ -648,30 +989,245 @@ CONVERSATION_TEMPLATE = '''
     {% endif %}
     
     <div class="messages" id="messages">
+        {% if has_more %}
+        <button class="load-older" id="load-older" data-before="{{ messages[0].id }}">↑ Messages précédents</button>
+        {% endif %}
         {% for msg in messages %}
-        <div class="message message-{{ msg.sender }}">
+        <div class="message message-{{ msg.sender }}" id="msg-{{ msg.id }}">
             {{ msg.message }}
             <div style="font-size: 11px; opacity: 0.7; margin-top: 5px;">
                 {{ msg.created_at }}
+                <span class="status">{% if msg.delivery_status == 'sent' %}✓{% elif msg.delivery_status == 'pending' %}⏳{% elif msg.delivery_status == 'failed' %}⚠️ non délivré{% endif %}</span>
             </div>
         </div>
         {% endfor %}
     </div>
     
-    <form class="reply-form" method="POST" action="/conversation/{{ conv.id }}/reply">
+    <form class="reply-form" id="reply-form" method="POST" action="/conversation/{{ conv.id }}/reply">
         <textarea name="message" rows="3" placeholder="Votre réponse..." required></textarea>
         <button type="submit">Envoyer ➤</button>
     </form>
     
     <script>
-        // Auto-scroll vers le bas
         const messages = document.getElementById('messages');
-        messages.scrollTop = messages.scrollHeight;
+        const STATUS = {sent: '✓', pending: '⏳', failed: '⚠️ non délivré'};
+        
+        function scrollToBottom() {
+            messages.scrollTop = messages.scrollHeight;
+        }
+        
+        function messageElement(msg) {
+            const div = document.createElement('div');
+            div.className = 'message message-' + msg.sender;
+            div.id = 'msg-' + msg.id;
+            div.appendChild(document.createTextNode(msg.message));
+            const meta = document.createElement('div');
+            meta.style.cssText = 'font-size: 11px; opacity: 0.7; margin-top: 5px;';
+            meta.appendChild(document.createTextNode(msg.created_at + ' '));
+            const status = document.createElement('span');
+            status.className = 'status';
+            status.textContent = STATUS[msg.delivery_status] || '';
+            meta.appendChild(status);
+            div.appendChild(meta);
+            return div;
+        }
+        
+        function appendMessage(msg) {
+            if (document.getElementById('msg-' + msg.id)) return;
+            const div = messageElement(msg);
+            const atBottom = messages.scrollHeight - messages.scrollTop - messages.clientHeight < 50;
+            messages.appendChild(div);
+            if (atBottom) scrollToBottom();
+        }
+        
+        // Historique à la demande : page suivante quand on remonte en haut
+        const loadOlder = document.getElementById('load-older');
+        let loading = false;
+        async function loadOlderMessages() {
+            if (!loadOlder || loading || !loadOlder.isConnected) return;
+            loading = true;
+            try {
+                const response = await fetch('/conversation/{{ conv.id }}/messages?before=' + loadOlder.dataset.before);
+                const page = await response.json();
+                const previousHeight = messages.scrollHeight;
+                const fragment = document.createDocumentFragment();
+                page.messages.forEach(msg => fragment.appendChild(messageElement(msg)));
+                loadOlder.after(fragment);
+                if (page.messages.length) loadOlder.dataset.before = page.messages[0].id;
+                if (!page.has_more) loadOlder.remove();
+                // Garder à l'écran les messages qu'on lisait
+                messages.scrollTop += messages.scrollHeight - previousHeight;
+            } finally {
+                loading = false;
+            }
+        }
+        if (loadOlder) {
+            loadOlder.addEventListener('click', loadOlderMessages);
+            messages.addEventListener('scroll', () => {
+                if (messages.scrollTop < 100) loadOlderMessages();
+            });
+        }
+        
+        // Nouveaux messages en direct : seuls ceux après le dernier affiché
+        const source = new EventSource('/conversation/{{ conv.id }}/stream?after={{ messages[-1].id if messages else 0 }}');
+        source.addEventListener('message', e => appendMessage(JSON.parse(e.data)));
+        source.addEventListener('status', e => {
+            const update = JSON.parse(e.data);
+            const status = document.querySelector('#msg-' + update.id + ' .status');
+            if (status) status.textContent = STATUS[update.delivery_status] || '';
+        });
+        
+        // Réponse envoyée sans recharger la page
+        const form = document.getElementById('reply-form');
+        form.addEventListener('submit', async e => {
+            e.preventDefault();
+            const button = form.querySelector('button');
+            button.disabled = true;
+            try {
+                const response = await fetch(form.action, {
+                    method: 'POST',
+                    body: new FormData(form),
+                    headers: {'Accept': 'application/json'}
+                });
+                if (!response.ok) throw new Error((await response.json()).error);
+                form.reset();
+            } catch (err) {
+                alert('Envoi impossible : ' + err.message);
+            } finally {
+                button.disabled = false;
+            }
+        });
+        
+        scrollToBottom();
     </script>
 </body>
 </html>
 '''
 
+SLOW_QUERIES_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Requêtes lentes - Le Bon Mot</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            background: #f5f5f5;
+        }
+        .header {
+            background: #667eea;
+            color: white;
+            padding: 15px 20px;
+            display: flex;
+            align-items: center;
+            gap: 15px;
+        }
+        .back-btn, .header button {
+            background: rgba(255,255,255,0.2);
+            color: white;
+            padding: 8px 16px;
+            border: none;
+            border-radius: 6px;
+            text-decoration: none;
+            cursor: pointer;
+            font-size: 14px;
+        }
+        .header form { margin-left: auto; }
+        .container { max-width: 1200px; margin: 30px auto; padding: 0 20px; }
+        .section-title {
+            font-size: 20px;
+            font-weight: 600;
+            margin: 25px 0 15px;
+            color: #333;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+            font-size: 14px;
+        }
+        th, td { padding: 10px 14px; text-align: left; border-bottom: 1px solid #eee; vertical-align: top; }
+        th { color: #666; font-weight: 600; }
+        .num { text-align: right; font-variant-numeric: tabular-nums; }
+        code, .plan { font-family: monospace; font-size: 12px; color: #444; }
+        .plan { white-space: pre; }
+        .empty {
+            text-align: center;
+            padding: 60px 20px;
+            color: #999;
+            background: white;
+            border-radius: 8px;
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <a href="/" class="back-btn">← Retour</a>
+        <h2>🐢 Requêtes lentes</h2>
+        {% if enabled %}
+        <form method="POST" action="/slow-queries/clear"><button type="submit">Vider</button></form>
+        {% endif %}
+    </div>
+    
+    <div class="container">
+        {% if not enabled %}
+        <div class="empty">Traceur désactivé : définissez SQL_TRACE_MS (seuil en millisecondes) pour l'activer.</div>
+        {% elif not entries %}
+        <div class="empty">Aucune requête au-dessus de {{ threshold_ms }} ms pour l'instant.</div>
+        {% else %}
+        <div class="section-title">Par requête (seuil {{ threshold_ms }} ms)</div>
+        <table>
+            <tr><th>Requête</th><th class="num">Passages lents</th><th class="num">Pire (ms)</th><th class="num">Moyenne (ms)</th></tr>
+            {% for s in summary %}
+            <tr>
+                <td><code>{{ s.name }}</code></td>
+                <td class="num">{{ s.count }}</td>
+                <td class="num">{{ '%.1f' | format(s.max_ms) }}</td>
+                <td class="num">{{ '%.1f' | format(s.avg_ms) }}</td>
+            </tr>
+            {% endfor %}
+        </table>
+        
+        <div class="section-title">Pires exécutions</div>
+        <table>
+            <tr><th>Requête</th><th class="num">Durée (ms)</th><th>Paramètres</th><th>Plan</th><th>Quand</th></tr>
+            {% for e in entries %}
+            <tr>
+                <td><code>{{ e.name }}</code><br><small>{{ e.thread }}</small></td>
+                <td class="num">{{ '%.1f' | format(e.duration_ms) }}</td>
+                <td><code>{{ e.params }}</code></td>
+                <td class="plan">{{ e.plan | join('\\n') }}</td>
+                <td>{{ e.at.strftime('%d/%m %H:%M:%S') }}</td>
+            </tr>
+            {% endfor %}
+        </table>
+        {% endif %}
+    </div>
+</body>
+</html>
+'''
+
+# Templates servis par un loader Jinja : compilés une seule fois puis gardés
+# en cache, au lieu d'être recompilés par render_template_string à chaque requête
+TEMPLATES = {
+    'login.html': LOGIN_TEMPLATE,
+    'dashboard.html': DASHBOARD_TEMPLATE,
+    'conversation.html': CONVERSATION_TEMPLATE,
+    'slow_queries.html': SLOW_QUERIES_TEMPLATE,
+}
+app.jinja_loader = DictLoader(TEMPLATES)
+
+def precompile_templates():
+    """Compile tous les templates au démarrage"""
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+
+precompile_templates()
+
 def create_simple_dashboard():
     """Retourne l'app Flask"""
     return app
@@ -0,0 +1,80 @@
+"""
+Exécuteur base de données - Le Bon Mot
+Les handlers du bot attendent (await) leurs lectures SQLite, exécutées sur un
+thread dédié : la boucle asyncio ne bloque jamais sur le disque. File bornée :
+au-delà de DB_QUEUE_SIZE appels en cours, les handlers patientent sans bloquer.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+DB_QUEUE_SIZE = int(os.getenv('DB_QUEUE_SIZE', 256))
+
+
+class DatabaseExecutor:
+    """Façade asynchrone de storage : un thread, une file d'au plus queue_size appels"""
+
+    def __init__(self, queue_size=DB_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._slots = None
+        self._pending = 0
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-executor')
+            return self._pool
+
+    def stop(self):
+        """Termine les appels en file puis arrête le thread"""
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.shutdown(wait=True)
+            logger.info("🗄️ Exécuteur base de données arrêté")
+
+    def depth(self):
+        """Appels en attente ou en cours (y compris ceux qui attendent une place)"""
+        return self._pending
+
+    async def run(self, function, *args):
+        """function(*args) sur le thread base de données"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Sémaphore lié à la boucle : recréé si la boucle change (tests, benchmarks)
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.queue_size)
+        self._pending += 1
+        try:
+            async with self._slots:
+                return await loop.run_in_executor(self._executor(), functools.partial(function, *args))
+        finally:
+            self._pending -= 1
+
+    async def recent_orders(self, telegram_id, limit=5):
+        return await self.run(storage.recent_orders, telegram_id, limit)
+
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    """Retourne l'exécuteur partagé (créé au premier appel)"""
+    global _db_executor
+    if _db_executor is None:
+        with _db_executor_lock:
+            if _db_executor is None:
+                _db_executor = DatabaseExecutor()
+    return _db_executor
@@ -0,0 +1,111 @@
+"""
+Exports CSV / JSONL - Le Bon Mot
+Commandes, conversations et messages (archive comprise) lus par lots de
+EXPORT_BATCH_SIZE lignes : mémoire constante, connexion de lecture rendue au
+pool entre deux lots, compression gzip au fil de l'eau en option.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+import storage
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+CONVERSATION_COLUMNS = ('id', 'telegram_id', 'username', 'first_name', 'service_type', 'quantity', 'link',
+                        'details', 'estimated_price', 'status', 'created_at', 'message_count', 'last_message_at')
+MESSAGE_COLUMNS = ('id', 'conversation_id', 'telegram_id', 'username', 'service_type', 'sender', 'message',
+                   'delivery_status', 'created_at')
+
+# Type d'export -> (colonnes, requêtes archive puis base chaude, clé de lot, commandes seulement)
+KINDS = {
+    'orders': (CONVERSATION_COLUMNS, ('export_archived_conversations', 'export_conversations'), 'created_at', True),
+    'conversations': (CONVERSATION_COLUMNS, ('export_archived_conversations', 'export_conversations'), 'created_at', False),
+    'messages': (MESSAGE_COLUMNS, ('export_archived_messages', 'export_messages'), 'id', False),
+}
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def parse_filters(since=None, until=None, service_type=None, status=None):
+    """Filtres saisis (dates AAAA-MM-JJ, bornes incluses) -> paramètres des requêtes
+
+    Lève ValueError pour une date invalide.
+    """
+    def day(value):
+        return datetime.strptime(value, '%Y-%m-%d')
+
+    return {
+        # Bornes par défaut : dates valides aussi pour un horodatage PostgreSQL
+        'since': f"{day(since):%Y-%m-%d}" if since else '0001-01-01',
+        # created_at est 'AAAA-MM-JJ HH:MM:SS' : borne exclusive au lendemain
+        'until': f"{day(until) + timedelta(days=1):%Y-%m-%d}" if until else '9999-12-31',
+        'service_type': service_type or None,
+        'status': status or None,
+    }
+
+
+def iter_rows(kind, filters, batch_size=EXPORT_BATCH_SIZE):
+    """Lignes de l'export, lot par lot (archive d'abord : conversations plus anciennes)"""
+    columns, statements, key, orders_only = KINDS[kind]
+    db = storage.get_storage()
+    for name in statements:
+        params = dict(filters, orders_only=int(orders_only), limit=batch_size,
+                      after_at=filters['since'], after_id=0)
+        while True:
+            with db.read() as conn:
+                rows = storage.execute(conn, name, params).fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                break
+            last = rows[-1]
+            params['after_id'] = last['id']
+            if key == 'created_at':
+                params['after_at'] = last['created_at']
+
+
+def encode(rows, columns, fmt):
+    """Texte CSV (avec en-tête) ou JSONL, un morceau par lot de lignes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        if writer:
+            writer.writerow([row[column] for column in columns])
+        else:
+            buffer.write(json.dumps({column: row[column] for column in columns}, ensure_ascii=False))
+            buffer.write('\n')
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream(kind, fmt, filters, compress=False):
+    """Générateur d'octets de l'export, compressé en gzip si compress"""
+    columns = KINDS[kind][0]
+    chunks = (chunk.encode('utf-8') for chunk in encode(iter_rows(kind, filters), columns, fmt))
+    if not compress:
+        yield from chunks
+        return
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        packed = gzip.compress(chunk)
+        if packed:
+            yield packed
+    yield gzip.flush()
+
+
+def filename(kind, fmt, compress=False):
+    return f"lebonmot_{kind}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,171 @@
+"""
+Journal d'écriture différée - Le Bon Mot
+Les handlers du bot déposent leurs écritures dans une file en mémoire ;
+un thread dédié les vide par lots, dans une seule transaction par lot.
+File bornée : au-delà de JOURNAL_QUEUE_SIZE écritures en attente, le producteur
+attend que le disque rattrape son retard.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
+import storage
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOURNAL_FLUSH_INTERVAL', 0.05))
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', 500))
+JOURNAL_QUEUE_SIZE = int(os.getenv('JOURNAL_QUEUE_SIZE', 10000))
+
+JOURNAL_WAITS = metrics.Counter('lebonmot_journal_waits_total', "Écritures déposées sur un journal plein (producteur bloqué)")
+
+_STOP = object()
+
+
+class MessageJournal:
+    """File d'écritures vidée par un thread écrivain"""
+
+    def __init__(self, flush_interval=JOURNAL_FLUSH_INTERVAL, batch_size=JOURNAL_BATCH_SIZE,
+                 queue_size=JOURNAL_QUEUE_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        # Commandes déposées mais pas encore validées en base, par telegram_id
+        self._pending_orders = {}
+        self._pending_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='message-journal', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Vide la file puis arrête le thread écrivain"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        logger.info("💾 Journal des messages vidé et arrêté")
+
+    def depth(self):
+        """Nombre d'écritures en attente"""
+        return self._queue.qsize()
+
+    def append(self, writer, *args):
+        """Dépose writer(conn, *args) dans la file, sans attendre le disque (sauf file pleine)"""
+        if self._thread is None:
+            self.start()
+        item = (writer, args)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Contre-pression : le producteur attend une place plutôt que de
+            # laisser la mémoire (et _unflushed du cache d'états) grossir
+            JOURNAL_WAITS.inc()
+            self._queue.put(item)
+
+    def save_message(self, telegram_id, message, sender='client'):
+        self.append(storage.record_message, telegram_id, message, sender)
+
+    def insert_order(self, telegram_id, username, first_name, service_type, quantity, link, details,
+                     estimated_price):
+        # Visible du client (pending_orders) avant même son écriture
+        pending = {
+            'telegram_id': telegram_id, 'service_type': service_type, 'quantity': quantity,
+            'estimated_price': estimated_price,
+            'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._pending_lock:
+            self._pending_orders.setdefault(telegram_id, []).append(pending)
+        self.append(self._record_order, pending, username, first_name, link, details)
+
+    def pending_orders(self, telegram_id):
+        """Commandes du client encore en file, la plus récente en tête"""
+        with self._pending_lock:
+            return self._pending_orders.get(telegram_id, [])[::-1]
+
+    def _record_order(self, conn, pending, username, first_name, link, details):
+        """Écriture du journal ; la commande quitte pending_orders une fois la transaction validée"""
+        storage.record_order(conn, pending['telegram_id'], username, first_name, pending['service_type'],
+                             pending['quantity'], link, details, pending['estimated_price'])
+        storage.get_storage().after_commit(lambda: self._order_recorded(pending))
+
+    def _order_recorded(self, pending):
+        with self._pending_lock:
+            telegram_id = pending['telegram_id']
+            orders = [order for order in self._pending_orders.get(telegram_id, []) if order is not pending]
+            if orders:
+                self._pending_orders[telegram_id] = orders
+            else:
+                self._pending_orders.pop(telegram_id, None)
+
+    def flush(self):
+        """Bloque jusqu'à ce que toutes les écritures déposées soient en base"""
+        self._queue.join()
+
+    def _collect(self, first):
+        """Accumule un lot jusqu'à batch_size ou flush_interval"""
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with storage.get_storage().write() as conn:
+                for writer, args in batch:
+                    writer(conn, *args)
+        except Exception as e:
+            # Un enregistrement invalide ne doit pas faire perdre tout le lot
+            logger.error(f"❌ Lot du journal en échec ({e}), réécriture unitaire")
+            for writer, args in batch:
+                try:
+                    with storage.get_storage().write() as conn:
+                        writer(conn, *args)
+                except Exception as e:
+                    logger.error(f"❌ Écriture abandonnée {writer.__name__}{args}: {e}")
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            stopping = batch[-1] is _STOP
+            records = batch[:-1] if stopping else batch
+            if records:
+                self._write(records)
+            for _ in batch:
+                self._queue.task_done()
+            if stopping:
+                return
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Retourne le journal partagé (créé au premier appel)"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = MessageJournal()
+    return _journal
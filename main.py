@@ -5,11 +5,17 @@ Lance le bot Telegram et le dashboard admin
 import os
 import asyncio
 import logging
+import signal
 from threading import Thread
 from dotenv import load_dotenv
+from telegram import Update
 
 from bot_simple import setup_simple_bot
+import dashboard_simple
+import metrics
 from dashboard_simple import create_simple_dashboard, set_bot
+from journal import get_journal
+from supervisor import Supervisor
 
 load_dotenv()
 
@@ -23,12 +29,48 @@ logger = logging.getLogger(__name__)
 logging.getLogger('httpx').setLevel(logging.WARNING)
 logging.getLogger('telegram').setLevel(logging.WARNING)
 
+# Réception des updates : 'polling' (getUpdates) ou 'webhook' (POST sur /telegram/webhook)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+
+# Processus workers qui traitent les updates (répartis par client) ; 0 = un seul processus
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 0))
+
+# Serveur du dashboard : 'asgi' (uvicorn sur la boucle du bot) ou 'thread' (serveur Flask)
+DASHBOARD_SERVER = os.getenv('DASHBOARD_SERVER', 'asgi')
+
 def run_flask():
     """Lance le dashboard Flask"""
     app = create_simple_dashboard()
     port = int(os.getenv('PORT', 8081))
     app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
 
+def start_dashboard():
+    """Démarre le dashboard ; retourne la tâche asyncio du serveur ASGI (ou None en mode thread)"""
+    if DASHBOARD_SERVER == 'asgi':
+        try:
+            from asgi import create_server
+            server = create_server(create_simple_dashboard(), port=int(os.getenv('PORT', 8081)))
+            return asyncio.create_task(server.serve())
+        except ImportError:
+            logger.warning("⚠️  uvicorn non installé : dashboard en mode thread Flask")
+    
+    flask_thread = Thread(target=run_flask, daemon=True)
+    flask_thread.start()
+    return None
+
+async def start_webhook(bot_app):
+    """Déclare l'URL publique du webhook auprès de Telegram"""
+    if not WEBHOOK_URL or not dashboard_simple.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_URL et WEBHOOK_SECRET sont requis en mode webhook")
+    
+    await bot_app.bot.set_webhook(
+        url=f"{WEBHOOK_URL.rstrip('/')}/telegram/webhook",
+        secret_token=dashboard_simple.WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES
+    )
+    logger.info(f"🪝 Webhook actif : {WEBHOOK_URL}")
+
 async def main():
     """Point d'entrée principal"""
     logger.info("🚀 Démarrage du Bot Le Bon Mot - Version Simple...")
@@ -47,10 +89,16 @@ async def main():
         logger.info("="*50 + "\n")
         return
     
+    # SIGTERM (Railway, Docker) : même arrêt que Ctrl+C, les blocs finally
+    # vident la file d'envoi et le journal
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    
     # Démarrer Flask en priorité (pour Railway)
     logger.info("🌐 Démarrage du dashboard admin...")
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+    dashboard_task = start_dashboard()
     
     logger.info("✅ Dashboard admin démarré !")
     logger.info(f"📊 Dashboard: http://localhost:{os.getenv('PORT', 8081)}")
@@ -59,15 +107,24 @@ async def main():
     # Démarrer le bot Telegram
     try:
         logger.info("\n🤖 Démarrage du bot Telegram...")
-        bot_app = setup_simple_bot(CLIENT_BOT_TOKEN)
+        # BOT_WORKERS > 0 : ce processus reçoit les updates, les workers les traitent
+        supervisor = Supervisor(CLIENT_BOT_TOKEN, BOT_WORKERS) if BOT_WORKERS > 0 else None
+        bot_app = supervisor.build_application() if supervisor else setup_simple_bot(CLIENT_BOT_TOKEN)
         
         async with bot_app:
             await bot_app.start()
-            await bot_app.updater.start_polling()
+            if supervisor:
+                supervisor.start()
             
-            # Connecter le bot au dashboard pour les réponses
+            # Connecter le bot au dashboard pour les réponses (et le webhook)
             loop = asyncio.get_event_loop()
             set_bot(bot_app, loop)
+            lag_task = asyncio.create_task(metrics.watch_loop_lag())
+            
+            if BOT_MODE == 'webhook':
+                await start_webhook(bot_app)
+            else:
+                await bot_app.updater.start_polling()
             
             logger.info("✅ Bot Telegram démarré et connecté !")
             
@@ -81,7 +138,23 @@ async def main():
             logger.info("Ctrl+C pour arrêter\n")
             
             # Garder le bot actif
-            await asyncio.Event().wait()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                lag_task.cancel()
+                # Plus de nouvelles updates, puis fin de celles déjà reçues
+                if bot_app.updater.running:
+                    await bot_app.updater.stop()
+                await bot_app.stop()
+                if supervisor:
+                    await supervisor.stop()
+                # Terminer les envois en cours puis écrire les messages encore en file
+                if dashboard_simple.outbound_queue:
+                    try:
+                        await asyncio.wait_for(dashboard_simple.outbound_queue.stop(), 10)
+                    except asyncio.TimeoutError:
+                        logger.warning("⚠️  Envois Telegram non terminés à l'arrêt")
+                get_journal().stop()
     
     except Exception as e:
         logger.error(f"❌ Erreur bot Telegram : {e}", exc_info=True)
@@ -94,7 +167,7 @@ async def main():
 if __name__ == '__main__':
     try:
         asyncio.run(main())
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("\n👋 Arrêt du Bot Le Bon Mot...")
     except Exception as e:
         logger.error(f"❌ Erreur fatale: {e}", exc_info=True)
@@ -0,0 +1,99 @@
+"""
+Commandes d'administration - Le Bon Mot
+
+    python manage.py migrate         # applique les migrations en attente
+    python manage.py rebuild-stats   # recalcule les compteurs du dashboard
+    python manage.py rebuild-search  # reconstruit les index de recherche plein texte
+    python manage.py archive --days 90 [--vacuum]  # archive les conversations inactives
+    python manage.py export orders --format csv --since 2024-01-01 --output commandes.csv
+"""
+import argparse
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import export  # noqa: E402
+import migrations  # noqa: E402
+import storage  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def cmd_migrate(args):
+    with storage.get_storage().write() as conn:
+        version = migrations.migrate(conn)
+    logger.info(f"✅ Schéma à jour (v{version})")
+
+
+def cmd_rebuild_stats(args):
+    with storage.get_storage().write() as conn:
+        storage.rebuild_stats(conn)
+    logger.info(f"✅ Compteurs recalculés : {storage.dashboard_stats()}")
+
+
+def cmd_rebuild_search(args):
+    with storage.get_storage().write() as conn:
+        storage.rebuild_search(conn)
+    logger.info("✅ Index de recherche reconstruits")
+
+
+def cmd_archive(args):
+    moved = storage.archive_conversations(args.days)
+    logger.info(f"📦 {moved} conversation(s) inactive(s) depuis {args.days} jours archivée(s)")
+    if args.vacuum:
+        storage.get_storage().vacuum()
+        logger.info("✅ Base principale compactée")
+
+
+def cmd_export(args):
+    try:
+        filters = export.parse_filters(args.since, args.until, args.service_type, args.status)
+    except ValueError:
+        sys.exit("❌ Dates attendues au format AAAA-MM-JJ")
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export.stream(args.kind, args.format, filters, args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    if args.output:
+        logger.info(f"✅ Export {args.kind} écrit dans {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Administration Le Bon Mot")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('migrate', help="applique les migrations en attente").set_defaults(func=cmd_migrate)
+    commands.add_parser('rebuild-stats', help="recalcule les compteurs du dashboard").set_defaults(func=cmd_rebuild_stats)
+    commands.add_parser('rebuild-search', help="reconstruit les index de recherche").set_defaults(func=cmd_rebuild_search)
+
+    archive = commands.add_parser('archive', help="archive les conversations inactives")
+    archive.add_argument('--days', type=int, default=int(os.getenv('ARCHIVE_DAYS', 90)),
+                         help="jours sans activité avant archivage (défaut : ARCHIVE_DAYS ou 90)")
+    archive.add_argument('--vacuum', action='store_true', help="compacte ensuite la base principale")
+    archive.set_defaults(func=cmd_archive)
+
+    exporter = commands.add_parser('export', help="exporte commandes, conversations ou messages")
+    exporter.add_argument('kind', choices=sorted(export.KINDS))
+    exporter.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+    exporter.add_argument('--since', help="date de début incluse (AAAA-MM-JJ)")
+    exporter.add_argument('--until', help="date de fin incluse (AAAA-MM-JJ)")
+    exporter.add_argument('--service-type', help="type de service (google, trustpilot, forum, pagesjaunes, autre_plateforme, suppression)")
+    exporter.add_argument('--status', help="statut de la conversation")
+    exporter.add_argument('--gzip', action='store_true', help="compresse la sortie")
+    exporter.add_argument('--output', help="fichier de sortie (défaut : sortie standard)")
+    exporter.set_defaults(func=cmd_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Métriques Prometheus - Le Bon Mot
+Histogrammes de latence (handlers, routes, requêtes SQL), compteurs et jauges,
+exposés au format texte sur /metrics. Sans dépendance : un verrou par métrique.
+En mode multi-processus, les workers envoient leurs valeurs (snapshot) au
+superviseur, qui les additionne aux siennes (merge_remote).
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 0.5))
+
+# Secondes : de 0,1 ms (requête SQL) à 10 s (appel Telegram lent)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            samples = dict(self._values)
+        for values in _remote_values(self.name):
+            for key, value in values.items():
+                samples[key] = self._combine(samples.get(key), value)
+        for key, value in samples.items():
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _copy(self, value):
+        return value
+
+    def _combine(self, local, remote):
+        """Valeur locale + valeur d'un autre processus (même étiquettes)"""
+        return remote if local is None else local + remote
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_labels(self.labelnames, key)} {_number(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Valeur fixée (set) ou lue à chaque collecte (set_function)"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        self.set(function, **labels)
+
+    def _combine(self, local, remote):
+        # Une jauge ne s'additionne pas : valeur locale, sinon la plus haute
+        if local is None:
+            return remote
+        return local if callable(local) else max(local, remote)
+
+    def _samples(self, key, value):
+        if callable(value):
+            value = value()
+            if value is None:
+                return []
+        return super()._samples(key, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _copy(self, value):
+        buckets, total, count = value
+        return [list(buckets), total, count]
+
+    def _combine(self, local, remote):
+        if local is None:
+            return self._copy(remote)
+        return [[a + b for a, b in zip(local[0], remote[0])], local[1] + remote[1], local[2] + remote[2]]
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, value):
+        buckets, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, hits in zip(self.buckets, buckets):
+            cumulative += hits
+            le = f'le="{_number(bound)}"'
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+REGISTRY = []
+
+# Valeurs des autres processus : dernier snapshot par source, et cumul des sources
+# disparues (compteurs et histogrammes d'un worker relancé restent acquis)
+_remote = {}
+_retired = {}
+_remote_lock = threading.Lock()
+
+
+def _remote_values(name):
+    with _remote_lock:
+        sources = [snapshot[name] for snapshot in _remote.values() if name in snapshot]
+        if name in _retired:
+            sources.append(_retired[name])
+    return sources
+
+
+def snapshot():
+    """Valeurs locales picklables (sans les jauges calculées), pour merge_remote"""
+    data = {}
+    for metric in REGISTRY:
+        with metric._lock:
+            values = {key: metric._copy(value) for key, value in metric._values.items() if not callable(value)}
+        if values:
+            data[metric.name] = values
+    return data
+
+
+def merge_remote(source, data):
+    """Remplace les valeurs reçues de source (ex. 'worker-0') par son dernier snapshot"""
+    with _remote_lock:
+        _remote[source] = data
+
+
+def retire_remote(source):
+    """Source arrêtée : ses compteurs et histogrammes sont cumulés, ses jauges oubliées"""
+    by_name = {metric.name: metric for metric in REGISTRY}
+    with _remote_lock:
+        data = _remote.pop(source, {})
+        for name, values in data.items():
+            metric = by_name.get(name)
+            if metric is None or isinstance(metric, Gauge):
+                continue
+            retired = _retired.setdefault(name, {})
+            for key, value in values.items():
+                retired[key] = metric._combine(retired.get(key), value)
+
+
+def render():
+    """Toutes les métriques au format texte Prometheus (version 0.0.4)"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+HANDLER_LATENCY = Histogram(
+    'lebonmot_handler_seconds', "Durée des handlers du bot (commande, bouton, étape)", ('handler',))
+ROUTE_LATENCY = Histogram(
+    'lebonmot_http_request_seconds', "Durée des requêtes du dashboard", ('method', 'route', 'status'))
+SQL_LATENCY = Histogram(
+    'lebonmot_sql_seconds', "Durée d'exécution des requêtes nommées (storage.STATEMENTS)", ('statement',))
+TELEGRAM_LATENCY = Histogram(
+    'lebonmot_telegram_seconds', "Durée des appels à l'API Telegram de la file d'envoi", ('method',))
+MESSAGES = Counter('lebonmot_messages_total', "Messages reçus (client) et réponses envoyées (admin)", ('sender',))
+ORDERS = Counter('lebonmot_orders_total', "Devis générés", ('service',))
+QUEUE_DEPTH = Gauge('lebonmot_queue_depth', "Éléments en attente dans les files internes", ('queue',))
+LOOP_LAG = Gauge('lebonmot_event_loop_lag_seconds', "Dernier retard mesuré de la boucle asyncio du bot")
+LOOP_LAG_HISTOGRAM = Histogram(
+    'lebonmot_event_loop_lag_distribution_seconds', "Retards de la boucle asyncio du bot",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+
+async def watch_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """Tâche de fond : mesure le retard de réveil d'un sleep sur la boucle"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
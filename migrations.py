@@ -0,0 +1,320 @@
+"""
+Migrations de schéma versionnées - Le Bon Mot
+Chaque migration est appliquée une seule fois, dans sa propre transaction,
+et enregistrée dans la table schema_version.
+"""
+import logging
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+# (version, nom, étapes) : une étape est une requête SQL ou une fonction f(conn)
+MIGRATIONS = [
+    (1, 'tables initiales', (
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            service_type TEXT,
+            quantity TEXT,
+            link TEXT,
+            details TEXT,
+            estimated_price TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER,
+            telegram_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        )
+        ''',
+    )),
+    (2, 'index conversations et messages', (
+        'CREATE INDEX IF NOT EXISTS idx_conversations_telegram_created ON conversations (telegram_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations (created_at)',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversations_orders_created ON conversations (created_at)
+        WHERE service_type IS NOT NULL
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages (conversation_id, created_at)',
+    )),
+    (3, 'état des conversations persistant', (
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            telegram_id INTEGER PRIMARY KEY,
+            step TEXT,
+            service_type TEXT,
+            username TEXT,
+            first_name TEXT,
+            quantity TEXT,
+            link TEXT,
+            details TEXT,
+            estimated_price TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    )),
+    (4, 'compteurs du dashboard', (
+        '''
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        storage.rebuild_stats,
+    )),
+    (5, 'dernier message et compteur sur conversations', (
+        'ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE conversations ADD COLUMN last_message_preview TEXT',
+        'ALTER TABLE conversations ADD COLUMN last_message_at TIMESTAMP',
+        'ALTER TABLE conversations ADD COLUMN last_sender TEXT',
+        '''
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id),
+            last_message_preview = (
+                SELECT substr(message, 1, 200) FROM messages WHERE conversation_id = conversations.id
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            ),
+            last_message_at = (SELECT MAX(created_at) FROM messages WHERE conversation_id = conversations.id),
+            last_sender = (
+                SELECT sender FROM messages WHERE conversation_id = conversations.id
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            )
+        ''',
+    )),
+    (6, "statut d'envoi des réponses admin", (
+        'ALTER TABLE messages ADD COLUMN delivery_status TEXT',
+    )),
+    (7, 'index messages par conversation et id (flux SSE)', (
+        'CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id, id)',
+        # Remplacé par l'index ci-dessus pour toutes les lectures par conversation
+        'DROP INDEX IF EXISTS idx_messages_conversation_created',
+    )),
+    (8, 'recherche plein texte (FTS5)', (
+        # Index externes : le texte reste dans messages / conversations, les triggers
+        # tiennent l'index à jour (uniquement quand les colonnes indexées changent)
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message, conversation_id UNINDEXED,
+            content='messages', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message, conversation_id)
+            VALUES (new.id, new.message, new.conversation_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, conversation_id)
+            VALUES ('delete', old.id, old.message, old.conversation_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message, conversation_id ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, conversation_id)
+            VALUES ('delete', old.id, old.message, old.conversation_id);
+            INSERT INTO messages_fts (rowid, message, conversation_id)
+            VALUES (new.id, new.message, new.conversation_id);
+        END
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+            username, first_name, link, details,
+            content='conversations', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts (rowid, username, first_name, link, details)
+            VALUES (new.id, new.username, new.first_name, new.link, new.details);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, username, first_name, link, details)
+            VALUES ('delete', old.id, old.username, old.first_name, old.link, old.details);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_update
+        AFTER UPDATE OF username, first_name, link, details ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, username, first_name, link, details)
+            VALUES ('delete', old.id, old.username, old.first_name, old.link, old.details);
+            INSERT INTO conversations_fts (rowid, username, first_name, link, details)
+            VALUES (new.id, new.username, new.first_name, new.link, new.details);
+        END
+        ''',
+        storage.rebuild_search,
+    )),
+    (9, 'index messages par date (exports)', (
+        # (created_at) + rowid implicite : premier id d'une plage de dates
+        'CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at)',
+    )),
+]
+
+# Backend PostgreSQL (STORAGE_BACKEND=postgres) : schéma équivalent à la version 9
+# SQLite. Horodatages UTC sans fuseau (session en TimeZone=UTC), archive dans un
+# schéma de la même base, recherche par colonnes tsvector générées + index GIN.
+POSTGRES_MIGRATIONS = [
+    (1, 'schéma initial (équivalent SQLite v8)', (
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            service_type TEXT,
+            quantity TEXT,
+            link TEXT,
+            details TEXT,
+            estimated_price TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0),
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_message_preview TEXT,
+            last_message_at TIMESTAMP(0),
+            last_sender TEXT,
+            search TSVECTOR GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(username, '') || ' ' || coalesce(first_name, '')), 'A')
+                || setweight(to_tsvector('simple', coalesce(link, '') || ' ' || coalesce(details, '')), 'B')
+            ) STORED
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            conversation_id BIGINT REFERENCES conversations (id),
+            telegram_id BIGINT NOT NULL,
+            message TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            created_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0),
+            delivery_status TEXT,
+            search TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', message)) STORED
+        )
+        ''',
+        # Pagination par clé (created_at, id) : l'id fait partie de l'index (pas de rowid implicite)
+        'CREATE INDEX IF NOT EXISTS idx_conversations_telegram_created ON conversations (telegram_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations (created_at, id)',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversations_orders_created ON conversations (created_at, id)
+        WHERE service_type IS NOT NULL
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_messages_search ON messages USING GIN (search)',
+        'CREATE INDEX IF NOT EXISTS idx_conversations_search ON conversations USING GIN (search)',
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            telegram_id BIGINT PRIMARY KEY,
+            step TEXT,
+            service_type TEXT,
+            username TEXT,
+            first_name TEXT,
+            quantity TEXT,
+            link TEXT,
+            details TEXT,
+            estimated_price TEXT,
+            updated_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+        ''',
+        # Archive : le texte long est déjà compressé par PostgreSQL (TOAST)
+        'CREATE SCHEMA IF NOT EXISTS archive',
+        '''
+        CREATE TABLE IF NOT EXISTS archive.conversations (
+            id BIGINT PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            service_type TEXT,
+            quantity TEXT,
+            link TEXT,
+            details TEXT,
+            estimated_price TEXT,
+            status TEXT,
+            created_at TIMESTAMP(0),
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_message_preview TEXT,
+            last_message_at TIMESTAMP(0),
+            last_sender TEXT,
+            archived_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archive.messages (
+            id BIGINT PRIMARY KEY,
+            conversation_id BIGINT NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            message TEXT,
+            sender TEXT NOT NULL,
+            created_at TIMESTAMP(0),
+            delivery_status TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_archive_conversations_telegram ON archive.conversations (telegram_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_archive_messages_conversation ON archive.messages (conversation_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_archive_conversations_created ON archive.conversations (created_at, id)',
+        '''
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        storage.rebuild_stats,
+    )),
+    (2, 'index messages par date (exports)', (
+        'CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_archive_messages_created ON archive.messages (created_at, id)',
+    )),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn, migrations=None):
+    """Applique les migrations manquantes du backend ; retourne la version finale"""
+    if migrations is None:
+        migrations = POSTGRES_MIGRATIONS if storage.get_storage().dialect == 'postgres' else MIGRATIONS
+    version = current_version(conn)
+    conn.commit()
+
+    for number, name, steps in migrations:
+        if number <= version:
+            continue
+        storage.execute(conn, 'begin_migration')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            storage.execute(conn, 'record_migration', (number, name))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        version = number
+        logger.info(f"🗄️ Migration {number} appliquée : {name}")
+
+    return version
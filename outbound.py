@@ -0,0 +1,236 @@
+"""
+File d'envoi Telegram - Le Bon Mot
+Envois limités en débit (global + par chat), relancés avec backoff
+exponentiel (en respectant RetryAfter) et suivis en base (delivery_status).
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+import metrics
+import storage
+from journal import get_journal
+
+logger = logging.getLogger(__name__)
+
+# Limites Telegram : ~30 messages/s au total, ~1 message/s par chat
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', 8))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv('OUTBOUND_MAX_ATTEMPTS', 5))
+OUTBOUND_BACKOFF = float(os.getenv('OUTBOUND_BACKOFF', 1))
+
+
+class TokenBucket:
+    """Seau à jetons : rate jetons/s, au plus capacity en réserve"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def reserve(self):
+        """Prend un jeton si possible (0), sinon délai avant le prochain jeton (s)"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while delay := self.reserve():
+            await asyncio.sleep(delay)
+
+
+class OutboundMessage:
+    __slots__ = ('chat_id', 'text', 'message_id', 'parse_mode', 'attempts', 'queued_at')
+
+    def __init__(self, chat_id, text, message_id=None, parse_mode='Markdown'):
+        self.chat_id = chat_id
+        self.text = text
+        self.message_id = message_id
+        self.parse_mode = parse_mode
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class OutboundQueue:
+    """Workers asyncio qui vident la file dans les limites de débit
+
+    Une file FIFO par chat ; la file des workers ne contient que des chats prêts,
+    chacun une seule fois : un chat limité (seau vide, nouvel essai en attente)
+    est remis en file plus tard au lieu d'immobiliser un worker.
+    """
+
+    def __init__(self, bot, global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE,
+                 workers=OUTBOUND_WORKERS, max_attempts=OUTBOUND_MAX_ATTEMPTS, backoff=OUTBOUND_BACKOFF):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.loop = None
+        self._queue = None
+        self._tasks = []
+        # Sans réserve : même après un temps calme, jamais plus de global_rate envois sur une seconde
+        self._global = TokenBucket(global_rate, 1)
+        self._chats = {}
+        # chat_id -> messages en attente (le premier est en cours d'envoi)
+        self._pending = {}
+        self._depth = 0
+        self._drained = None
+        # Métriques
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=1000)
+
+    def start(self, loop=None):
+        """À appeler depuis la boucle du bot"""
+        self.loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = [self.loop.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def stop(self):
+        """Attend la fin des envois en cours puis arrête les workers"""
+        await self._drained.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, chat_id, text, message_id=None, parse_mode='Markdown'):
+        """Met un message en file ; utilisable depuis n'importe quel thread"""
+        job = OutboundMessage(chat_id, text, message_id, parse_mode)
+        self.loop.call_soon_threadsafe(self._enqueue, job)
+        return job
+
+    def depth(self):
+        return self._depth
+
+    def _enqueue(self, job):
+        self._depth += 1
+        self._drained.clear()
+        jobs = self._pending.get(job.chat_id)
+        if jobs is not None:
+            # Chat déjà en file ou en cours : le message attend son tour
+            jobs.append(job)
+            return
+        self._pending[job.chat_id] = deque([job])
+        self._queue.put_nowait(job.chat_id)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'depth': self.depth(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else None,
+            'latency_p99': latencies[int(len(latencies) * 0.99) - 1] if latencies else None,
+        }
+
+    def _chat(self, chat_id):
+        if chat_id not in self._chats:
+            if len(self._chats) > 10000:
+                self._prune()
+            self._chats[chat_id] = TokenBucket(self.chat_rate, 1)
+        return self._chats[chat_id]
+
+    def _prune(self):
+        """Oublie les chats inactifs (seau plein, aucun message en attente)"""
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.idle() and c not in self._pending]:
+            del self._chats[chat_id]
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._queue.get()
+            try:
+                await self._serve(chat_id)
+            finally:
+                self._queue.task_done()
+
+    async def _serve(self, chat_id):
+        """Un envoi du premier message du chat, puis le chat repasse en file"""
+        jobs = self._pending[chat_id]
+        job = jobs[0]
+        delay = self._chat(chat_id).reserve()
+        if not delay:
+            await self._global.acquire()
+            try:
+                delay = await self._attempt(job)
+            except Exception as e:
+                logger.error(f"❌ Envoi vers {job.chat_id} abandonné : {e}")
+                self._finish(job, 'failed')
+                delay = None
+            if delay is None:
+                self._done(chat_id, jobs)
+                return
+            self.retries += 1
+        # Seau du chat vide ou nouvel essai : un autre chat prend le worker
+        self.loop.call_later(delay, self._queue.put_nowait, chat_id)
+
+    async def _attempt(self, job):
+        """Envoie le message ; None si envoyé, sinon délai avant un nouvel essai"""
+        job.attempts += 1
+        try:
+            with metrics.TELEGRAM_LATENCY.time(method='send_message'):
+                await self.bot.send_message(chat_id=job.chat_id, text=job.text, parse_mode=job.parse_mode)
+        except RetryAfter as e:
+            delay = e.retry_after
+            if isinstance(delay, timedelta):
+                delay = delay.total_seconds()
+            logger.warning(f"⏳ Limite Telegram atteinte, nouvel essai dans {delay}s")
+        except BadRequest:
+            # Message refusé par Telegram : inutile de réessayer
+            raise
+        except TimedOut:
+            # La requête a pu atteindre Telegram : un nouvel essai risquerait un doublon
+            raise
+        except NetworkError as e:
+            # Forbidden (bot bloqué) remonte directement
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            logger.warning(f"⚠️  Erreur réseau vers {job.chat_id} ({e}), nouvel essai dans {delay}s")
+        else:
+            self._finish(job, 'sent')
+            return None
+
+        if job.attempts >= self.max_attempts:
+            raise RuntimeError(f"{job.attempts} tentatives échouées")
+        return delay
+
+    def _done(self, chat_id, jobs):
+        jobs.popleft()
+        self._depth -= 1
+        if jobs:
+            self._queue.put_nowait(chat_id)
+        else:
+            del self._pending[chat_id]
+        if not self._depth:
+            self._drained.set()
+
+    def _finish(self, job, status):
+        if status == 'sent':
+            self.sent += 1
+            self.latencies.append(time.monotonic() - job.queued_at)
+        else:
+            self.failed += 1
+        if job.message_id is not None:
+            get_journal().append(storage.record_delivery, job.message_id, status)
@@ -0,0 +1,70 @@
+"""
+Pub/sub en mémoire - Le Bon Mot
+Diffuse les nouveaux messages (et statuts d'envoi) d'une conversation aux
+flux SSE ouverts du dashboard. Publication après commit, depuis n'importe quel thread.
+"""
+import os
+import queue
+import threading
+
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', 32))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+
+
+class Subscription:
+    """File d'un abonné ; overflowed signale des événements perdus (à relire en base)"""
+    __slots__ = ('topic', 'queue', 'overflowed')
+
+    def __init__(self, topic, size=SSE_QUEUE_SIZE):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Prochain événement, ou None après timeout secondes"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    def __init__(self):
+        self._topics = {}
+        self._lock = threading.Lock()
+        # Processus worker (supervisor.py) : forward(topic, kind, data) relaie
+        # la publication au processus du dashboard
+        self.forward = None
+
+    def subscribe(self, topic):
+        subscription = Subscription(topic)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+    def publish(self, topic, kind, data):
+        """Envoie (kind, data) aux abonnés du sujet ; ne bloque jamais l'appelant"""
+        if self.forward is not None:
+            self.forward(topic, kind, data)
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait((kind, data))
+            except queue.Full:
+                subscription.overflowed = True
+
+    def count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._topics.values())
+
+
+broker = Broker()
@@ -0,0 +1,102 @@
+"""
+Traceur de requêtes lentes - Le Bon Mot
+Optionnel (SQL_TRACE_MS > 0) : les SQL_TRACE_SIZE requêtes nommées les plus
+lentes au-dessus du seuil sont gardées avec leur plan d'exécution (tas min :
+une rafale de requêtes à peine lentes ne chasse pas les pires), et chaque
+requête nommée garde son nombre de passages lents, son pire et son total,
+affichés sur la page /slow-queries du dashboard.
+"""
+import logging
+import os
+import heapq
+import itertools
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Seuil en millisecondes ; 0 désactive le traceur
+SQL_TRACE_MS = float(os.getenv('SQL_TRACE_MS', 0))
+SQL_TRACE_SIZE = int(os.getenv('SQL_TRACE_SIZE', 200))
+
+
+class SlowQuery:
+    __slots__ = ('name', 'duration_ms', 'params', 'plan', 'at', 'thread')
+
+    def __init__(self, name, duration_ms, params, plan):
+        self.name = name
+        self.duration_ms = duration_ms
+        self.params = params
+        self.plan = plan
+        self.at = datetime.now()
+        self.thread = threading.current_thread().name
+
+
+class SlowQueryLog:
+    """Les size requêtes les plus lentes au-dessus du seuil, et un bilan par requête nommée"""
+
+    def __init__(self, threshold_ms=SQL_TRACE_MS, size=SQL_TRACE_SIZE):
+        self.threshold = threshold_ms / 1000
+        self.threshold_ms = threshold_ms
+        self.size = size
+        # Tas min (durée, ordre d'arrivée, entrée) : la moins lente en tête
+        self._entries = []
+        self._order = itertools.count()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def record(self, conn, name, sql, params, duration, explain):
+        """Appelé par storage.execute pour une requête au-dessus du seuil
+
+        explain(conn, sql, params) : plan selon le backend (EXPLAIN QUERY PLAN, EXPLAIN).
+        """
+        duration_ms = duration * 1000
+        with self._lock:
+            stats = self._stats.setdefault(name, {'name': name, 'count': 0, 'max_ms': 0.0, 'total_ms': 0.0})
+            stats['count'] += 1
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['total_ms'] += duration_ms
+            kept = len(self._entries) < self.size or duration_ms > self._entries[0][0]
+        logger.warning(f"🐢 Requête lente {name} : {duration_ms:.1f} ms")
+        if not kept:
+            # Moins lente que toutes les entrées gardées : pas de plan à calculer
+            return
+        try:
+            plan = explain(conn, sql, params)
+        except Exception as e:
+            plan = [f"plan indisponible : {e}"]
+        # Paramètres nommés (search, archive_*, export_*) : dict avec ses valeurs
+        shown = params if isinstance(params, dict) else tuple(params)
+        entry = SlowQuery(name, duration_ms, repr(shown)[:200], plan)
+        item = (duration_ms, next(self._order), entry)
+        with self._lock:
+            if len(self._entries) < self.size:
+                heapq.heappush(self._entries, item)
+            elif duration_ms > self._entries[0][0]:
+                heapq.heapreplace(self._entries, item)
+
+    def worst(self, limit=None):
+        """Entrées gardées, les plus lentes d'abord"""
+        with self._lock:
+            entries = [entry for _, _, entry in sorted(self._entries, reverse=True)]
+        return entries[:limit] if limit else entries
+
+    def summary(self):
+        """Par requête : nombre de passages lents, pire et durée moyenne (ms), depuis le dernier clear"""
+        with self._lock:
+            by_name = [dict(stats) for stats in self._stats.values()]
+        for stats in by_name:
+            stats['avg_ms'] = stats['total_ms'] / stats['count']
+        return sorted(by_name, key=lambda s: s['max_ms'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+
+slow_queries = SlowQueryLog()
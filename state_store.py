@@ -0,0 +1,140 @@
+"""
+État des conversations - Le Bon Mot
+Cache LRU borné (avec expiration) devant la table SQLite conversation_state :
+la mémoire reste plate quel que soit le nombre d'utilisateurs et un
+redémarrage reprend chaque client à son étape enregistrée.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+from db_executor import get_db_executor
+from journal import get_journal
+
+STATE_CACHE_SIZE = int(os.getenv('STATE_CACHE_SIZE', 10000))
+STATE_TTL = float(os.getenv('STATE_TTL', 3600))
+
+
+class ConversationState:
+    """Enregistrement à champs fixes (pas de __dict__ par utilisateur)"""
+
+    FIELDS = ('step', 'service_type', 'username', 'first_name', 'quantity', 'link', 'details', 'estimated_price')
+    __slots__ = ('telegram_id', 'touched') + FIELDS
+
+    def __init__(self, telegram_id, step=None, service_type=None, username=None, first_name=None,
+                 quantity=None, link=None, details=None, estimated_price=None):
+        self.telegram_id = telegram_id
+        self.step = step
+        self.service_type = service_type
+        self.username = username
+        self.first_name = first_name
+        self.quantity = quantity
+        self.link = link
+        self.details = details
+        self.estimated_price = estimated_price
+        self.touched = time.monotonic()
+
+    # Accès façon dict, comme l'ancien user_conversations[telegram_id]
+    def get(self, key, default=None):
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def values(self):
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+
+class ConversationStateStore:
+    """LRU + TTL en mémoire, persistance write-through via le journal"""
+
+    def __init__(self, capacity=STATE_CACHE_SIZE, ttl=STATE_TTL, persist=True):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.persist = persist
+        self._cache = OrderedDict()
+        # États déposés dans le journal mais pas encore validés en base :
+        # telegram_id -> valeurs, retiré au commit de la dernière sauvegarde
+        self._unflushed = {}
+        self._unflushed_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def get(self, telegram_id):
+        """État du client : cache, sinon base (lue sur le thread base de données), sinon état vierge"""
+        state = self._cache.get(telegram_id)
+        now = time.monotonic()
+        if state is not None and now - state.touched <= self.ttl:
+            state.touched = now
+            self._cache.move_to_end(telegram_id)
+            return state
+
+        state = await get_db_executor().run(self._load, telegram_id) if self.persist else None
+        state = state or ConversationState(telegram_id)
+        self._put(state)
+        return state
+
+    def reset(self, telegram_id, step, **fields):
+        """Remplace l'état du client et l'enregistre"""
+        state = ConversationState(telegram_id, step, **fields)
+        self._put(state)
+        self.save(state)
+        return state
+
+    def save(self, state):
+        state.touched = time.monotonic()
+        if self.persist:
+            values = state.values()
+            with self._unflushed_lock:
+                self._unflushed[state.telegram_id] = values
+            get_journal().append(self._record, state.telegram_id, values)
+
+    def _record(self, conn, telegram_id, values):
+        """Écriture du journal ; l'entrée en attente tombe une fois la transaction validée"""
+        storage.record_state(conn, telegram_id, *values)
+        storage.get_storage().after_commit(lambda: self._flushed(telegram_id, values))
+
+    def _flushed(self, telegram_id, values):
+        with self._unflushed_lock:
+            # Une sauvegarde plus récente peut être encore en file
+            if self._unflushed.get(telegram_id) is values:
+                del self._unflushed[telegram_id]
+                if not self._unflushed:
+                    # Un dict ne rétrécit pas : table libérée après une rafale
+                    self._unflushed = {}
+
+    def _put(self, state):
+        self._cache[state.telegram_id] = state
+        self._cache.move_to_end(state.telegram_id)
+        self._evict()
+
+    def _evict(self):
+        """Retire les entrées expirées (en tête = les plus anciennes) puis le surplus LRU"""
+        cache = self._cache
+        deadline = time.monotonic() - self.ttl
+        while cache:
+            oldest = next(iter(cache.values()))
+            if oldest.touched >= deadline and len(cache) <= self.capacity:
+                break
+            cache.popitem(last=False)
+
+    def _load(self, telegram_id):
+        """Lecture en base, sur le thread base de données"""
+        with self._unflushed_lock:
+            values = self._unflushed.get(telegram_id)
+        if values is not None:
+            # Dernière sauvegarde encore dans le journal : plus récente que la base
+            return ConversationState(telegram_id, *values)
+        row = storage.load_state(telegram_id)
+        if row is None:
+            return None
+        return ConversationState(telegram_id, *(row[field] for field in ConversationState.FIELDS))
@@ -0,0 +1,845 @@
+"""
+Stockage partagé - Le Bon Mot
+Les fonctions de ce module sont l'interface d'accès aux données du bot et du
+dashboard ; elles passent par des requêtes nommées (STATEMENTS) exécutées sur
+le backend choisi par STORAGE_BACKEND : SQLite (défaut, connexions longues :
+1 écrivain + pool de lecteurs) ou PostgreSQL (storage_postgres).
+"""
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import metrics
+from pubsub import broker
+from slow_queries import slow_queries
+
+logger = logging.getLogger(__name__)
+
+# sqlite (fichier DB_PATH) ou postgres (DATABASE_URL, pool de DB_READERS connexions)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+DB_PATH = os.getenv('DB_PATH', 'lebonmot_simple.db')
+READER_POOL_SIZE = int(os.getenv('DB_READERS', 4))
+# Base d'archive attachée (schéma "archive") : par défaut à côté de la base principale
+ARCHIVE_PATH = os.getenv('ARCHIVE_PATH', '')
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+# Recherche : classement bm25 parmi les SEARCH_CANDIDATES correspondances les plus récentes
+# de chaque index, pour un coût borné même sur des termes très fréquents
+SEARCH_CANDIDATES = int(os.getenv('SEARCH_CANDIDATES', 500))
+
+# Réglages appliqués à chaque connexion
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=134217728',
+)
+
+# Schéma "archive" : fichier attaché à chaque connexion, cycle de vie distinct de la
+# base principale (déplacé, sauvegardé à part...), donc créé au besoin à l'ouverture
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS archive.conversations (
+        id INTEGER PRIMARY KEY,
+        telegram_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        service_type TEXT,
+        quantity TEXT,
+        link TEXT,
+        details TEXT,
+        estimated_price TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        last_message_preview TEXT,
+        last_message_at TIMESTAMP,
+        last_sender TEXT,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.messages (
+        id INTEGER PRIMARY KEY,
+        conversation_id INTEGER NOT NULL,
+        telegram_id INTEGER NOT NULL,
+        message,  -- texte brut ou compressé zlib (zip_text)
+        sender TEXT NOT NULL,
+        created_at TIMESTAMP,
+        delivery_status TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_conversations_telegram ON conversations (telegram_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_messages_conversation ON messages (conversation_id, id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_conversations_created ON conversations (created_at)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_messages_created ON messages (created_at)',
+)
+
+# Requêtes nommées : le texte est constant, donc chaque connexion
+# longue ne le prépare qu'une fois (cache de statements de sqlite3)
+STATEMENTS = {
+    'latest_conversation': '''
+        SELECT id FROM conversations WHERE telegram_id = ? ORDER BY created_at DESC LIMIT 1
+    ''',
+    # Insertions : RETURNING id, commun à SQLite et PostgreSQL (pas de lastrowid chez psycopg)
+    'insert_conversation': 'INSERT INTO conversations (telegram_id) VALUES (?) RETURNING id',
+    'insert_message': '''
+        INSERT INTO messages (conversation_id, telegram_id, message, sender)
+        VALUES (?, ?, ?, ?)
+        RETURNING id
+    ''',
+    'insert_order': '''
+        INSERT INTO conversations (telegram_id, username, first_name, service_type, quantity, link, details, estimated_price)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+    ''',
+    'recent_orders': '''
+        SELECT * FROM conversations
+        WHERE telegram_id = ? AND service_type IS NOT NULL
+        ORDER BY created_at DESC
+        LIMIT ?
+    ''',
+    # Compteurs du dashboard, tenus à jour dans la transaction de chaque écriture
+    'read_stats': 'SELECT name, value FROM stats',
+    'bump_stat': 'UPDATE stats SET value = value + ? WHERE name = ?',
+    'clear_stats': 'DELETE FROM stats',
+    # Base chaude + archive (une conversation restaurée existe dans les deux)
+    'rebuild_stats': '''
+        INSERT INTO stats (name, value)
+        WITH all_conversations AS (
+            SELECT id, telegram_id, service_type FROM conversations
+            UNION ALL
+            SELECT id, telegram_id, service_type FROM archive.conversations
+            WHERE id NOT IN (SELECT id FROM conversations)
+        ), all_messages AS (
+            SELECT sender FROM messages
+            UNION ALL
+            SELECT sender FROM archive.messages
+            WHERE id NOT IN (SELECT id FROM messages)
+        )
+        SELECT 'total_orders', COUNT(*) FROM all_conversations WHERE service_type IS NOT NULL
+        UNION ALL SELECT 'total_clients', COUNT(DISTINCT telegram_id) FROM all_conversations
+        UNION ALL SELECT 'total_messages', COUNT(*) FROM all_messages WHERE sender = 'client'
+        UNION ALL SELECT 'total_replies', COUNT(*) FROM all_messages WHERE sender = 'admin'
+    ''',
+    # Pagination par clé (created_at, id) : coût constant quelle que soit la page
+    'conversations_page': '''
+        SELECT c.*
+        FROM conversations c
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ?
+    ''',
+    'conversations_page_after': '''
+        SELECT c.*
+        FROM conversations c
+        WHERE (c.created_at, c.id) < (?, ?)
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ?
+    ''',
+    'orders_page': '''
+        SELECT c.*
+        FROM conversations c
+        WHERE c.service_type IS NOT NULL
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ?
+    ''',
+    'orders_page_after': '''
+        SELECT c.*
+        FROM conversations c
+        WHERE c.service_type IS NOT NULL AND (c.created_at, c.id) < (?, ?)
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ?
+    ''',
+    'touch_conversation': '''
+        UPDATE conversations
+        SET message_count = message_count + 1,
+            last_message_preview = substr(?, 1, 200),
+            last_message_at = CURRENT_TIMESTAMP,
+            last_sender = ?
+        WHERE id = ?
+    ''',
+    'insert_admin_message': '''
+        INSERT INTO messages (conversation_id, telegram_id, message, sender, delivery_status)
+        VALUES (?, ?, ?, 'admin', 'pending')
+        RETURNING id
+    ''',
+    'set_delivery_status': 'UPDATE messages SET delivery_status = ? WHERE id = ? RETURNING conversation_id',
+    'get_conversation': 'SELECT * FROM conversations WHERE id = ?',
+    'conversation_telegram_id': 'SELECT telegram_id FROM conversations WHERE id = ?',
+    # Fenêtre de messages (les plus récents d'abord), puis pages plus anciennes par id
+    'conversation_messages': '''
+        SELECT * FROM messages
+        WHERE conversation_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    'conversation_messages_before': '''
+        SELECT * FROM messages
+        WHERE conversation_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    # Flux SSE : messages plus récents que le dernier reçu par le navigateur
+    'messages_after': '''
+        SELECT * FROM messages
+        WHERE conversation_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''',
+    # Recherche plein texte : messages et fiches conversation, classés ensemble par bm25
+    'search': '''
+        WITH hits AS (
+            SELECT * FROM (
+                SELECT conversation_id, rowid AS message_id, bm25(messages_fts) AS score
+                FROM messages_fts
+                WHERE messages_fts MATCH :query
+                ORDER BY rowid DESC
+                LIMIT :candidates
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT rowid, NULL, bm25(conversations_fts, 2.0, 2.0, 1.0, 1.0)
+                FROM conversations_fts
+                WHERE conversations_fts MATCH :query
+                ORDER BY rowid DESC
+                LIMIT :candidates
+            )
+        )
+        SELECT h.conversation_id, h.message_id, h.score,
+               c.first_name, c.username, c.service_type, c.created_at
+        FROM hits h
+        JOIN conversations c ON c.id = h.conversation_id
+        ORDER BY h.score, h.message_id DESC
+        LIMIT :limit OFFSET :offset
+    ''',
+    # Extraits surlignés, calculés pour la page affichée seulement
+    'message_excerpt': '''
+        SELECT snippet(messages_fts, 0, char(2), char(3), '…', 12)
+        FROM messages_fts WHERE messages_fts MATCH ? AND rowid = ?
+    ''',
+    'conversation_excerpt': '''
+        SELECT snippet(conversations_fts, -1, char(2), char(3), '…', 12)
+        FROM conversations_fts WHERE conversations_fts MATCH ? AND rowid = ?
+    ''',
+    'rebuild_search': '''
+        INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')
+    ''',
+    'rebuild_search_conversations': '''
+        INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')
+    ''',
+    # Archive : conversations sans activité depuis N jours (paramètre '-N days'),
+    # copiées (corps des messages compressés) puis supprimées de la base chaude
+    'archivable_conversations': '''
+        SELECT id FROM conversations
+        WHERE COALESCE(last_message_at, created_at) < datetime('now', ?)
+    ''',
+    'archive_copy_conversations': '''
+        INSERT OR REPLACE INTO archive.conversations
+            (id, telegram_id, username, first_name, service_type, quantity, link, details, estimated_price,
+             status, created_at, message_count, last_message_preview, last_message_at, last_sender)
+        SELECT c.id, c.telegram_id, c.username, c.first_name, c.service_type, c.quantity, c.link, c.details,
+               c.estimated_price, c.status, c.created_at, c.message_count, c.last_message_preview,
+               c.last_message_at, c.last_sender
+        FROM conversations c JOIN json_each(:ids) j ON c.id = j.value
+        WHERE COALESCE(c.last_message_at, c.created_at) < datetime('now', :age)
+    ''',
+    'archive_copy_messages': '''
+        INSERT OR REPLACE INTO archive.messages
+            (id, conversation_id, telegram_id, message, sender, created_at, delivery_status)
+        SELECT m.id, m.conversation_id, m.telegram_id, zip_text(m.message), m.sender, m.created_at, m.delivery_status
+        FROM conversations c JOIN json_each(:ids) j ON c.id = j.value
+        JOIN messages m ON m.conversation_id = c.id
+        WHERE COALESCE(c.last_message_at, c.created_at) < datetime('now', :age)
+    ''',
+    # Suppression dans une seconde transaction (les commits ne sont pas atomiques entre
+    # deux fichiers) : on ne supprime que ce qui est resté inactif depuis la copie
+    'archive_delete_messages': '''
+        DELETE FROM messages WHERE conversation_id IN (
+            SELECT c.id FROM conversations c JOIN json_each(:ids) j ON c.id = j.value
+            WHERE COALESCE(c.last_message_at, c.created_at) < datetime('now', :age)
+        )
+    ''',
+    'archive_delete_conversations': '''
+        DELETE FROM conversations WHERE id IN (
+            SELECT c.id FROM conversations c JOIN json_each(:ids) j ON c.id = j.value
+            WHERE COALESCE(c.last_message_at, c.created_at) < datetime('now', :age)
+        )
+    ''',
+    'get_archived_conversation': 'SELECT * FROM archive.conversations WHERE id = ?',
+    'archived_messages': '''
+        SELECT id, conversation_id, telegram_id, unzip_text(message) AS message, sender, created_at, delivery_status
+        FROM archive.messages
+        WHERE conversation_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    'archived_messages_before': '''
+        SELECT id, conversation_id, telegram_id, unzip_text(message) AS message, sender, created_at, delivery_status
+        FROM archive.messages
+        WHERE conversation_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    'latest_archived_conversation': '''
+        SELECT id FROM archive.conversations WHERE telegram_id = ? ORDER BY created_at DESC LIMIT 1
+    ''',
+    # Retour d'un client ou réponse admin sur un fil archivé : copie dans la base chaude
+    # (la copie d'archive reste, remplacée au prochain archivage)
+    'restore_conversation': '''
+        INSERT OR IGNORE INTO conversations
+            (id, telegram_id, username, first_name, service_type, quantity, link, details, estimated_price,
+             status, created_at, message_count, last_message_preview, last_message_at, last_sender)
+        SELECT id, telegram_id, username, first_name, service_type, quantity, link, details, estimated_price,
+               status, created_at, message_count, last_message_preview, last_message_at, last_sender
+        FROM archive.conversations WHERE id = ?
+    ''',
+    'restore_messages': '''
+        INSERT OR IGNORE INTO messages (id, conversation_id, telegram_id, message, sender, created_at, delivery_status)
+        SELECT id, conversation_id, telegram_id, unzip_text(message), sender, created_at, delivery_status
+        FROM archive.messages WHERE conversation_id = ?
+    ''',
+    # Exports : lots lus par clé (created_at, id) ou id, filtres optionnels (NULL = pas de filtre).
+    # Messages : l'id croît avec created_at (horodatage d'insertion), la clé part donc
+    # du premier message de la plage (index created_at) et non du début de la table
+    'export_conversations': '''
+        SELECT c.id, c.telegram_id, c.username, c.first_name, c.service_type, c.quantity, c.link, c.details,
+               c.estimated_price, c.status, c.created_at, c.message_count, c.last_message_at
+        FROM main.conversations c
+        WHERE (c.created_at, c.id) > (:after_at, :after_id) AND c.created_at < :until
+          AND (:orders_only = 0 OR c.service_type IS NOT NULL)
+          AND (:service_type IS NULL OR c.service_type = :service_type)
+          AND (:status IS NULL OR c.status = :status)
+        ORDER BY c.created_at, c.id
+        LIMIT :limit
+    ''',
+    'export_archived_conversations': '''
+        SELECT c.id, c.telegram_id, c.username, c.first_name, c.service_type, c.quantity, c.link, c.details,
+               c.estimated_price, c.status, c.created_at, c.message_count, c.last_message_at
+        FROM archive.conversations c
+        WHERE (c.created_at, c.id) > (:after_at, :after_id) AND c.created_at < :until
+          AND (:orders_only = 0 OR c.service_type IS NOT NULL)
+          AND (:service_type IS NULL OR c.service_type = :service_type)
+          AND (:status IS NULL OR c.status = :status)
+          AND c.id NOT IN (SELECT id FROM main.conversations)
+        ORDER BY c.created_at, c.id
+        LIMIT :limit
+    ''',
+    'export_messages': '''
+        SELECT m.id, m.conversation_id, m.telegram_id, c.username, c.service_type, m.sender, m.message,
+               m.delivery_status, m.created_at
+        FROM main.messages m
+        JOIN main.conversations c ON c.id = m.conversation_id
+        WHERE m.id > max(:after_id, (
+                SELECT id - 1 FROM main.messages WHERE created_at >= :since ORDER BY created_at, id LIMIT 1
+            ))
+          -- + : filtre seulement, le lot se lit dans l'ordre des id (pas de tri)
+          AND +m.created_at >= :since AND +m.created_at < :until
+          AND (:orders_only = 0 OR c.service_type IS NOT NULL)
+          AND (:service_type IS NULL OR c.service_type = :service_type)
+          AND (:status IS NULL OR c.status = :status)
+        ORDER BY m.id
+        LIMIT :limit
+    ''',
+    'export_archived_messages': '''
+        SELECT m.id, m.conversation_id, m.telegram_id, c.username, c.service_type, m.sender,
+               unzip_text(m.message) AS message, m.delivery_status, m.created_at
+        FROM archive.messages m
+        JOIN archive.conversations c ON c.id = m.conversation_id
+        WHERE m.id > max(:after_id, (
+                SELECT id - 1 FROM archive.messages WHERE created_at >= :since ORDER BY created_at, id LIMIT 1
+            ))
+          -- + : filtre seulement, le lot se lit dans l'ordre des id (pas de tri)
+          AND +m.created_at >= :since AND +m.created_at < :until
+          AND (:orders_only = 0 OR c.service_type IS NOT NULL)
+          AND (:service_type IS NULL OR c.service_type = :service_type)
+          AND (:status IS NULL OR c.status = :status)
+          AND m.id NOT IN (SELECT id FROM main.messages)
+        ORDER BY m.id
+        LIMIT :limit
+    ''',
+    'upsert_state': '''
+        INSERT INTO conversation_state
+            (telegram_id, step, service_type, username, first_name, quantity, link, details, estimated_price, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (telegram_id) DO UPDATE SET
+            step = excluded.step,
+            service_type = excluded.service_type,
+            username = excluded.username,
+            first_name = excluded.first_name,
+            quantity = excluded.quantity,
+            link = excluded.link,
+            details = excluded.details,
+            estimated_price = excluded.estimated_price,
+            updated_at = excluded.updated_at
+    ''',
+    'load_state': 'SELECT * FROM conversation_state WHERE telegram_id = ?',
+    # Migrations (migrations.py) : ouverture de la transaction et version appliquée
+    'begin_migration': 'BEGIN',
+    'record_migration': 'INSERT INTO schema_version (version, name) VALUES (?, ?)',
+}
+
+
+class Storage:
+    """Pool de connexions SQLite : un écrivain sérialisé + N lecteurs"""
+
+    dialect = 'sqlite'
+    paramstyle = 'qmark'
+    statements = STATEMENTS
+
+    def __init__(self, path=DB_PATH, readers=READER_POOL_SIZE, archive_path=ARCHIVE_PATH):
+        self.path = path
+        self.archive_path = archive_path or f"{os.path.splitext(path)[0]}.archive.db"
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._readers = queue.LifoQueue()
+        for _ in range(max(1, readers)):
+            self._readers.put(self._connect())
+        # Version des données : incrémentée après chaque commit qui modifie la base,
+        # y compris par un autre processus (workers, manage.py) vu par PRAGMA data_version
+        self._version = 0
+        self.changed_at = datetime.now(timezone.utc)
+        self._watcher = sqlite3.connect(path, check_same_thread=False)
+        self._watch_lock = threading.Lock()
+        self._external = None
+        self._after_commit = []
+        for statement in ARCHIVE_SCHEMA:
+            self._writer.execute(statement)
+        self._writer.commit()
+        self._seen_changes = self._writer.total_changes
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=len(STATEMENTS) * 4,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        conn.execute('PRAGMA archive.journal_mode=WAL')
+        conn.execute('PRAGMA archive.synchronous=NORMAL')
+        conn.create_function('zip_text', 1, zip_text, deterministic=True)
+        conn.create_function('unzip_text', 1, unzip_text, deterministic=True)
+        return conn
+
+    @contextmanager
+    def read(self):
+        """Emprunte une connexion de lecture au pool"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def write(self):
+        """Transaction d'écriture sur la connexion unique (commit ou rollback)"""
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                self._after_commit.clear()
+                raise
+            if self._writer.total_changes != self._seen_changes:
+                self._seen_changes = self._writer.total_changes
+                self._bump()
+            callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        """Dans un bloc write() : callback() sera appelé si la transaction est validée"""
+        self._after_commit.append(callback)
+
+    def _bump(self):
+        with self._watch_lock:
+            self._version += 1
+            self.changed_at = datetime.now(timezone.utc)
+
+    @property
+    def data_version(self):
+        with self._watch_lock:
+            external = self._watcher.execute('PRAGMA data_version').fetchone()[0]
+            changed = external != self._external
+            self._external = external
+        if changed:
+            self._bump()
+        return self._version
+
+    def explain(self, conn, sql, params):
+        """Plan d'exécution d'une requête (page des requêtes lentes)"""
+        return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+    def fts_query(self, text):
+        return fts_query(text)
+
+    def vacuum(self):
+        """Rend au système l'espace libéré dans la base chaude"""
+        with self.write() as conn:
+            conn.execute('VACUUM main')
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        with self._watch_lock:
+            self._watcher.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def zip_text(text):
+    """Corps de message archivé : zlib quand c'est plus court, texte brut sinon"""
+    if text is None:
+        return None
+    raw = text.encode('utf-8')
+    packed = zlib.compress(raw, 9)
+    return packed if len(packed) < len(raw) else text
+
+
+def unzip_text(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+def execute(conn, name, params=()):
+    """Exécute une requête nommée de STATEMENTS (durée dans lebonmot_sql_seconds)
+
+    Pour un SELECT, la durée couvre l'exécution jusqu'à la première ligne :
+    c'est là que se paient les scans et les tris temporaires.
+    """
+    db = get_storage()
+    sql = db.statements[name]
+    started = time.perf_counter()
+    cursor = conn.execute(sql, params)
+    duration = time.perf_counter() - started
+    metrics.SQL_LATENCY.observe(duration, statement=name)
+    if slow_queries.enabled and duration >= slow_queries.threshold:
+        slow_queries.record(conn, name, sql, params, duration, db.explain)
+    return cursor
+
+
+def inserted_id(cursor):
+    """id renvoyé par une insertion ... RETURNING id (lu en entier : requête terminée)"""
+    return cursor.fetchall()[0][0]
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Pool du backend configuré (STORAGE_BACKEND)"""
+    if backend == 'postgres':
+        # Dépendance optionnelle : psycopg n'est requis qu'avec ce backend
+        from storage_postgres import PostgresStorage
+        return PostgresStorage(DATABASE_URL, READER_POOL_SIZE)
+    if backend != 'sqlite':
+        raise ValueError(f"STORAGE_BACKEND inconnu : {backend} (sqlite ou postgres)")
+    return Storage()
+
+
+def get_storage():
+    """Retourne le pool partagé (créé au premier appel)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+
+def _replace(factory):
+    global _storage
+    with _storage_lock:
+        if _storage is not None:
+            _storage.close()
+        _storage = factory()
+    return _storage
+
+
+def configure(path=DB_PATH, readers=READER_POOL_SIZE, archive_path=ARCHIVE_PATH):
+    """Remplace le pool partagé par une base SQLite (autre fichier, benchmarks...)"""
+    return _replace(lambda: Storage(path, readers, archive_path))
+
+
+def configure_postgres(url=DATABASE_URL, pool_size=READER_POOL_SIZE):
+    """Remplace le pool partagé par une base PostgreSQL (benchmarks...)"""
+    from storage_postgres import PostgresStorage
+    return _replace(lambda: PostgresStorage(url, pool_size))
+
+
+# --- Accès aux données -----------------------------------------------------
+
+def record_message(conn, telegram_id, message, sender='client'):
+    """Rattache le message à la dernière conversation du client (créée si besoin)"""
+    result = execute(conn, 'latest_conversation', (telegram_id,)).fetchone()
+    if result:
+        conversation_id = result[0]
+    else:
+        conversation_id = restore_latest_conversation(conn, telegram_id)
+        if conversation_id is None:
+            conversation_id = inserted_id(execute(conn, 'insert_conversation', (telegram_id,)))
+            bump_stat(conn, 'total_clients')
+    message_id = inserted_id(execute(conn, 'insert_message', (conversation_id, telegram_id, message, sender)))
+    execute(conn, 'touch_conversation', (message, sender, conversation_id))
+    if sender == 'client':
+        bump_stat(conn, 'total_messages')
+    publish_message(conversation_id, message_id, message, sender)
+    return conversation_id
+
+
+def record_order(conn, telegram_id, username, first_name, service_type, quantity, link, details, estimated_price):
+    """Enregistre une commande (conversation qualifiée)"""
+    if (execute(conn, 'latest_conversation', (telegram_id,)).fetchone() is None
+            and execute(conn, 'latest_archived_conversation', (telegram_id,)).fetchone() is None):
+        bump_stat(conn, 'total_clients')
+    bump_stat(conn, 'total_orders')
+    return inserted_id(execute(conn, 'insert_order', (
+        telegram_id, username, first_name, service_type, quantity, link, details, estimated_price
+    )))
+
+
+def bump_stat(conn, name, delta=1):
+    execute(conn, 'bump_stat', (delta, name))
+
+
+def rebuild_stats(conn):
+    """Recalcule tous les compteurs depuis les tables (récupération), archive comprise"""
+    execute(conn, 'clear_stats')
+    execute(conn, 'rebuild_stats')
+
+
+def restore_conversation(conn, conv_id):
+    """Recopie une conversation archivée (et ses messages) dans la base chaude"""
+    if execute(conn, 'restore_conversation', (conv_id,)).rowcount:
+        execute(conn, 'restore_messages', (conv_id,))
+        return True
+    return False
+
+
+def restore_latest_conversation(conn, telegram_id):
+    """Dernière conversation archivée du client, restaurée ; None si le client est inconnu"""
+    result = execute(conn, 'latest_archived_conversation', (telegram_id,)).fetchone()
+    if result is None:
+        return None
+    restore_conversation(conn, result[0])
+    return result[0]
+
+
+def record_state(conn, telegram_id, *fields):
+    """Enregistre l'état de conversation d'un client (étape du parcours de devis)"""
+    execute(conn, 'upsert_state', (telegram_id, *fields))
+
+
+def record_delivery(conn, message_id, status):
+    """Statut d'envoi Telegram d'une réponse admin : pending, sent ou failed"""
+    for row in execute(conn, 'set_delivery_status', (status, message_id)).fetchall():
+        get_storage().after_commit(lambda topic=row[0]: broker.publish(
+            topic, 'status', {'id': message_id, 'delivery_status': status}))
+
+
+def publish_message(conversation_id, message_id, message, sender, delivery_status=None):
+    """Annonce le message aux flux SSE de la conversation, une fois la transaction validée"""
+    data = {
+        'id': message_id,
+        'message': message,
+        'sender': sender,
+        # Même format et même fuseau (UTC) que CURRENT_TIMESTAMP
+        'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'delivery_status': delivery_status,
+    }
+    get_storage().after_commit(lambda: broker.publish(conversation_id, 'message', data))
+
+
+def save_message(telegram_id, message, sender='client'):
+    with get_storage().write() as conn:
+        return record_message(conn, telegram_id, message, sender)
+
+
+def insert_order(*order):
+    with get_storage().write() as conn:
+        return record_order(conn, *order)
+
+
+def load_state(telegram_id):
+    with get_storage().read() as conn:
+        return execute(conn, 'load_state', (telegram_id,)).fetchone()
+
+
+def recent_orders(telegram_id, limit=5):
+    with get_storage().read() as conn:
+        return execute(conn, 'recent_orders', (telegram_id, limit)).fetchall()
+
+
+def dashboard_stats():
+    """Compteurs globaux, lus en O(1) dans la table stats"""
+    with get_storage().read() as conn:
+        return dict(execute(conn, 'read_stats').fetchall())
+
+
+def fts_query(text):
+    """Saisie libre -> requête FTS5 : chaque terme entre guillemets (pas de syntaxe FTS)
+
+    Un terme terminé par * cherche par préfixe (plus coûteux sur les mots fréquents).
+    """
+    terms = []
+    for term in re.findall(r'[^\s"]+', text or '')[:10]:
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return ' '.join(terms) or None
+
+
+def search(text, limit, page=1):
+    """Conversations et messages correspondant à text ; retourne (résultats, has_more)
+
+    Chaque résultat : conversation_id, message_id (None pour une fiche conversation),
+    score, excerpt (termes entre \\x02 et \\x03), first_name, username, service_type, created_at.
+    """
+    query = get_storage().fts_query(text)
+    if query is None:
+        return [], False
+    with get_storage().read() as conn:
+        rows = execute(conn, 'search', {
+            'query': query,
+            'candidates': SEARCH_CANDIDATES,
+            'limit': limit + 1,
+            'offset': (page - 1) * limit,
+        }).fetchall()
+        results = []
+        for row in rows[:limit]:
+            if row['message_id'] is None:
+                excerpt = execute(conn, 'conversation_excerpt', (query, row['conversation_id'])).fetchone()
+            else:
+                excerpt = execute(conn, 'message_excerpt', (query, row['message_id'])).fetchone()
+            results.append(dict(row, excerpt=excerpt[0] if excerpt else ''))
+    return results, len(rows) > limit
+
+
+def archive_conversations(days, batch_size=ARCHIVE_BATCH_SIZE):
+    """Déplace dans l'archive les conversations inactives depuis days jours ; retourne leur nombre
+
+    Par lots : copie dans une transaction, suppression dans la suivante. Une conversation
+    redevenue active entre les deux reste dans la base chaude.
+    """
+    age = f'-{int(days)} days'
+    with get_storage().read() as conn:
+        ids = [row[0] for row in execute(conn, 'archivable_conversations', (age,))]
+    moved = 0
+    for start in range(0, len(ids), batch_size):
+        params = {'ids': json.dumps(ids[start:start + batch_size]), 'age': age}
+        with get_storage().write() as conn:
+            execute(conn, 'archive_copy_conversations', params)
+            execute(conn, 'archive_copy_messages', params)
+        with get_storage().write() as conn:
+            execute(conn, 'archive_delete_messages', params)
+            moved += execute(conn, 'archive_delete_conversations', params).rowcount
+    return moved
+
+
+def rebuild_search(conn):
+    """Reconstruit les index plein texte depuis les tables (récupération)"""
+    execute(conn, 'rebuild_search')
+    execute(conn, 'rebuild_search_conversations')
+
+
+def encode_cursor(row):
+    """Curseur de pagination : 'created_at|id' de la dernière ligne affichée"""
+    return f"{row['created_at']}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    """Retourne (created_at, id) ou None si le curseur est absent ou invalide"""
+    if not cursor:
+        return None
+    created_at, _, row_id = cursor.rpartition('|')
+    if not created_at or not row_id.isdigit():
+        return None
+    return created_at, int(row_id)
+
+
+def _page(name, limit, after):
+    """Lit limit lignes après le curseur ; retourne (lignes, curseur suivant ou None)"""
+    position = decode_cursor(after)
+    with get_storage().read() as conn:
+        if position:
+            rows = execute(conn, name + '_after', (*position, limit + 1)).fetchall()
+        else:
+            rows = execute(conn, name, (limit + 1,)).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def conversations_page(limit, after=None):
+    return _page('conversations_page', limit, after)
+
+
+def orders_page(limit, after=None):
+    return _page('orders_page', limit, after)
+
+
+def get_conversation(conv_id):
+    """Conversation de la base chaude, sinon de l'archive"""
+    with get_storage().read() as conn:
+        return (execute(conn, 'get_conversation', (conv_id,)).fetchone()
+                or execute(conn, 'get_archived_conversation', (conv_id,)).fetchone())
+
+
+def conversation_messages(conv_id, limit, before=None):
+    """Les limit messages précédant l'id before (les derniers sinon), du plus ancien au plus récent
+
+    Retourne (messages, has_more) : has_more indique des messages plus anciens.
+    """
+    with get_storage().read() as conn:
+        if before is None:
+            rows = (execute(conn, 'conversation_messages', (conv_id, limit + 1)).fetchall()
+                    or execute(conn, 'archived_messages', (conv_id, limit + 1)).fetchall())
+        else:
+            rows = (execute(conn, 'conversation_messages_before', (conv_id, before, limit + 1)).fetchall()
+                    or execute(conn, 'archived_messages_before', (conv_id, before, limit + 1)).fetchall())
+    has_more = len(rows) > limit
+    return rows[:limit][::-1], has_more
+
+
+def messages_after(conv_id, last_id, limit=500):
+    with get_storage().read() as conn:
+        return execute(conn, 'messages_after', (conv_id, last_id, limit)).fetchall()
+
+
+def add_admin_message(conv_id, message):
+    """Enregistre une réponse admin (en attente d'envoi)
+
+    Retourne (telegram_id, message_id) ou None si la conversation est inconnue.
+    """
+    with get_storage().write() as conn:
+        result = execute(conn, 'conversation_telegram_id', (conv_id,)).fetchone()
+        if not result and restore_conversation(conn, conv_id):
+            result = execute(conn, 'conversation_telegram_id', (conv_id,)).fetchone()
+        if not result:
+            return None
+        telegram_id = result[0]
+        message_id = inserted_id(execute(conn, 'insert_admin_message', (conv_id, telegram_id, message)))
+        execute(conn, 'touch_conversation', (message, 'admin', conv_id))
+        bump_stat(conn, 'total_replies')
+        publish_message(conv_id, message_id, message, 'admin', 'pending')
+    return telegram_id, message_id
@@ -0,0 +1,442 @@
+"""
+Stockage PostgreSQL - Le Bon Mot
+Backend STORAGE_BACKEND=postgres : pool psycopg 3 (DATABASE_URL), mêmes requêtes
+nommées que storage.STATEMENTS, mêmes lignes renvoyées (accès par nom ou par
+position, horodatages en texte 'AAAA-MM-JJ HH:MM:SS' UTC). Plusieurs processus
+bot / dashboard peuvent écrire en même temps.
+
+    pip install "psycopg[binary,pool]"
+"""
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError as e:
+    raise RuntimeError("STORAGE_BACKEND=postgres requiert psycopg : pip install \"psycopg[binary,pool]\"") from e
+
+logger = logging.getLogger(__name__)
+
+# Colonnes lues par SELECT * côté SQLite (sans la colonne tsvector de recherche)
+CONVERSATION_COLUMNS = '''
+    id, telegram_id, username, first_name, service_type, quantity, link, details, estimated_price,
+    status, created_at, message_count, last_message_preview, last_message_at, last_sender
+'''
+MESSAGE_COLUMNS = 'id, conversation_id, telegram_id, message, sender, created_at, delivery_status'
+
+# Requêtes nommées, mêmes noms et mêmes paramètres que storage.STATEMENTS
+STATEMENTS = {
+    'latest_conversation': '''
+        SELECT id FROM conversations WHERE telegram_id = %s ORDER BY created_at DESC LIMIT 1
+    ''',
+    'insert_conversation': 'INSERT INTO conversations (telegram_id) VALUES (%s) RETURNING id',
+    'insert_message': '''
+        INSERT INTO messages (conversation_id, telegram_id, message, sender)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    ''',
+    'insert_order': '''
+        INSERT INTO conversations (telegram_id, username, first_name, service_type, quantity, link, details, estimated_price)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    ''',
+    'recent_orders': f'''
+        SELECT {CONVERSATION_COLUMNS} FROM conversations
+        WHERE telegram_id = %s AND service_type IS NOT NULL
+        ORDER BY created_at DESC
+        LIMIT %s
+    ''',
+    'read_stats': 'SELECT name, value FROM stats',
+    'bump_stat': 'UPDATE stats SET value = value + %s WHERE name = %s',
+    'clear_stats': 'DELETE FROM stats',
+    'rebuild_stats': '''
+        INSERT INTO stats (name, value)
+        WITH all_conversations AS (
+            SELECT id, telegram_id, service_type FROM conversations
+            UNION ALL
+            SELECT a.id, a.telegram_id, a.service_type FROM archive.conversations a
+            WHERE NOT EXISTS (SELECT 1 FROM conversations c WHERE c.id = a.id)
+        ), all_messages AS (
+            SELECT sender FROM messages
+            UNION ALL
+            SELECT a.sender FROM archive.messages a
+            WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.id = a.id)
+        )
+        SELECT 'total_orders', COUNT(*) FROM all_conversations WHERE service_type IS NOT NULL
+        UNION ALL SELECT 'total_clients', COUNT(DISTINCT telegram_id) FROM all_conversations
+        UNION ALL SELECT 'total_messages', COUNT(*) FROM all_messages WHERE sender = 'client'
+        UNION ALL SELECT 'total_replies', COUNT(*) FROM all_messages WHERE sender = 'admin'
+    ''',
+    'conversations_page': f'''
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ''',
+    'conversations_page_after': f'''
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations
+        WHERE (created_at, id) < (%s, %s)
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ''',
+    'orders_page': f'''
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations
+        WHERE service_type IS NOT NULL
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ''',
+    'orders_page_after': f'''
+        SELECT {CONVERSATION_COLUMNS}
+        FROM conversations
+        WHERE service_type IS NOT NULL AND (created_at, id) < (%s, %s)
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ''',
+    'touch_conversation': '''
+        UPDATE conversations
+        SET message_count = message_count + 1,
+            last_message_preview = left(%s, 200),
+            last_message_at = LOCALTIMESTAMP(0),
+            last_sender = %s
+        WHERE id = %s
+    ''',
+    'insert_admin_message': '''
+        INSERT INTO messages (conversation_id, telegram_id, message, sender, delivery_status)
+        VALUES (%s, %s, %s, 'admin', 'pending')
+        RETURNING id
+    ''',
+    'set_delivery_status': 'UPDATE messages SET delivery_status = %s WHERE id = %s RETURNING conversation_id',
+    'get_conversation': f'SELECT {CONVERSATION_COLUMNS} FROM conversations WHERE id = %s',
+    'conversation_telegram_id': 'SELECT telegram_id FROM conversations WHERE id = %s',
+    'conversation_messages': f'''
+        SELECT {MESSAGE_COLUMNS} FROM messages
+        WHERE conversation_id = %s
+        ORDER BY id DESC
+        LIMIT %s
+    ''',
+    'conversation_messages_before': f'''
+        SELECT {MESSAGE_COLUMNS} FROM messages
+        WHERE conversation_id = %s AND id < %s
+        ORDER BY id DESC
+        LIMIT %s
+    ''',
+    'messages_after': f'''
+        SELECT {MESSAGE_COLUMNS} FROM messages
+        WHERE conversation_id = %s AND id > %s
+        ORDER BY id
+        LIMIT %s
+    ''',
+    # Recherche : score négatif (ts_rank croissant = meilleur) pour garder l'ordre de bm25
+    'search': '''
+        WITH query AS (
+            SELECT to_tsquery('simple', %(query)s) AS q
+        ), hits AS (
+            (SELECT m.conversation_id, m.id AS message_id, -ts_rank(m.search, query.q) AS score
+             FROM messages m, query
+             WHERE m.search @@ query.q
+             ORDER BY m.id DESC
+             LIMIT %(candidates)s)
+            UNION ALL
+            (SELECT c.id, NULL, -ts_rank(c.search, query.q)
+             FROM conversations c, query
+             WHERE c.search @@ query.q
+             ORDER BY c.id DESC
+             LIMIT %(candidates)s)
+        )
+        SELECT h.conversation_id, h.message_id, h.score,
+               c.first_name, c.username, c.service_type, c.created_at
+        FROM hits h
+        JOIN conversations c ON c.id = h.conversation_id
+        ORDER BY h.score, h.message_id DESC NULLS LAST
+        LIMIT %(limit)s OFFSET %(offset)s
+    ''',
+    'message_excerpt': '''
+        SELECT ts_headline('simple', message, to_tsquery('simple', %s),
+                           'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=12, MinWords=4')
+        FROM messages WHERE id = %s
+    ''',
+    'conversation_excerpt': '''
+        SELECT ts_headline('simple', concat_ws(' ', username, first_name, link, details), to_tsquery('simple', %s),
+                           'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=12, MinWords=4')
+        FROM conversations WHERE id = %s
+    ''',
+    # Colonnes tsvector générées : toujours à jour, seul l'index GIN peut être reconstruit
+    'rebuild_search': 'REINDEX INDEX idx_messages_search',
+    'rebuild_search_conversations': 'REINDEX INDEX idx_conversations_search',
+    'archivable_conversations': '''
+        SELECT id FROM conversations
+        WHERE COALESCE(last_message_at, created_at) < LOCALTIMESTAMP + %s::interval
+    ''',
+    'archive_copy_conversations': '''
+        INSERT INTO archive.conversations
+            (id, telegram_id, username, first_name, service_type, quantity, link, details, estimated_price,
+             status, created_at, message_count, last_message_preview, last_message_at, last_sender)
+        SELECT c.id, c.telegram_id, c.username, c.first_name, c.service_type, c.quantity, c.link, c.details,
+               c.estimated_price, c.status, c.created_at, c.message_count, c.last_message_preview,
+               c.last_message_at, c.last_sender
+        FROM conversations c
+        WHERE c.id IN (SELECT value::bigint FROM jsonb_array_elements_text(%(ids)s::jsonb))
+          AND COALESCE(c.last_message_at, c.created_at) < LOCALTIMESTAMP + %(age)s::interval
+        ON CONFLICT (id) DO UPDATE SET
+            telegram_id = excluded.telegram_id, username = excluded.username, first_name = excluded.first_name,
+            service_type = excluded.service_type, quantity = excluded.quantity, link = excluded.link,
+            details = excluded.details, estimated_price = excluded.estimated_price, status = excluded.status,
+            created_at = excluded.created_at, message_count = excluded.message_count,
+            last_message_preview = excluded.last_message_preview, last_message_at = excluded.last_message_at,
+            last_sender = excluded.last_sender, archived_at = LOCALTIMESTAMP(0)
+    ''',
+    'archive_copy_messages': '''
+        INSERT INTO archive.messages (id, conversation_id, telegram_id, message, sender, created_at, delivery_status)
+        SELECT m.id, m.conversation_id, m.telegram_id, m.message, m.sender, m.created_at, m.delivery_status
+        FROM conversations c
+        JOIN messages m ON m.conversation_id = c.id
+        WHERE c.id IN (SELECT value::bigint FROM jsonb_array_elements_text(%(ids)s::jsonb))
+          AND COALESCE(c.last_message_at, c.created_at) < LOCALTIMESTAMP + %(age)s::interval
+        ON CONFLICT (id) DO UPDATE SET
+            message = excluded.message, delivery_status = excluded.delivery_status
+    ''',
+    'archive_delete_messages': '''
+        DELETE FROM messages WHERE conversation_id IN (
+            SELECT c.id FROM conversations c
+            WHERE c.id IN (SELECT value::bigint FROM jsonb_array_elements_text(%(ids)s::jsonb))
+              AND COALESCE(c.last_message_at, c.created_at) < LOCALTIMESTAMP + %(age)s::interval
+        )
+    ''',
+    'archive_delete_conversations': '''
+        DELETE FROM conversations
+        WHERE id IN (SELECT value::bigint FROM jsonb_array_elements_text(%(ids)s::jsonb))
+          AND COALESCE(last_message_at, created_at) < LOCALTIMESTAMP + %(age)s::interval
+    ''',
+    'get_archived_conversation': 'SELECT * FROM archive.conversations WHERE id = %s',
+    'archived_messages': f'''
+        SELECT {MESSAGE_COLUMNS} FROM archive.messages
+        WHERE conversation_id = %s
+        ORDER BY id DESC
+        LIMIT %s
+    ''',
+    'archived_messages_before': f'''
+        SELECT {MESSAGE_COLUMNS} FROM archive.messages
+        WHERE conversation_id = %s AND id < %s
+        ORDER BY id DESC
+        LIMIT %s
+    ''',
+    'latest_archived_conversation': '''
+        SELECT id FROM archive.conversations WHERE telegram_id = %s ORDER BY created_at DESC LIMIT 1
+    ''',
+    'restore_conversation': f'''
+        INSERT INTO conversations ({CONVERSATION_COLUMNS})
+        SELECT {CONVERSATION_COLUMNS}
+        FROM archive.conversations WHERE id = %s
+        ON CONFLICT (id) DO NOTHING
+    ''',
+    'restore_messages': f'''
+        INSERT INTO messages ({MESSAGE_COLUMNS})
+        SELECT {MESSAGE_COLUMNS}
+        FROM archive.messages WHERE conversation_id = %s
+        ON CONFLICT (id) DO NOTHING
+    ''',
+    # Paramètres NULL typés explicitement (sinon "could not determine data type")
+    'export_conversations': '''
+        SELECT c.id, c.telegram_id, c.username, c.first_name, c.service_type, c.quantity, c.link, c.details,
+               c.estimated_price, c.status, c.created_at, c.message_count, c.last_message_at
+        FROM conversations c
+        WHERE (c.created_at, c.id) > (%(after_at)s::timestamp, %(after_id)s) AND c.created_at < %(until)s::timestamp
+          AND (%(orders_only)s = 0 OR c.service_type IS NOT NULL)
+          AND (%(service_type)s::text IS NULL OR c.service_type = %(service_type)s::text)
+          AND (%(status)s::text IS NULL OR c.status = %(status)s::text)
+        ORDER BY c.created_at, c.id
+        LIMIT %(limit)s
+    ''',
+    'export_archived_conversations': '''
+        SELECT c.id, c.telegram_id, c.username, c.first_name, c.service_type, c.quantity, c.link, c.details,
+               c.estimated_price, c.status, c.created_at, c.message_count, c.last_message_at
+        FROM archive.conversations c
+        WHERE (c.created_at, c.id) > (%(after_at)s::timestamp, %(after_id)s) AND c.created_at < %(until)s::timestamp
+          AND (%(orders_only)s = 0 OR c.service_type IS NOT NULL)
+          AND (%(service_type)s::text IS NULL OR c.service_type = %(service_type)s::text)
+          AND (%(status)s::text IS NULL OR c.status = %(status)s::text)
+          AND NOT EXISTS (SELECT 1 FROM conversations hot WHERE hot.id = c.id)
+        ORDER BY c.created_at, c.id
+        LIMIT %(limit)s
+    ''',
+    'export_messages': '''
+        SELECT m.id, m.conversation_id, m.telegram_id, c.username, c.service_type, m.sender, m.message,
+               m.delivery_status, m.created_at
+        FROM messages m
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE m.id > GREATEST(%(after_id)s, (
+                SELECT id - 1 FROM messages WHERE created_at >= %(since)s::timestamp ORDER BY created_at, id LIMIT 1
+            ))
+          AND m.created_at >= %(since)s::timestamp AND m.created_at < %(until)s::timestamp
+          AND (%(orders_only)s = 0 OR c.service_type IS NOT NULL)
+          AND (%(service_type)s::text IS NULL OR c.service_type = %(service_type)s::text)
+          AND (%(status)s::text IS NULL OR c.status = %(status)s::text)
+        ORDER BY m.id
+        LIMIT %(limit)s
+    ''',
+    'export_archived_messages': '''
+        SELECT m.id, m.conversation_id, m.telegram_id, c.username, c.service_type, m.sender, m.message,
+               m.delivery_status, m.created_at
+        FROM archive.messages m
+        JOIN archive.conversations c ON c.id = m.conversation_id
+        WHERE m.id > GREATEST(%(after_id)s, (
+                SELECT id - 1 FROM archive.messages WHERE created_at >= %(since)s::timestamp
+                ORDER BY created_at, id LIMIT 1
+            ))
+          AND m.created_at >= %(since)s::timestamp AND m.created_at < %(until)s::timestamp
+          AND (%(orders_only)s = 0 OR c.service_type IS NOT NULL)
+          AND (%(service_type)s::text IS NULL OR c.service_type = %(service_type)s::text)
+          AND (%(status)s::text IS NULL OR c.status = %(status)s::text)
+          AND NOT EXISTS (SELECT 1 FROM messages hot WHERE hot.id = m.id)
+        ORDER BY m.id
+        LIMIT %(limit)s
+    ''',
+    'upsert_state': '''
+        INSERT INTO conversation_state
+            (telegram_id, step, service_type, username, first_name, quantity, link, details, estimated_price, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, LOCALTIMESTAMP(0))
+        ON CONFLICT (telegram_id) DO UPDATE SET
+            step = excluded.step,
+            service_type = excluded.service_type,
+            username = excluded.username,
+            first_name = excluded.first_name,
+            quantity = excluded.quantity,
+            link = excluded.link,
+            details = excluded.details,
+            estimated_price = excluded.estimated_price,
+            updated_at = excluded.updated_at
+    ''',
+    'load_state': 'SELECT * FROM conversation_state WHERE telegram_id = %s',
+    # La transaction est ouverte implicitement par psycopg : on borne l'attente des verrous DDL
+    'begin_migration': "SET LOCAL lock_timeout = '10s'",
+    'record_migration': 'INSERT INTO schema_version (version, name) VALUES (%s, %s)',
+}
+
+
+class Row:
+    """Ligne accessible par position ou par nom, comme sqlite3.Row"""
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return list(self._index)
+
+
+def _text(value):
+    # Horodatages au format de CURRENT_TIMESTAMP SQLite (tranches [:10] des templates)
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def row_factory(cursor):
+    index = {column.name: i for i, column in enumerate(cursor.description or ())}
+
+    def make_row(values):
+        return Row(index, [_text(value) for value in values])
+    return make_row
+
+
+def fts_query(text):
+    """Saisie libre -> tsquery : termes entre apostrophes reliés par &, * final = préfixe"""
+    terms = []
+    for term in re.findall(r'[^\s"]+', text or '')[:10]:
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('\\', '\\\\').replace("'", "''")
+        if term:
+            terms.append(f"'{term}':*" if prefix else f"'{term}'")
+    return ' & '.join(terms) or None
+
+
+class PostgresStorage:
+    """Pool psycopg : lectures et écritures concurrentes, une connexion par transaction"""
+
+    dialect = 'postgres'
+    paramstyle = 'format'
+    statements = STATEMENTS
+
+    def __init__(self, url, size=4):
+        if not url:
+            raise RuntimeError("DATABASE_URL est requis avec STORAGE_BACKEND=postgres")
+        self.url = url
+        self._pool = ConnectionPool(
+            url, min_size=1, max_size=max(2, size), open=True,
+            kwargs={'row_factory': row_factory, 'options': '-c TimeZone=UTC'},
+        )
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._lsn = None
+        self._version = 0
+        self.changed_at = datetime.now(timezone.utc)
+
+    @contextmanager
+    def read(self):
+        with self._pool.connection() as conn:
+            yield conn
+
+    @contextmanager
+    def write(self):
+        """Transaction (commit ou rollback) ; les callbacks after_commit sont propres au thread"""
+        self._local.after_commit = []
+        try:
+            with self._pool.connection() as conn:
+                yield conn
+        except BaseException:
+            self._local.after_commit = []
+            raise
+        callbacks, self._local.after_commit = self._local.after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        self._local.after_commit.append(callback)
+
+    @property
+    def data_version(self):
+        """Change dès qu'un processus, quel qu'il soit, écrit dans la base (position WAL)"""
+        with self.read() as conn:
+            lsn = conn.execute('SELECT pg_current_wal_lsn()::text').fetchone()[0]
+        with self._lock:
+            if lsn != self._lsn:
+                self._lsn = lsn
+                self._version += 1
+                self.changed_at = datetime.now(timezone.utc)
+            return self._version
+
+    def explain(self, conn, sql, params):
+        # Point de sauvegarde : un EXPLAIN en échec n'annule pas la transaction en cours
+        with conn.transaction():
+            return [row[0] for row in conn.execute(f'EXPLAIN {sql}', params)]
+
+    def fts_query(self, text):
+        return fts_query(text)
+
+    def vacuum(self):
+        with self._pool.connection() as conn:
+            conn.autocommit = True
+            try:
+                conn.execute('VACUUM (ANALYZE) messages, conversations')
+            finally:
+                conn.autocommit = False
+
+    def close(self):
+        self._pool.close()
@@ -0,0 +1,374 @@
+"""
+Superviseur multi-processus - Le Bon Mot
+Le processus principal reçoit les updates une seule fois (polling ou webhook)
+et les répartit entre BOT_WORKERS processus (main.py) selon le telegram_id : un client est
+toujours servi par le même worker, dont le cache d'états (user_conversations)
+reste local. Chaque worker signale sa boucle vivante toutes les WORKER_HEARTBEAT
+secondes, avec ses métriques ; mort ou muet depuis WORKER_TIMEOUT secondes, il
+est relancé et les updates qu'il n'avait pas acquittées sont renvoyées au nouveau
+processus (au moins une fois : une update traitée mais pas encore acquittée
+est rejouée).
+"""
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing.connection import wait
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+import metrics
+import storage
+from journal import get_journal
+from pubsub import broker
+from update_processor import update_key
+
+logger = logging.getLogger(__name__)
+
+WORKER_HEARTBEAT = float(os.getenv('WORKER_HEARTBEAT', 1))
+WORKER_TIMEOUT = float(os.getenv('WORKER_TIMEOUT', 10))
+# Délai accordé au démarrage d'un worker (imports, connexion à Telegram)
+WORKER_STARTUP = float(os.getenv('WORKER_STARTUP', 30))
+# Updates en attente par worker avant de faire patienter la réception
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 1000))
+
+WORKER_RESTARTS = metrics.Counter('lebonmot_worker_restarts_total', "Workers relancés par le superviseur", ('worker',))
+
+_STOP = None
+
+
+class Worker:
+    """Un worker vu du superviseur : processus, pipe, file d'envoi, échéance de vie"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.deadline = 0.0
+        self.backlog = queue.Queue(maxsize=WORKER_QUEUE_SIZE)
+        # update_id -> update envoyée au processus courant, pas encore acquittée
+        self.inflight = {}
+        # Incrémentée à chaque relance : ignore les messages de l'ancien processus
+        self.generation = 0
+        self.lock = threading.Lock()
+        # Un seul envoi à la fois sur le pipe (file d'envoi ou rejeu après relance)
+        self.send_lock = threading.Lock()
+
+
+class Supervisor:
+    def __init__(self, token, workers, target=None):
+        self.token = token
+        # target(index, token, conn) : point d'entrée des workers (remplaçable pour les benchmarks)
+        self.target = target or run_worker
+        self.workers = [Worker(index) for index in range(workers)]
+        # spawn : pas de threads ni de connexions SQLite hérités d'un fork
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = threading.Event()
+        self._threads = []
+        self._watchdog = None
+
+    def build_application(self):
+        """Application du processus principal : reçoit les updates et les répartit"""
+        from bot_simple import init_simple_db
+
+        init_simple_db()
+        # Journal local : messages envoyés depuis le dashboard
+        get_journal().start()
+        atexit.register(get_journal().stop)
+        app = Application.builder().token(self.token).build()
+        app.add_handler(TypeHandler(Update, self.dispatch))
+        return app
+
+    def start(self):
+        """Lance les workers, leurs threads d'envoi, la réception des événements et la surveillance"""
+        for worker in self.workers:
+            self._spawn(worker)
+            metrics.QUEUE_DEPTH.set_function(worker.backlog.qsize, queue=f'worker-{worker.index}')
+            self._thread(self._send_loop, worker, name=f'worker-{worker.index}-send')
+        self._thread(self._event_loop, name='worker-events')
+        self._watchdog = asyncio.create_task(self._watch())
+        logger.info(f"👷 {len(self.workers)} workers démarrés")
+        return self
+
+    async def stop(self, timeout=30):
+        """Chaque worker termine ses updates en file puis s'arrête"""
+        if self._watchdog:
+            self._watchdog.cancel()
+        for worker in self.workers:
+            await asyncio.to_thread(worker.backlog.put, _STOP)
+        await asyncio.to_thread(self._join, timeout)
+        self._stopping.set()
+        for thread in self._threads:
+            await asyncio.to_thread(thread.join, 5)
+        for worker in self.workers:
+            worker.conn.close()
+        logger.info("👷 Workers arrêtés")
+
+    async def dispatch(self, update, context):
+        """Handler du processus principal : update -> worker du client"""
+        key = update_key(update) or 0
+        worker = self.workers[key % len(self.workers)]
+        data = update.to_dict()
+        try:
+            worker.backlog.put_nowait(data)
+        except queue.Full:
+            # Contre-pression : le worker ne suit pas, la réception attend
+            await asyncio.to_thread(worker.backlog.put, data)
+
+    async def wait_ready(self, timeout=WORKER_STARTUP):
+        """Attend le premier battement de chaque worker"""
+        deadline = time.monotonic() + timeout
+        while not all(worker.ready for worker in self.workers):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Workers non démarrés")
+            await asyncio.sleep(0.05)
+
+    def _thread(self, target, *args, name):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _spawn(self, worker):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=self.target, args=(worker.index, self.token, child),
+                                        name=f'bot-worker-{worker.index}', daemon=True)
+        process.start()
+        # Seul le worker garde l'autre bout : sa mort ferme le pipe
+        child.close()
+        with worker.lock:
+            previous = worker.conn
+            worker.process, worker.conn = process, parent
+            worker.generation += 1
+            # Compteurs de l'ancien processus acquis ; le nouveau repart de zéro
+            metrics.retire_remote(f'worker-{worker.index}')
+            worker.ready = False
+            worker.deadline = time.monotonic() + WORKER_STARTUP
+        if previous is not None:
+            previous.close()
+
+    def _restart(self, worker):
+        # Tué d'abord : un envoi bloqué sur son pipe plein échoue et libère send_lock
+        worker.process.kill()
+        worker.process.join(5)
+        with worker.send_lock:
+            with worker.lock:
+                replay = list(worker.inflight.values())
+                worker.inflight.clear()
+            self._spawn(worker)
+            # Avant la suite de la file : l'ordre des updates d'un client est conservé
+            for data in replay:
+                self._send(worker, data)
+        if replay:
+            logger.warning(f"⚠️  {len(replay)} updates non acquittées renvoyées au worker {worker.index}")
+
+    def _send(self, worker, data):
+        """Envoie data au processus courant (appelé avec send_lock) ; False si le pipe est fermé"""
+        with worker.lock:
+            conn = worker.conn
+            if data is not _STOP:
+                # Enregistrée avant l'envoi : une relance pendant l'envoi la rejoue
+                worker.inflight[data['update_id']] = data
+        try:
+            conn.send(data)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _join(self, timeout):
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.warning(f"⚠️  Worker {worker.index} arrêté de force")
+                worker.process.kill()
+                worker.process.join(5)
+
+    def _send_loop(self, worker):
+        """Envoie la file du worker dans l'ordre ; après une relance, reprend sur le nouveau pipe"""
+        while True:
+            data = worker.backlog.get()
+            while True:
+                with worker.send_lock:
+                    generation = worker.generation
+                    if self._send(worker, data):
+                        break
+                # Worker mort : attendre sa relance par la surveillance
+                if self._stopping.is_set():
+                    return
+                time.sleep(0.1)
+                if data is not _STOP and worker.generation != generation:
+                    # Relancé entre-temps : l'update, en vol, a été rejouée
+                    break
+            if data is _STOP:
+                return
+
+    def _event_loop(self):
+        """Battements de vie (avec métriques), acquittements et publications pubsub des workers"""
+        closed = set()
+        while not self._stopping.is_set():
+            owners = {}
+            for worker in self.workers:
+                with worker.lock:
+                    if worker.conn is not None and worker.conn not in closed:
+                        owners[worker.conn] = (worker, worker.generation)
+            if not owners:
+                time.sleep(0.2)
+                continue
+            try:
+                ready = wait(list(owners), timeout=0.2)
+            except (OSError, ValueError):
+                # Pipe fermé par une relance pendant l'attente
+                continue
+            for conn in ready:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError, ValueError):
+                    closed.add(conn)
+                    continue
+                worker, generation = owners[conn]
+                if message[0] == 'publish':
+                    broker.publish(*message[1:])
+                    continue
+                with worker.lock:
+                    if worker.generation != generation:
+                        # Lu sur le pipe d'un processus déjà remplacé
+                        continue
+                    if message[0] == 'heartbeat':
+                        worker.ready = True
+                        worker.deadline = time.monotonic() + WORKER_TIMEOUT
+                        metrics.merge_remote(f'worker-{worker.index}', message[1])
+                    elif message[0] == 'ack':
+                        for update_id in message[1]:
+                            worker.inflight.pop(update_id, None)
+
+    async def _watch(self):
+        """Relance les workers morts ou dont la boucle ne répond plus"""
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT)
+            for worker in self.workers:
+                if worker.process.is_alive() and time.monotonic() < worker.deadline:
+                    continue
+                if worker.process.is_alive():
+                    logger.warning(f"⚠️  Worker {worker.index} sans battement depuis {WORKER_TIMEOUT:g} s : relance")
+                else:
+                    logger.warning(f"⚠️  Worker {worker.index} arrêté (code {worker.process.exitcode}) : relance")
+                WORKER_RESTARTS.inc(worker=str(worker.index))
+                await asyncio.to_thread(self._restart, worker)
+
+
+class WorkerLink:
+    """Côté worker : réception des updates, battements de vie, acquittements, relais des publications"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+        # update_id traitées, acquittées au prochain battement
+        self._processed = []
+
+    def send(self, message):
+        with self._lock:
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError):
+                # Superviseur parti : le worker s'arrêtera à la lecture suivante
+                pass
+
+    def ack(self, update_id):
+        """Update traitée (sur la boucle) : le superviseur ne la renverra plus après une relance"""
+        self._processed.append(update_id)
+
+    def _flush_acks(self):
+        if self._processed:
+            update_ids, self._processed = self._processed, []
+            # Journal FIFO : acquittées une fois les écritures de ces updates validées
+            get_journal().append(self._acked, update_ids)
+
+    def _acked(self, conn, update_ids):
+        storage.get_storage().after_commit(lambda: self.send(('ack', update_ids)))
+
+    async def serve(self, feed, pending):
+        """feed(data) sur la boucle pour chaque update reçue, jusqu'à l'ordre d'arrêt
+
+        La lecture du pipe attend tant que les updates transmises à la boucle
+        plus pending() atteignent WORKER_QUEUE_SIZE.
+        """
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        broker.forward = lambda topic, kind, data: self.send(('publish', topic, kind, data))
+
+        # Updates transmises à la boucle mais pas encore données à feed
+        queued = [0]
+        queued_lock = threading.Lock()
+
+        def deliver(data):
+            with queued_lock:
+                queued[0] -= 1
+            feed(data)
+
+        def receive():
+            while True:
+                try:
+                    data = self.conn.recv()
+                except (EOFError, OSError):
+                    data = _STOP
+                if data is _STOP:
+                    loop.call_soon_threadsafe(stopped.set)
+                    return
+                while queued[0] + pending() >= WORKER_QUEUE_SIZE:
+                    time.sleep(0.01)
+                with queued_lock:
+                    queued[0] += 1
+                loop.call_soon_threadsafe(deliver, data)
+
+        async def beat():
+            while True:
+                self._flush_acks()
+                self.send(('heartbeat', metrics.snapshot()))
+                await asyncio.sleep(WORKER_HEARTBEAT)
+
+        threading.Thread(target=receive, name='worker-receive', daemon=True).start()
+        heartbeat = asyncio.create_task(beat())
+        try:
+            await stopped.wait()
+        finally:
+            heartbeat.cancel()
+
+
+def run_worker(index, token, conn):
+    """Point d'entrée d'un worker : handlers du bot sans réception propre"""
+    # Ctrl+C et SIGTERM sont gérés par le superviseur, qui arrête les workers
+    # proprement (updates en file traitées, journal vidé)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(
+        format=f'%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    asyncio.run(_serve(token, WorkerLink(conn)))
+
+
+async def _serve(token, link):
+    from bot_simple import setup_simple_bot
+
+    app = setup_simple_bot(token)
+
+    async def ack(update, context):
+        link.ack(update.update_id)
+
+    # Dernier groupe : exécuté une fois les handlers du bot terminés
+    app.add_handler(TypeHandler(Update, ack), group=max(app.handlers) + 1)
+    async with app:
+        await app.start()
+        await link.serve(lambda data: app.update_queue.put_nowait(Update.de_json(data, app.bot)),
+                         app.update_queue.qsize)
+        # Termine les updates déjà reçues
+        await app.stop()
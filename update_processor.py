@@ -0,0 +1,82 @@
+"""
+Traitement concurrent des updates - Le Bon Mot
+Les updates de clients différents sont traitées en parallèle ; celles d'un
+même client restent sérialisées, dans leur ordre d'arrivée, pour que les
+étapes quantité -> lien -> détails ne se chevauchent jamais.
+"""
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+from telegram.ext import BaseUpdateProcessor
+
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 256))
+
+
+class KeyedLock:
+    """Un asyncio.Lock par clé, supprimé dès que plus personne ne l'utilise"""
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+def update_key(update):
+    """Clé de sérialisation : le client (telegram_id), sinon le chat"""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    return chat.id if chat is not None else None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Concurrence entre clients, ordre strict (FIFO) pour un même client
+
+    Seule l'update en tête de file de chaque client occupe une des
+    max_concurrent_updates places : un client qui envoie une rafale ne fait
+    jamais attendre les autres.
+    """
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates doit être positif")
+        # Le sémaphore de BaseUpdateProcessor est pris avant le verrou du client :
+        # illimité ici, la limite (self.limit) est appliquée après le verrou
+        super().__init__(sys.maxsize)
+        self.limit = max_concurrent_updates
+        self.slots = asyncio.Semaphore(max_concurrent_updates)
+        self.locks = KeyedLock()
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            async with self.slots:
+                await coroutine
+            return
+        async with self.locks.hold(key):
+            async with self.slots:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass